@@ -4,7 +4,7 @@
 # separately needed. There is also some additional functionality to preconfigure the specific recording parameters you
 #  want to record in. 
 
-# You press esc with the playback window active to end recording
+# You press esc with the playback window active to end recording (or Ctrl+C when recording without preview)
 
 # Heading from Open3d provided realsense_recorder.py:
 # ----------------------------------------------------------------------------
@@ -19,15 +19,23 @@
 # pyrealsense2 is required.
 # Please see instructions in https://github.com/IntelRealSense/librealsense/tree/master/wrappers/python
 
-import pyrealsense2 as rs
+try:
+    import pyrealsense2 as rs
+except ImportError:
+    # Only the replay and synthetic frame sources can be used without the RealSense SDK
+    rs = None
 import numpy as np
-import cv2
 from os import makedirs
 from os.path import exists, join, abspath
 import shutil
 import json
 from enum import IntEnum
 import time
+from frame_writer import FrameWriter, ImageFolderSink, FullQueuePolicy
+from frame_container import ContainerSink
+from frame_preview import FramePreview
+from frame_source import FrameSource, Frame, ReplaySource, SyntheticSource, overlaps_recording, run_capture
+from capture_stats import CaptureStats
 
 class Preset(IntEnum):
     Custom = 0
@@ -104,88 +112,51 @@ def get_profiles():
 
     return color_profiles, depth_profiles
 
-if __name__ == "__main__":
-    # Display connected RealSense cameras and available streams/profiles
-    color_profiles, depth_profiles = get_profiles()
-
-    print('Referencing the above options, enter the appropriate values:')
-    w = int(input("Image Width (default: 640): ") or 640)
-    h = int(input("Image Height (default: 480): ") or 480)
-    fps = int(input("Frames Per Second (default: 30): ") or 30)
-    use_auto_exposure = input("Use auto exposure? (y/n) (default: y): ").lower() or 'y'
-    output_folder = input("Enter the output folder path (default: friendly_recorder/): ") or 'friendly_recorder/'
-    # The ".." means from this current running directory
-
-    path_output = output_folder
-    path_depth = join(output_folder, "depth")
-    path_color = join(output_folder, "color")
-    
-    make_clean_folder(path_output)
-    make_clean_folder(path_depth)
-    make_clean_folder(path_color)
+# Live D405 frames, aligned to the color stream
+class RealSenseSource(FrameSource):
+    def __init__(self, w, h, fps):
+        self.fps = fps
 
-    # Create a pipeline
-    pipeline = rs.pipeline()
+        # Create a pipeline
+        self.pipeline = rs.pipeline()
 
-    # Create a config and configure the pipeline to stream different resolutions of color and depth streams
-    config = rs.config()
+        # Create a config and configure the pipeline to stream different resolutions of color and depth streams
+        self.config = rs.config()
 
-    config.enable_stream(rs.stream.depth, w, h, rs.format.z16, fps)
-    config.enable_stream(rs.stream.color, w, h, rs.format.bgr8, fps)
+        self.config.enable_stream(rs.stream.depth, w, h, rs.format.z16, fps)
+        self.config.enable_stream(rs.stream.color, w, h, rs.format.bgr8, fps)
 
-    # Start streaming
-    profile = pipeline.start(config)
-    depth_sensor = profile.get_device().first_depth_sensor()
+        # Start streaming
+        self.profile = self.pipeline.start(self.config)
+        self.depth_sensor = self.profile.get_device().first_depth_sensor()
 
-    if use_auto_exposure == 'y':
-        depth_sensor.set_option(rs.option.enable_auto_exposure, True)
-        print("Auto exposure enabled.")
-    else:
-        depth_sensor.set_option(rs.option.enable_auto_exposure, False)
-        print("Auto exposure disabled.")
+        # Getting the depth sensor's depth scale (see rs-align example for explanation)
+        self.depth_scale = self.depth_sensor.get_depth_scale()
 
-    # Select preset for recording based on user input
-    preset_options = {preset.name: preset.value for preset in Preset}
-    
-    print("Available presets:")
-    
-    for name in preset_options.keys():
-        print(name)
+        # Create an align object
+        align_to = rs.stream.color
         
-    selected_preset_name = input("Select a preset from the above options (default: Default): ") or "Default"
-    
-    selected_preset_value = preset_options.get(selected_preset_name.capitalize(), Preset.HighAccuracy)
-    
-    # Using selected preset for recording
-    depth_sensor.set_option(rs.option.visual_preset, selected_preset_value)
+        self.align = rs.align(align_to)
+        self.color_frame = None
 
-    # Getting the depth sensor's depth scale (see rs-align example for explanation)
-    depth_scale = depth_sensor.get_depth_scale()
-
-    # We will not display the background of objects more than clipping_distance_in_meters meters away
-    clipping_distance_in_meters = float(input("Enter maximum clipping distance in meters (default: 0.500): ") or 0.500)
-    clipping_distance = clipping_distance_in_meters / depth_scale
+    def set_auto_exposure(self, enabled):
+        self.depth_sensor.set_option(rs.option.enable_auto_exposure, enabled)
 
-    # We will not display the background of objects less than the min_distance_in_meters meters away
-    min_distance_in_meters= float(input("Enter minimum clipping distance in meters (default: 0.070): ") or 0.070)
-    min_distance = min_distance_in_meters / depth_scale
+    def set_preset(self, preset_value):
+        self.depth_sensor.set_option(rs.option.visual_preset, preset_value)
+        self.depth_scale = self.depth_sensor.get_depth_scale()
 
-    # Create an align object
-    align_to = rs.stream.color
-    
-    align = rs.align(align_to)
-
-    # Streaming loop
-    frame_count = 0
-    
-    start_time=time.time()
-    try:
+    def read(self):
         while True:
+            wait_start = time.perf_counter()
+
             # Get frameset of color and depth
-            frames = pipeline.wait_for_frames()
+            frames = self.pipeline.wait_for_frames()
+            align_start = time.perf_counter()
 
             # Align the depth frame to color frame
-            aligned_frames = align.process(frames)
+            aligned_frames = self.align.process(frames)
+            align_end = time.perf_counter()
 
             # Get aligned frames
             aligned_depth_frame = aligned_frames.get_depth_frame()
@@ -196,54 +167,175 @@ if __name__ == "__main__":
             if not aligned_depth_frame or not color_frame:
                 continue
 
-            depth_image = np.asanyarray(aligned_depth_frame.get_data())
-            
-            color_image = np.asanyarray(color_frame.get_data())
+            self.color_frame = color_frame
 
-            # Get frame timestamp and format it as a string suitable for filenames
-            timestamp_ms=int(aligned_depth_frame.get_timestamp())
-            timestamp_str=f"{timestamp_ms}"
-            timestamp_domain_str=f"{aligned_depth_frame.get_frame_timestamp_domain()}"
-            
-            cv2.imwrite(f"{path_depth}/{timestamp_str}.png", depth_image)
-            cv2.imwrite(f"{path_color}/{timestamp_str}.jpg", color_image)
+            # Copy out of the librealsense buffers so queued frames do not hold on to the frame pool
+            depth_image = np.asanyarray(aligned_depth_frame.get_data()).copy()
             
-            print(f"Saved color + depth image {frame_count:06d}")
-                
-            frame_count += 1
+            color_image = np.asanyarray(color_frame.get_data()).copy()
 
-            # Remove background - Set pixels further than clipping_distance to grey
-            
-            grey_color = 153
-            
-            # Depth image is 1 channel; color is 3 channels
-            
-            depth_image_3d = np.dstack((depth_image, depth_image, depth_image))
-            
-            bg_removed=np.where((depth_image_3d > clipping_distance )| (depth_image_3d < min_distance),grey_color ,color_image) 
+            # Per-stage timings picked up by run_capture for the capture statistics
+            self.last_timings = {'wait': align_start - wait_start,
+                                 'align': align_end - align_start,
+                                 'convert': time.perf_counter() - align_end}
 
-            # Render images
-            
-            depth_colormap = cv2.applyColorMap(cv2.convertScaleAbs(depth_image, alpha=0.09), cv2.COLORMAP_JET)
-            
-            images = np.hstack((bg_removed, depth_colormap))
-            
-            cv2.namedWindow('Recorder Realsense D405', cv2.WINDOW_AUTOSIZE)
-            
-            cv2.imshow('Recorder Realsense D405', images)
-            
-            key = cv2.waitKey(1)
+            # Get frame timestamp; the image sink formats it as a string suitable for filenames
+            return Frame(aligned_depth_frame.get_frame_number(),
+                         aligned_depth_frame.get_timestamp(),
+                         f"{aligned_depth_frame.get_frame_timestamp_domain()}",
+                         depth_image, color_image)
 
-            # If 'esc' button pressed, escape loop and exit program
+    def stop(self):
+        self.pipeline.stop()
+
+    def save_intrinsics(self, filename, fps, stream_length_usec):
+        save_intrinsic_as_json(filename, self.color_frame, self.profile, self.depth_scale, fps, stream_length_usec)
+
+if __name__ == "__main__":
+    # Frames normally come from the camera; a previous recording or synthetic frames can be used to
+    # test and profile the writer/preview pipeline without one
+    default_source = 'camera' if rs is not None else 'replay'
+    source_type = (input(f"Frame source, camera, replay or synthetic (default: {default_source}): ") or default_source).lower()
+
+    if source_type == 'camera':
+        # Display connected RealSense cameras and available streams/profiles
+        color_profiles, depth_profiles = get_profiles()
+
+        print('Referencing the above options, enter the appropriate values:')
+        w = int(input("Image Width (default: 640): ") or 640)
+        h = int(input("Image Height (default: 480): ") or 480)
+        fps = int(input("Frames Per Second (default: 30): ") or 30)
+        use_auto_exposure = input("Use auto exposure? (y/n) (default: y): ").lower() or 'y'
+    elif source_type == 'replay':
+        replay_folder = input("Enter the recording folder to replay (default: friendly_recorder/): ") or 'friendly_recorder/'
+        replay_speed = float(input("Replay speed, 1 = real time, 0 = as fast as possible (default: 1): ") or 1)
+        source = ReplaySource(replay_folder, speed=replay_speed)
+        source.start()
+        h, w = source.read().depth_image.shape
+        fps = int((source.intrinsics or {}).get("fps", 30))
+    else:
+        w = int(input("Image Width (default: 640): ") or 640)
+        h = int(input("Image Height (default: 480): ") or 480)
+        fps = int(input("Frames Per Second (default: 30): ") or 30)
+        synthetic_frames = int(input("Number of frames to generate (default: 300): ") or 300)
+        source = SyntheticSource(w, h, fps, synthetic_frames)
+
+    # A replay is written next to the recording it plays, never over it
+    default_output = 'friendly_recorder_replay/' if source_type == 'replay' else 'friendly_recorder/'
+    output_folder = input(f"Enter the output folder path (default: {default_output}): ") or default_output
+    if source_type == 'replay' and overlaps_recording(output_folder, replay_folder):
+        print(f"Output folder {output_folder} would overwrite the replayed recording {replay_folder}")
+        exit()
+    # The ".." means from this current running directory
+    # "container" writes raw depth/color into memory-mappable segment files plus a timestamp index (see frame_container.py)
+    recording_format = (input("Recording format, images or container (default: images): ") or 'images').lower()
+    use_container = recording_format == 'container'
+
+    path_output = output_folder
+    path_depth = join(output_folder, "depth")
+    path_color = join(output_folder, "color")
+    path_frames = join(output_folder, "frames")
+    
+    make_clean_folder(path_output)
+    if use_container:
+        make_clean_folder(path_frames)
+    else:
+        make_clean_folder(path_depth)
+        make_clean_folder(path_color)
+
+    if source_type == 'camera':
+        # Start streaming
+        source = RealSenseSource(w, h, fps)
+
+        if use_auto_exposure == 'y':
+            source.set_auto_exposure(True)
+            print("Auto exposure enabled.")
+        else:
+            source.set_auto_exposure(False)
+            print("Auto exposure disabled.")
+
+        # Select preset for recording based on user input
+        preset_options = {preset.name: preset.value for preset in Preset}
+        
+        print("Available presets:")
+        
+        for name in preset_options.keys():
+            print(name)
             
-            if key == 27:
-                cv2.destroyAllWindows()
-                break
-                
+        selected_preset_name = input("Select a preset from the above options (default: Default): ") or "Default"
+        
+        selected_preset_value = preset_options.get(selected_preset_name.capitalize(), Preset.HighAccuracy)
+        
+        # Using selected preset for recording
+        source.set_preset(selected_preset_value)
+
+    depth_scale = source.depth_scale
+
+    # We will not display the background of objects more than clipping_distance_in_meters meters away
+    clipping_distance_in_meters = float(input("Enter maximum clipping distance in meters (default: 0.500): ") or 0.500)
+    clipping_distance = clipping_distance_in_meters / depth_scale
+
+    # We will not display the background of objects less than the min_distance_in_meters meters away
+    min_distance_in_meters= float(input("Enter minimum clipping distance in meters (default: 0.070): ") or 0.070)
+    min_distance = min_distance_in_meters / depth_scale
+
+    # Frames are encoded and written by a background pool so slow PNG compression does not stall capture
+    writer_workers = int(input("Number of frame writer workers (default: 4): ") or 4)
+    use_writer_processes = (input("Use worker processes instead of threads? (y/n) (default: n): ").lower() or 'n') == 'y'
+    writer_queue_size = int(input("Write queue size in frames (default: 90): ") or 90)
+    policy_options = {policy.name.lower(): policy for policy in FullQueuePolicy}
+    selected_policy_name = input("When the write queue is full: Block, DropOldest or DropNewest (default: Block): ") or "Block"
+    writer_policy = policy_options.get(selected_policy_name.lower(), FullQueuePolicy.Block)
+
+    if use_container:
+        # No encoding is needed for the container and its memory maps can not be shared with processes
+        sink = ContainerSink(path_frames, w, h)
+        use_writer_processes = False
+    else:
+        sink = ImageFolderSink(path_depth, path_color)
+
+    # Stage timings and frame-drop detection, summarised in capture_stats.json at shutdown
+    stats = CaptureStats(fps)
+
+    writer = FrameWriter(sink,
+                         workers=writer_workers,
+                         max_queue=writer_queue_size,
+                         policy=writer_policy,
+                         use_processes=use_writer_processes,
+                         stats=stats)
+
+    # The preview renders on its own thread at a capped rate; headless mode turns it off completely
+    # (stop the recording with Ctrl+C instead of esc)
+    show_preview = (input("Show live preview? (y/n) (default: y): ").lower() or 'y') == 'y'
+    preview = None
+    if show_preview:
+        preview_fps = float(input("Preview frames per second (default: 10): ") or 10)
+        preview_scale = float(input("Preview scale (default: 0.5): ") or 0.5)
+        preview = FramePreview(clipping_distance, min_distance, max_fps=preview_fps, scale=preview_scale, stats=stats)
+
+    # Streaming loop
+    frame_count = 0
+    last_frame = None
+    
+    source.start()
+    start_time=time.time()
+    try:
+        frame_count, last_frame = run_capture(source, writer, preview, stats=stats)
+
     finally:
-         pipeline.stop()
+         source.stop()
+         if preview is not None:
+             preview.close()
+         writer_stats = writer.close()
+         print(f"Frames written: {writer_stats['frames_written']}, dropped: {writer_stats['frames_dropped']}, "
+               f"max queue depth: {writer_stats['max_queue_depth']}, mean encode time: {writer_stats['encode_time_mean_ms']:.1f} ms")
          end_time=time.time()
          stream_length_usec=int((end_time-start_time)*1000000)
          #save_intrinsic_as_json(filename, frame, profile, depth_scale, fps, stream_length_usec)
-         save_intrinsic_as_json(join(output_folder,"camera_intrinsic.json"),color_frame ,profile ,depth_scale ,fps ,stream_length_usec)
-         print('Intrinsics saved and the timestamps saved in the following domain:'+timestamp_domain_str)
\ No newline at end of file
+         source.save_intrinsics(join(output_folder,"camera_intrinsic.json"), fps, stream_length_usec)
+         timestamp_domain_str = last_frame.timestamp_domain if last_frame is not None else "unknown"
+         print('Intrinsics saved and the timestamps saved in the following domain:'+timestamp_domain_str)
+         capture_summary = stats.save(join(output_folder,"capture_stats.json"), writer_stats)
+         print(f"Capture statistics saved. Lossless: {capture_summary['lossless']}, "
+               f"missing frames (counter/timestamp): {capture_summary['frames_missing_by_counter']}/{capture_summary['frames_missing_by_timestamp']}, "
+               f"slowest stage: {capture_summary.get('slowest_stage')}")
\ No newline at end of file
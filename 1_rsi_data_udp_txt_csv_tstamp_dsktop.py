@@ -3,11 +3,13 @@
 import socket
 import csv
 import os
-import xml.etree.ElementTree as ET
-from datetime import datetime
 import time
+from rsi_parser import FIELDNAMES, RSIParseError, parse_rsi
+from rsi_log import RSILogWriter
 
-def receive_data():
+# log_format 'csv' writes robot_data.csv row by row, 'binary' writes robot_data.rsilog (see rsi_log.py,
+# convert with: python rsi_log.py robot_data.rsilog robot_data.csv). echo prints every received packet.
+def receive_data(log_format='csv', echo=True):
     # Get the user's desktop path and create the "Experiment Data" folder
     desktop = os.path.join(os.path.expanduser("~"), "Desktop")
     save_dir = os.path.join(desktop, "Experiment Data")
@@ -27,96 +29,57 @@ def receive_data():
         s.bind((IP, PORT))
         print(f"Listening on {IP}:{PORT}")
 
+        if log_format == 'binary':
+            log_file_path = os.path.join(save_dir, "robot_data.rsilog")
+            print(f"Logging to {log_file_path}")
+            with RSILogWriter(log_file_path) as log:
+                receive_loop(s, log.append, echo, on_idle=log.flush, idle_timeout=log.flush_interval)
+            return
+
         # Open the CSV file for writing
         with open(csv_file_path, "w", newline="") as csvfile:
             # Define the CSV writer
-            fieldnames = ['Timestamp', 'X_RIst', 'Y_RIst', 'Z_RIst', 'A_RIst', 'B_RIst', 'C_RIst',
-                          'X_RSol', 'Y_RSol', 'Z_RSol', 'A_RSol', 'B_RSol', 'C_RSol',
-                          'Delay', 'WeldVolt', 'WeldAmps', 'MotorAmps', 'WFS', 'IPOC', 'ErrorNum',
-                          'C11', 'C12', 'C13', 'C14', 'C15', 'C16', 'C17', 'C18', 'C19', 'C110',
-                          'i1', 'i2', 'i3', 'i4']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
 
             # Write the header row to the CSV file
             writer.writeheader()
 
-            while True:
-                # Receive data from the robot (adjust buffer size if necessary)
+            receive_loop(s, writer.writerow, echo)
+
+# Receives datagrams until interrupted and hands every parsed row to write_row. on_idle is called when
+# no datagram arrived for idle_timeout seconds (the binary log flushes its batch then).
+def receive_loop(s, write_row, echo=True, on_idle=None, idle_timeout=1.0):
+    if on_idle is not None:
+        s.settimeout(idle_timeout)
+    try:
+        while True:
+            # Receive data from the robot (adjust buffer size if necessary)
+            try:
                 data, addr = s.recvfrom(1024)
-                data_str = data.decode('utf-8')
-                print(f"Received data from {addr}: {data_str}")
-
-                # Get the current timestamp
-                timestamp = int(time.time() * 1000)
-
-                # Parse the XML message
-                try:
-                    root = ET.fromstring(data_str)
-
-                    # Extract the relevant fields from the XML
-                    RIst = root.find('RIst')
-                    RSol = root.find('RSol')
-                    Delay = root.find('Delay')
-                    WeldVolt = root.find('WeldVolt').text
-                    WeldAmps = root.find('WeldAmps').text
-                    MotorAmps = root.find('MotorAmps').text
-                    WFS = root.find('WFS').text
-                    IPOC = root.find('IPOC').text
-                    ErrorNum = root.find('ErrorNum').text
-                    
-                    # Extract the Tech data (C11 to C110)
-                    Tech = root.find('Tech')
-                    C11 = Tech.attrib.get('C11', '0.0')
-                    C12 = Tech.attrib.get('C12', '0.0')
-                    C13 = Tech.attrib.get('C13', '0.0')
-                    C14 = Tech.attrib.get('C14', '0.0')
-                    C15 = Tech.attrib.get('C15', '0.0')
-                    C16 = Tech.attrib.get('C16', '0.0')
-                    C17 = Tech.attrib.get('C17', '0.0')
-                    C18 = Tech.attrib.get('C18', '0.0')
-                    C19 = Tech.attrib.get('C19', '0.0')
-                    C110 = Tech.attrib.get('C110', '0.0')
+            except socket.timeout:
+                on_idle()
+                continue
+            if echo:
+                print(f"Received data from {addr}: {data.decode('utf-8', errors='replace')}")
 
-                    # Extract the Status data (i1 to i4)
-                    Status = root.find('Status')
-                    i1 = Status.attrib.get('i1', '0')
-                    i2 = Status.attrib.get('i2', '0')
-                    i3 = Status.attrib.get('i3', '0')
-                    i4 = Status.attrib.get('i4', '0')
+            # Get the current timestamp
+            timestamp = int(time.time() * 1000)
 
-                    # Prepare data for writing into the CSV file
-                    row = {
-                        'Timestamp': timestamp,
-                        'X_RIst': RIst.attrib['X'],
-                        'Y_RIst': RIst.attrib['Y'],
-                        'Z_RIst': RIst.attrib['Z'],
-                        'A_RIst': RIst.attrib['A'],
-                        'B_RIst': RIst.attrib['B'],
-                        'C_RIst': RIst.attrib['C'],
-                        'X_RSol': RSol.attrib['X'],
-                        'Y_RSol': RSol.attrib['Y'],
-                        'Z_RSol': RSol.attrib['Z'],
-                        'A_RSol': RSol.attrib['A'],
-                        'B_RSol': RSol.attrib['B'],
-                        'C_RSol': RSol.attrib['C'],
-                        'Delay': Delay.attrib['D'],
-                        'WeldVolt': WeldVolt,
-                        'WeldAmps': WeldAmps,
-                        'MotorAmps': MotorAmps,
-                        'WFS': WFS,
-                        'IPOC': IPOC,
-                        'ErrorNum': ErrorNum,
-                        'C11': C11, 'C12': C12, 'C13': C13, 'C14': C14, 'C15': C15,
-                        'C16': C16, 'C17': C17, 'C18': C18, 'C19': C19, 'C110': C110,
-                        'i1': i1, 'i2': i2, 'i3': i3, 'i4': i4
-                    }
+            # Parse the XML message straight from the received bytes (see rsi_parser.py)
+            try:
+                row = parse_rsi(data, timestamp)
 
-                    # Write the data as a row in the CSV file
-                    writer.writerow(row)
+                # Write the data as a row in the log
+                write_row(row)
 
-                except ET.ParseError as e:
-                    print(f"Failed to parse XML: {e}")
-                    continue
+            except RSIParseError as e:
+                print(f"Failed to parse XML: {e}")
+                continue
+    except KeyboardInterrupt:
+        # Let the log be flushed and closed properly
+        print("Stopped receiving.")
 
 if __name__ == "__main__":
-    receive_data()
+    log_format = (input("Log format, csv or binary (default: csv): ") or 'csv').lower()
+    echo = (input("Print every received packet? (y/n) (default: y): ").lower() or 'y') == 'y'
+    receive_data(log_format, echo)
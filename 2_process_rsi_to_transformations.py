@@ -1,129 +1,164 @@
 import numpy as np
 import pandas as pd
-import math
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+from rsi_log import is_rsi_log, load_rsi_log
+from pose_batch import euler_to_matrices, poses_to_relative_transforms
+from trajectory_store import TRAJECTORY_EXTENSION, open_trajectory_writer
+from stage_profiler import profile_iter, profiled, span
 
-def euler_to_matrix(x, y, z, a, b, c):
-    try:
-        # Convert angles from degrees to radians
-        a = math.radians(a)
-        b = math.radians(b)
-        c = math.radians(c)
-
-        # Calculate rotation matrices for each axis
-        Rx = np.array([[1, 0, 0],
-                       [0, math.cos(a), -math.sin(a)],
-                       [0, math.sin(a), math.cos(a)]])
-        
-        Ry = np.array([[math.cos(b), 0, math.sin(b)],
-                       [0, 1, 0],
-                       [-math.sin(b), 0, math.cos(b)]])
-        
-        Rz = np.array([[math.cos(c), -math.sin(c), 0],
-                       [math.sin(c), math.cos(c), 0],
-                       [0, 0, 1]])
-
-        # Combined rotation matrix
-        R = Rz @ Ry @ Rx
-
-        # Create the transformation matrix
-        T = np.eye(4)
-        T[:3, :3] = R
-        T[:3, 3] = [x, y, z]
-
-        return T
-    except Exception as e:
-        print(f"Error in euler_to_matrix: {e}")
-        return None
-    
-def convert_to_epoch(timestamp):
-    try:
-        # Try to convert directly if it's already in EPOCH time in ms
-        epoch_time = int(timestamp)
-    except ValueError:
-        # If conversion fails, try parsing with and without milliseconds
-        try:
-            dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S.%f')
-        except ValueError:
-            dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-        epoch_time = int(dt.timestamp() * 1000)
-    return epoch_time  
-
-def process_csv(input_csv_path):
+# Columns needed from the robot log, read with fixed dtypes
+REQUIRED_COLUMNS = ['Timestamp', 'X_RIst', 'Y_RIst', 'Z_RIst', 'A_RIst', 'B_RIst', 'C_RIst']
+POSE_COLUMNS = REQUIRED_COLUMNS[1:]
+
+# Rows converted per pass; bounds memory for multi-gigabyte logs
+CHUNK_ROWS = 200000
+
+# The receiver logs either EPOCH time in ms or '%Y-%m-%d %H:%M:%S[.%f]'. The format is detected once,
+# from the first timestamp, and then used for the whole column.
+def detect_timestamp_format(timestamp):
+    return 'epoch' if str(timestamp).strip().lstrip('-').isdigit() else 'datetime'
+
+# Naive (local) times in ms -> EPOCH time in ms, like datetime.timestamp(). The UTC offset only
+# changes on whole hours, so it is looked up once per distinct hour instead of once per row.
+def _local_to_epoch_ms(naive_ms):
+    hours, inverse = np.unique(naive_ms // 3600000, return_inverse=True)
+    offsets = np.array([int((datetime(1970, 1, 1) + timedelta(hours=int(hour))).timestamp() * 1000) - int(hour) * 3600000
+                        for hour in hours], dtype=np.int64)
+    return naive_ms + offsets[inverse.reshape(-1)]
+
+def convert_timestamps(timestamps, timestamp_format):
+    if timestamp_format == 'epoch':
+        return np.asarray(timestamps, dtype=np.int64)
+
+    # Parse with milliseconds first, then the rows logged without them
+    timestamps = pd.Series(timestamps, dtype=str)
+    parsed = pd.to_datetime(timestamps, format='%Y-%m-%d %H:%M:%S.%f', errors='coerce')
+    missing = parsed.isna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(timestamps[missing], format='%Y-%m-%d %H:%M:%S')
+    naive_ms = parsed.to_numpy().astype('datetime64[ms]').astype(np.int64)
+    return _local_to_epoch_ms(naive_ms)
+
+# Yields DataFrames of REQUIRED_COLUMNS, chunk_rows rows at a time
+def read_pose_chunks(input_path, timestamp_format, chunk_rows=CHUNK_ROWS):
+    if is_rsi_log(input_path):
+        # Binary log from the receiver, the records are memory mapped instead of parsed
+        records = load_rsi_log(input_path)
+        for start in range(0, len(records), chunk_rows):
+            chunk = records[start:start + chunk_rows]
+            yield pd.DataFrame({column: chunk[column] for column in REQUIRED_COLUMNS})
+        return
+
+    dtypes = {column: np.float64 for column in POSE_COLUMNS}
+    dtypes['Timestamp'] = np.int64 if timestamp_format == 'epoch' else str
+    yield from pd.read_csv(input_path, usecols=REQUIRED_COLUMNS, dtype=dtypes, chunksize=chunk_rows)
+
+def read_columns(input_path):
+    if is_rsi_log(input_path):
+        return list(load_rsi_log(input_path).dtype.names)
+    return list(pd.read_csv(input_path, nrows=0).columns)
+
+def first_timestamp(input_path):
+    if is_rsi_log(input_path):
+        records = load_rsi_log(input_path)
+        return records['Timestamp'][0] if len(records) else None
+    first = pd.read_csv(input_path, usecols=['Timestamp'], dtype=str, nrows=1)
+    return first['Timestamp'].iloc[0] if len(first) else None
+
+# Writes the transformations of input_csv_path to output_path (asked for when not given) and returns
+# the number written, or None on an error. on_chunk(timestamps, relative_T) is called with every chunk
+# written, to keep the transformations in memory as well.
+@profiled('process_csv')
+def process_csv(input_csv_path, output_path=None, on_chunk=None):
     if not os.path.exists(input_csv_path):
         print(f"Error: The file {input_csv_path} does not exist.")
         return
     
     try:
-        # Read the CSV file
-        df = pd.read_csv(input_csv_path)
+        with span('load'):
+            columns = read_columns(input_csv_path)
     except Exception as e:
         print(f"Error reading CSV file: {e}")
         return
 
     # Check if required columns are present
-    required_columns = ['Timestamp', 'X_RIst', 'Y_RIst', 'Z_RIst', 'A_RIst', 'B_RIst', 'C_RIst']
-    if not all(column in df.columns for column in required_columns):
-        print(f"Error: Input CSV must contain columns: {required_columns}")
+    if not all(column in columns for column in REQUIRED_COLUMNS):
+        print(f"Error: Input CSV must contain columns: {REQUIRED_COLUMNS}")
         return
 
-    # Prepare list to store transformation matrices with timestamps
-    transformations = []
-
     try:
-        # Get the initial transformation matrix (identity matrix)
-        initial_row = df.iloc[0]
-        initial_T = euler_to_matrix(initial_row['X_RIst'], initial_row['Y_RIst'], initial_row['Z_RIst'],
-                                    initial_row['A_RIst'], initial_row['B_RIst'], initial_row['C_RIst'])
-        
-        if initial_T is None:
-            print("Error: Failed to calculate the initial transformation matrix.")
-            return
-        
-        for index, row in df.iterrows():
-            timestamp_str = row['Timestamp']
-            timestamp = convert_to_epoch(timestamp_str)
-            x = row['X_RIst']
-            y = row['Y_RIst']
-            z = row['Z_RIst']
-            a = row['A_RIst']
-            b = row['B_RIst']
-            c = row['C_RIst']
-
-            # Calculate the transformation matrix relative to the initial position
-            current_T = euler_to_matrix(x, y, z, a, b, c)
-            
-            if current_T is None:
-                print(f"Error: Failed to calculate transformation matrix for row {index}.")
-                continue
-            
-            relative_T = np.linalg.inv(initial_T) @ current_T
-            
-            # Append timestamp and flattened transformation matrix to the list of transformations
-            transformations.append([timestamp] + relative_T.flatten().tolist())
-        
+        with span('load'):
+            timestamp = first_timestamp(input_csv_path)
     except Exception as e:
-        print(f"Error processing CSV data: {e}")
+        print(f"Error reading CSV file: {e}")
         return
+    if timestamp is None:
+        print("Error: The input file contains no data.")
+        return
+    timestamp_format = detect_timestamp_format(timestamp)
 
-    try:
-        # Save the transformation matrices with timestamps to a new CSV file
-        output_csv_path = input("Enter the path where you would like to save the transformation matrices CSV: ")
+    # The transformations are written chunk by chunk, so the output path is needed up front
+    if output_path is None:
+        output_path = input("Enter the path where you would like to save the transformation matrices "
+                            f"({TRAJECTORY_EXTENSION} for the binary trajectory store, .csv for text): ")
 
-        if os.path.exists(output_csv_path):
-            overwrite = input(f"The file {output_csv_path} already exists. Do you want to overwrite it? (yes/no): ").strip().lower()
+        if os.path.exists(output_path):
+            overwrite = input(f"The file {output_path} already exists. Do you want to overwrite it? (yes/no): ").strip().lower()
             if overwrite != 'yes':
                 print("Operation cancelled by user.")
                 return
-        
-        output_df = pd.DataFrame(transformations)
-        
-        output_df.to_csv(output_csv_path, index=False)
-        
+
+    # Chunks go to a temporary file that only replaces output_path once every chunk was written, so a run
+    # that fails halfway never leaves a partial trajectory the next stage would read
+    root, extension = os.path.splitext(output_path)
+    partial_path = f"{root}.partial{extension}"
+    writer = None
+    complete = False
+    try:
+        for chunk in profile_iter('parse', read_pose_chunks(input_csv_path, timestamp_format)):
+            # Convert the whole X/Y/Z/A/B/C block at once: (N,4,4) poses, each relative to the first one.
+            # The initial pose is inverted once, in closed form, instead of np.linalg.inv() per row.
+            poses = chunk[POSE_COLUMNS].to_numpy(dtype=np.float64)
+            if writer is None:
+                initial_T = euler_to_matrices(*poses[0])
+                if not np.isfinite(initial_T).all():
+                    print("Error: Failed to calculate the initial transformation matrix.")
+                    return
+                try:
+                    writer = open_trajectory_writer(partial_path, reference_T=initial_T, reference_pose=poses[0],
+                                                    source=os.path.basename(input_csv_path))
+                except Exception as e:
+                    print(f"Error saving output file: {e}")
+                    return
+            with span('convert'):
+                relative_T = poses_to_relative_transforms(poses, initial_T)
+                timestamps = convert_timestamps(chunk['Timestamp'].to_numpy(), timestamp_format)
+            try:
+                with span('write'):
+                    writer.append(timestamps, relative_T)
+            except Exception as e:
+                print(f"Error saving output file: {e}")
+                return
+            if on_chunk is not None:
+                on_chunk(timestamps, relative_T)
+        complete = writer is not None
+
     except Exception as e:
-        print(f"Error saving output CSV file: {e}")
+        print(f"Error processing CSV data: {e}")
+        return
+    finally:
+        if writer is not None:
+            with span('write'):
+                writer.close()
+        if complete:
+            os.replace(partial_path, output_path)
+        elif os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    print(f"Saved {writer.count} transformation matrices to {output_path}")
+    return writer.count
 
 if __name__ == "__main__":
-    input_csv_path = input("Enter the path to the CSV file containing X,Y,Z,A,B,C data: ")
+    input_csv_path = input("Enter the path to the CSV file (or .rsilog binary log) containing X,Y,Z,A,B,C data: ")
     process_csv(input_csv_path)
\ No newline at end of file
@@ -1,169 +1,235 @@
-import csv
 import numpy as np
+import os
+import time
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from datetime import datetime
-from tqdm import tqdm
-from scipy.spatial.transform import Rotation as R
 import tkinter as tk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from rsi_tail import PoseHistory, open_tail
+from stage_profiler import span
+from trajectory_store import load_trajectory
+from trajectory_render import SCALING_FACTOR, arrow_segments, calculate_xyzabc, export_animation, frame_text
 
-# Function to read CSV file and parse transformation matrices and timestamps
-def read_csv(file_path):
-    timestamps = []
-    matrices = []
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file)
-        for row in reader:
-            timestamp = int(row[0])
-            matrix = np.array(row[1:], dtype=float).reshape(4, 4)
-            timestamps.append(timestamp)
-            matrices.append(matrix)
-    return timestamps, matrices
-
-# Function to apply transformation matrix to a vector
-def transform_vector(matrix, vector):
-    rotation_matrix = matrix[:3, :3]  # Extract rotation part
-    translation_vector = matrix[:3, 3]  # Extract translation part
-    transformed_vector = rotation_matrix @ vector + translation_vector
-    return transformed_vector
-
-# Function to calculate XYZABC values from a transformation matrix
-def calculate_xyzabc(matrix):
-    translation = matrix[:3, 3]
-    rotation_matrix = matrix[:3, :3]
-    r = R.from_matrix(rotation_matrix)
-    euler_angles = r.as_euler('xyz', degrees=True)
-    return np.concatenate((translation, euler_angles))
-
-# Function to update the plot for each frame of the animation
+# Function to update the animated artists for a frame; only their data changes
 def update(frame):
-    ax.cla()  # Clear the previous frame
-    
-    # Apply the transformation matrix to get new root and direction (relative to initial position)
-    transformed_vector = transform_vector(matrices[frame], initial_vector)
-    
-    # Calculate XYZABC values and format them to 3 decimal places
-    xyzabc_values = calculate_xyzabc(matrices[frame])
-    xyzabc_formatted = np.round(xyzabc_values, 3)
-    
-    # Plot the original and transformed vectors
-    ax.quiver(0, 0, 0, initial_vector[0], initial_vector[1], initial_vector[2], color='blue', label='Initial Vector')
-    
-    # Plot the transformed vector starting from its translation position
-    ax.quiver(xyzabc_values[0], xyzabc_values[1], xyzabc_values[2],
-              transformed_vector[0] - xyzabc_values[0],
-              transformed_vector[1] - xyzabc_values[1],
-              transformed_vector[2] - xyzabc_values[2],
-              color='red', label='Transformed Vector')
-    
+    transformed_arrow.set_segments(arrows[frame])
+
     # Update the timestamp and frame count display
-    timestamp_str = datetime.fromtimestamp(timestamps[frame] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-    text_time.set_text(f'Time: {timestamp_str} (EPOCH: {timestamps[frame]})\nFrame: {frame + 1}/{len(timestamps)}\nXYZABC: {xyzabc_formatted}')
-    
-    # Set static axis limits
-    ax.set_xlim(-max_extent * 1.5, max_extent * 1.5)
-    ax.set_ylim(-max_extent * 1.5, max_extent * 1.5)
-    ax.set_zlim(-max_extent * 1.5, max_extent * 1.5)
+    text_time.set_text(frame_text(int(timestamps[frame]), frame, len(timestamps), xyzabc_formatted[frame]))
 
-# Function to create and save the animation
+# Function to load the trajectory, precompute every frame and create the artists once
 def create_animation():
     global timestamps, matrices, fig, ax, text_time, initial_vector, max_extent
-    
-    timestamps, matrices = read_csv(csv_file_path)
-    
+    global xyzabc_formatted, arrows, transformed_arrow, animated_artists
+
+    # Binary trajectory (memory mapped) or transformation CSV, both sorted by timestamp
+    with span('load'):
+        timestamps, matrices, _ = load_trajectory(trajectory_path)
+        matrices = np.asarray(matrices)
+
     fig = plt.figure()
     ax = fig.add_subplot(111, projection='3d')
-    
-    scaling_factor = 500.0  # Increase this value to scale up the vector magnitude
-    initial_vector = np.array([1, 0, 0]) * scaling_factor  # Initial vector along x-axis
-    
+
+    initial_vector = np.array([1, 0, 0]) * SCALING_FACTOR  # Initial vector along x-axis
+
+    # XYZABC values (3 decimal places) and the transformed vector of every frame, computed in one batch
+    with span('convert'):
+        xyzabc_values = calculate_xyzabc(matrices)
+        xyzabc_formatted = np.round(xyzabc_values, 3)
+        transformed_vectors = matrices[:, :3, :3] @ initial_vector
+        arrows = arrow_segments(xyzabc_values[:, :3], transformed_vectors)
+
+    # Plot the original vector once, and the transformed vector starting from its translation position
+    ax.quiver(0, 0, 0, initial_vector[0], initial_vector[1], initial_vector[2], color='blue', label='Initial Vector')
+    transformed_arrow = ax.quiver(0, 0, 0, 1, 0, 0, color='red', label='Transformed Vector')
     text_time = plt.figtext(0.02, 0.9, '', fontsize=10)
-    
-    # Calculate axis limits based on translations in matrices
-    translations = [matrix[:3, 3] for matrix in matrices]
-    global max_extent 
-    max_extent = np.max(np.abs(translations))
+
+    # The animated artists are left out of full redraws and drawn over the cached background instead
+    animated_artists = [transformed_arrow, text_time]
+    for artist in animated_artists:
+        artist.set_animated(True)
+
+    # Set static axis limits based on translations in matrices
+    max_extent = np.max(np.abs(matrices[:, :3, 3])) if len(matrices) else 1.0
+    ax.set_xlim(-max_extent * 1.5, max_extent * 1.5)
+    ax.set_ylim(-max_extent * 1.5, max_extent * 1.5)
+    ax.set_zlim(-max_extent * 1.5, max_extent * 1.5)
+    update(0)
+
+def draw_animated_artists():
+    for artist in animated_artists:
+        if hasattr(artist, 'do_3d_projection'):
+            artist.do_3d_projection()
+        fig.draw_artist(artist)
+
+# Full redraws (first show, resize, rotating the view) cache the static background for blitting
+def on_draw(event):
+    global background
+    background = canvas.copy_from_bbox(fig.bbox)
+    draw_animated_artists()
+
+def show_frame(frame):
+    update(frame)
+    if background is None:
+        canvas.draw_idle()
+        return
+    canvas.restore_region(background)
+    draw_animated_artists()
+    canvas.blit(fig.bbox)
 
 def start_animation():
     global ani_running
-    ani_running = True
-    ani.event_source.start()
+    if not ani_running:
+        ani_running = True
+        play_next_frame()
 
 def stop_animation():
     global ani_running
     ani_running = False
-    ani.event_source.stop()
+
+def play_next_frame():
+    global ani_running
+    if not ani_running:
+        return
+    if current_frame >= len(timestamps) - 1:
+        ani_running = False
+        return
+    slider.set(current_frame + 1)  # Moves the slider, which shows the frame
+    root.after(frame_interval_ms, play_next_frame)
 
 def update_frame(val):
     global current_frame
-    
+
     current_frame = int(val)
 
 def on_slider_change(val):
    update_frame(val)
-   update(current_frame)
-   canvas.draw_idle()  # Redraw canvas after updating frame
+   show_frame(current_frame)
+
+# Live mode: shows the newest poses of the log the receiver is writing. New rows are read by a timer at
+# most max_fps times per second, and only the last history positions are kept and drawn.
+def create_live_view(log_path, history=5000, max_fps=10):
+    global live_tail, live_history, live_fig, live_ax, live_path, live_position, live_arrow, live_text, live_extent
+
+    live_tail = open_tail(log_path, max_rows=history)
+    live_history = PoseHistory(history)
+
+    live_fig = plt.figure()
+    live_ax = live_fig.add_subplot(111, projection='3d')
+    live_path, = live_ax.plot([], [], [], color='gray', linewidth=1, label='Recent Path')
+    live_position, = live_ax.plot([], [], [], 'o', color='red')
+    live_arrow = live_ax.quiver(0, 0, 0, 1, 0, 0, color='red', label='Transformed Vector')
+    live_text = live_fig.text(0.02, 0.9, f'Waiting for data in {log_path}', fontsize=10)
+
+    live_extent = SCALING_FACTOR
+    set_live_limits(live_extent)
+
+    timer = live_fig.canvas.new_timer(interval=int(1000 / max_fps))
+    timer.add_callback(poll_live_view)
+    timer.start()
+    return timer
+
+def set_live_limits(extent):
+    live_ax.set_xlim(-extent * 1.5, extent * 1.5)
+    live_ax.set_ylim(-extent * 1.5, extent * 1.5)
+    live_ax.set_zlim(-extent * 1.5, extent * 1.5)
+
+# Reads the rows appended since the last tick; nothing is redrawn while no new rows arrive
+def poll_live_view():
+    global live_extent
+
+    timestamps, matrices = live_tail.poll()
+    if len(timestamps) == 0:
+        return
+    live_history.append(matrices[:, :3, 3])
+    positions = live_history.latest()
+    live_path.set_data_3d(positions[:, 0], positions[:, 1], positions[:, 2])
+
+    latest = matrices[-1:]
+    xyzabc_values = calculate_xyzabc(latest)
+    live_position.set_data_3d(xyzabc_values[:, 0], xyzabc_values[:, 1], xyzabc_values[:, 2])
+    live_arrow.set_segments(arrow_segments(xyzabc_values[:, :3], latest[:, :3, :3] @ initial_vector)[0])
+    live_text.set_text(frame_text(int(timestamps[-1]), live_tail.rows_read - 1, live_tail.rows_read,
+                                  np.round(xyzabc_values[0], 3)))
+
+    # The limits only grow, in steps, so the view does not jump on every tick
+    extent = np.max(np.abs(xyzabc_values[0, :3]))
+    if extent > live_extent:
+        live_extent = max(extent, live_extent * 2)
+        set_live_limits(live_extent)
+    live_fig.canvas.draw_idle()
 
 # Main function to create the GUI and run the animation
 if __name__ == "__main__":
-    
-   csv_file_path ='transformations.csv'
-   output_file_path ='animation.gif' 
-   
-   create_animation()
-   
-   root=tk.Tk()
-   root.title("Animation GUI")
-   
-   canvas=FigureCanvasTkAgg(fig, master=root) 
-   canvas.draw()
-   canvas.get_tk_widget().pack(side=tk.TOP,
-                                fill=tk.BOTH,
-                                expand=1)
-   
-   toolbar_frame=tk.Frame(root)
-   toolbar_frame.pack(side=tk.BOTTOM,
-                      fill=tk.X)
-   
-   play_button=tk.Button(master=toolbar_frame,
-                         text="Play",
-                         command=start_animation)
-   
-   play_button.pack(side=tk.LEFT)
-   
-   pause_button=tk.Button(master=toolbar_frame,
-                          text="Pause",
-                          command=stop_animation)
-   
-   pause_button.pack(side=tk.LEFT)
-
-   slider=tk.Scale(master=toolbar_frame,
-                   from_=0,
-                   to=len(timestamps)-1,
-                   orient=tk.HORIZONTAL,
-                   length=300,
-                   command=on_slider_change)
-
-   slider.pack(side=tk.LEFT)
-
-   current_frame = 0
-   
-   ani_running = False
-   
-   def update_with_slider(frame):
-       if not ani_running:
-           return
-
-       slider.set(frame)  # Update slider position based on current frame in animation
-
-       update(frame)
-
-       canvas.draw_idle()
-
-   ani=FuncAnimation(fig,
-                     update_with_slider,
-                     frames=len(timestamps),
-                     repeat=False)
-
-root.mainloop()
\ No newline at end of file
+
+   trajectory_path ='transformations.traj' if os.path.exists('transformations.traj') else 'transformations.csv'
+   output_file_path ='animation.gif'
+   frame_interval_ms = 20
+
+   mode = (input("View the animation, export it without a display or follow a running log? (view/export/live, default: view): ") or 'view').lower()
+   if mode == 'live':
+       # Follows robot_data.csv / robot_data.rsilog while 1_rsi_data_udp_txt_csv_tstamp_dsktop.py is writing it
+       log_path = os.path.join(os.path.expanduser("~"), "Desktop", "Experiment Data", "robot_data.csv")
+       log_path = input(f"Log being written (default: {log_path}): ") or log_path
+       history = int(input("Number of recent poses to show (default: 5000): ") or 5000)
+       max_fps = float(input("Maximum redraws per second (default: 10): ") or 10)
+       while not os.path.exists(log_path):
+           print(f"Waiting for {log_path}")
+           time.sleep(1)
+       initial_vector = np.array([1, 0, 0]) * SCALING_FACTOR
+       timer = create_live_view(log_path, history, max_fps)
+       plt.show()
+       live_tail.close()
+   elif mode == 'export':
+       # Headless: frames are rendered offscreen by a process pool and written in order
+       output_file_path = input(f"Output file, .gif or .mp4 (default: {output_file_path}): ") or output_file_path
+       stride = int(input("Render every Nth pose (default: 10): ") or 10)
+       width = int(input("Width in pixels (default: 640): ") or 640)
+       height = int(input("Height in pixels (default: 480): ") or 480)
+       fps = float(input("Frames per second (default: 30): ") or 30)
+       workers = int(input(f"Worker processes (default: {os.cpu_count()}): ") or os.cpu_count())
+       count = export_animation(trajectory_path, output_file_path, stride, width=width, height=height, fps=fps, workers=workers)
+       print(f"Wrote {count} frames to {output_file_path}")
+   else:
+       create_animation()
+
+       root=tk.Tk()
+       root.title("Animation GUI")
+
+       canvas=FigureCanvasTkAgg(fig, master=root)
+       background = None
+       canvas.mpl_connect('draw_event', on_draw)
+       canvas.draw()
+       canvas.get_tk_widget().pack(side=tk.TOP,
+                                    fill=tk.BOTH,
+                                    expand=1)
+
+       toolbar_frame=tk.Frame(root)
+       toolbar_frame.pack(side=tk.BOTTOM,
+                          fill=tk.X)
+
+       play_button=tk.Button(master=toolbar_frame,
+                             text="Play",
+                             command=start_animation)
+
+       play_button.pack(side=tk.LEFT)
+
+       pause_button=tk.Button(master=toolbar_frame,
+                              text="Pause",
+                              command=stop_animation)
+
+       pause_button.pack(side=tk.LEFT)
+
+       slider=tk.Scale(master=toolbar_frame,
+                       from_=0,
+                       to=len(timestamps)-1,
+                       orient=tk.HORIZONTAL,
+                       length=300,
+                       command=on_slider_change)
+
+       slider.pack(side=tk.LEFT)
+
+       current_frame = 0
+
+       ani_running = False
+
+       root.mainloop()
@@ -1,92 +1,157 @@
-import pyrealsense2 as rs
 import numpy as np
-import open3d as o3d
 import os
 import json
-
-# Function to find the closest transformation matrix based on EPOCH time
-def find_closest_transformation(epoch_time, transformations):
-    closest_time = min(transformations.keys(), key=lambda k: abs(k - epoch_time))
-    return transformations[closest_time]
-
-# User inputs for file paths
-depth_folder = input("Enter the path to the folder containing depth frames: ")
-color_folder = input("Enter the path to the folder containing color frames: ")
-transformation_csv = input("Enter the path to the CSV file containing transformation matrices: ")
-intrinsic_json_path = input("Enter the path to the intrinsic.json file: ")
-output_point_cloud_path = input("Enter the path where you would like to save the combined point cloud: ")
-
-# Load transformation matrices from CSV file using numpy
-transformations_data = np.genfromtxt(transformation_csv, delimiter=',', skip_header=1)
-transformations = {}
-for row in transformations_data:
-    epoch_time = int(row[0])
-    matrix = row[1:].reshape(4, 4)
-    transformations[epoch_time] = matrix
-
-# Load camera intrinsics from JSON file
-with open(intrinsic_json_path, 'r') as f:
-    intrinsics_data = json.load(f)
-
-pinhole_camera_intrinsic = o3d.camera.PinholeCameraIntrinsic(
-    width=intrinsics_data['width'],
-    height=intrinsics_data['height'],
-    fx=intrinsics_data['intrinsic_matrix'][0],
-    fy=intrinsics_data['intrinsic_matrix'][4],
-    cx=intrinsics_data['intrinsic_matrix'][6],
-    cy=intrinsics_data['intrinsic_matrix'][7]
-)
-
-# Process each frame pair
-all_transformed_points_list = []
-
-for filename in os.listdir(depth_folder):
-    if filename.endswith(".png"):
-        # Extract EPOCH time from filename
-        epoch_time = int(os.path.splitext(filename)[0])
-
-        # Load depth and color images
-        depth_image_path = os.path.join(depth_folder, filename)
-        color_image_path = os.path.join(color_folder, f"{epoch_time}.jpg")
-
-        if not os.path.exists(color_image_path):
-            continue
-
-        depth_image_o3d = o3d.io.read_image(depth_image_path)
-        color_image_o3d = o3d.io.read_image(color_image_path)
-
-        rgbd_image_o3d = o3d.geometry.RGBDImage.create_from_color_and_depth(
-            color=color_image_o3d,
-            depth=depth_image_o3d,
-            convert_rgb_to_intensity=False,
-            depth_scale=1.0,
-            depth_trunc=1000.0,
-            stride=1
-        )
-
-        # Create point cloud from RGBD image
-        pcd = o3d.geometry.PointCloud.create_from_rgbd_image(
-            rgbd_image_o3d,
-            pinhole_camera_intrinsic
-        )
-
-        # Find the closest transformation matrix based on EPOCH time
-        transformation_matrix = find_closest_transformation(epoch_time, transformations)
-
-        # Apply transformation matrix to point cloud
-        pcd.transform(transformation_matrix)
-
-        # Accumulate transformed points
-        all_transformed_points_list.append(pcd)
-
-# Combine all transformed point clouds into one point cloud for visualization or further processing
-if all_transformed_points_list:
-    combined_pcd = all_transformed_points_list[0]
-    for pcd in all_transformed_points_list[1:]:
-        combined_pcd += pcd
-
-    # Optional: visualize the combined point cloud using Open3D's visualization tools
-    o3d.visualization.draw_geometries([combined_pcd])
-
-# Save combined point cloud to a file (optional)
-o3d.io.write_point_cloud(output_point_cloud_path, combined_pcd)
\ No newline at end of file
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from frame_container import FrameContainer, is_container
+from frame_projection import init_worker, project_chunk
+from trajectory_store import load_trajectory
+from pose_index import PoseIndex
+from voxel_fusion import VoxelGrid
+from ply_stream import SplitPlyWriter
+from keyframes import select_keyframes
+from stage_profiler import profile_iter, profiled, span
+
+# (epoch_time, depth image path, color image path) of every frame pair in an image folder recording
+def list_frame_files(depth_folder, color_folder):
+    frames = []
+    for filename in os.listdir(depth_folder):
+        if filename.endswith(".png"):
+            # Extract EPOCH time from filename
+            epoch_time = int(os.path.splitext(filename)[0])
+
+            # Load depth and color images
+            depth_image_path = os.path.join(depth_folder, filename)
+            color_image_path = os.path.join(color_folder, f"{epoch_time}.jpg")
+
+            if not os.path.exists(color_image_path):
+                continue
+
+            frames.append((epoch_time, depth_image_path, color_image_path))
+    return sorted(frames)
+
+# (epoch_time, source) of every frame pair in timestamp order; sources are read by frame_projection.py
+def list_frames(depth_folder, color_folder):
+    if is_container(depth_folder):
+        # Segmented container from the recorder: the index is already sorted by timestamp
+        timestamps = FrameContainer(depth_folder).timestamps
+        return [(int(epoch_time), ('container', depth_folder, i)) for i, epoch_time in enumerate(timestamps)]
+    return [(epoch_time, ('files', depth_path, color_path))
+            for epoch_time, depth_path, color_path in list_frame_files(depth_folder, color_folder)]
+
+# Yields (epoch_time, points, colors) for every frame, in timestamp order. Frames are handed to the
+# workers chunk_size at a time and at most two chunks per worker are in flight, so results stream back
+# without piling up in memory. Depth outside [min_distance, max_distance] meters is dropped. With a
+# cache_folder, back-projected frames are reused from earlier runs (see frame_cache.py).
+def project_frames(frames, frame_poses, intrinsics_data, workers=None, chunk_size=8, min_distance=0.070, max_distance=0.500,
+                   cache_folder=None, cache_bytes=10 * 1024 ** 3):
+    worker_settings = (intrinsics_data, min_distance, max_distance, 1, cache_folder, cache_bytes)
+    tasks = [(epoch_time, source, pose) for (epoch_time, source), pose in zip(frames, frame_poses)]
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+    if workers == 1:
+        init_worker(*worker_settings)
+        for chunk in chunks:
+            yield from project_chunk(chunk)
+        return
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=worker_settings) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(project_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+# Registers the frames of a recording against the robot poses of pose_index, projects and fuses them
+# and writes the cloud to output_point_cloud_path (split by tile_size or max_vertices).
+# Returns (PLY paths written, number of points).
+@profiled('build_point_cloud')
+def build_point_cloud(depth_folder, color_folder, pose_index, intrinsics_data, output_point_cloud_path,
+                      interpolate_poses=True, workers=None, chunk_size=8, min_translation=0.0, min_rotation=0.0,
+                      max_fps=0.0, min_distance=0.070, max_distance=0.500, voxel_size=1.0, cache_folder=None,
+                      cache_bytes=10 * 1024 ** 3, tile_size=0.0, max_vertices=0):
+    # Register all frames against the robot poses in one batch lookup
+    with span('register'):
+        frames = list_frames(depth_folder, color_folder)
+        frame_times = np.array([epoch_time for epoch_time, _ in frames], dtype=np.int64)
+        frame_poses = pose_index.lookup(frame_times, interpolate_poses)
+
+        # Keep only the frames where the camera moved, dwell time adds nothing to the cloud
+        keep = select_keyframes(frame_times, frame_poses, min_translation, min_rotation, max_fps)
+    print(f"Keeping {int(keep.sum())} of {len(frames)} frames ({len(frames) - int(keep.sum())} skipped)")
+    frames = [frame for frame, kept in zip(frames, keep) if kept]
+    frame_poses = frame_poses[keep]
+
+    # Process the frame pairs in parallel. With a voxel size every frame is fused into the voxel grid as
+    # it arrives, so memory is bounded by the size of the scene instead of the number of frames. Without
+    # one, every frame is streamed straight to the PLY file(s), so the cloud can be bigger than RAM.
+    grid = VoxelGrid(voxel_size) if voxel_size > 0 else None
+    writer = SplitPlyWriter(output_point_cloud_path, tile_size, max_vertices)
+    projected = project_frames(frames, frame_poses, intrinsics_data, workers, chunk_size, min_distance, max_distance,
+                               cache_folder, cache_bytes)
+    for epoch_time, points, colors in profile_iter('project', projected):
+        if grid is not None:
+            with span('fuse'):
+                grid.integrate(points, colors)
+        else:
+            with span('write'):
+                writer.write(points, colors)
+
+    if grid is not None:
+        with span('fuse'):
+            points, colors, _ = grid.to_arrays()
+        print(f"Fused {grid.points_integrated} points from {len(frames)} frames into {len(points)} voxels")
+        with span('write'):
+            for start in range(0, len(points), 1000000):
+                writer.write(points[start:start + 1000000], colors[start:start + 1000000])
+    with span('write'):
+        output_paths = writer.close()
+    print(f"Saved {writer.count} points to {', '.join(output_paths)}")
+    return output_paths, writer.count
+
+if __name__ == "__main__":
+    # User inputs for file paths
+    depth_folder = input("Enter the path to the folder containing depth frames (or the recorder's frames/ container folder): ")
+    color_folder = depth_folder if is_container(depth_folder) else input("Enter the path to the folder containing color frames: ")
+    transformation_path = input("Enter the path to the transformation matrices (.traj or CSV file): ")
+    intrinsic_json_path = input("Enter the path to the intrinsic.json file: ")
+    output_point_cloud_path = input("Enter the path where you would like to save the combined point cloud: ")
+    clock_offset_ms = float(input("Clock offset in ms added to the frame timestamps to get robot time (default: 0): ") or 0)
+    interpolate_poses = (input("Interpolate the robot pose at each frame time instead of using the nearest pose? (y/n, default: y): ") or 'y').lower() == 'y'
+    workers = int(input(f"Worker processes (default: {os.cpu_count()}): ") or os.cpu_count())
+    chunk_size = int(input("Frames per worker task (default: 8): ") or 8)
+    min_translation = float(input("Skip frames until the camera moved this many mm (default: 0, keep every frame): ") or 0)
+    min_rotation = float(input("Or until it turned this many degrees (default: 0): ") or 0)
+    max_fps = float(input("Maximum frames per second to keep (default: 0, no limit): ") or 0)
+    max_distance = float(input("Enter maximum clipping distance in meters (default: 0.500): ") or 0.500)
+    min_distance = float(input("Enter minimum clipping distance in meters (default: 0.070): ") or 0.070)
+    voxel_size = float(input("Voxel size in mm for fusing the frames (default: 1.0, 0 keeps every point): ") or 1.0)
+    cache_folder = input("Cache folder for back-projected frames, speeds up re-runs (default: ply_cache, none to disable): ") or 'ply_cache'
+    cache_folder = None if cache_folder.lower() == 'none' else cache_folder
+    cache_gb = float(input("Cache size limit in GB (default: 10): ") or 10) if cache_folder else 0
+    tile_size = float(input("Split the output into cubic tiles of this size in mm (default: 0, no tiles): ") or 0)
+    max_vertices = 0 if tile_size else int(input("Split the output into files of at most this many points (default: 0, one file): ") or 0)
+    show_cloud = (input("Show the point cloud when finished? (y/n, default: n): ") or 'n').lower() == 'y'
+
+    with span('load'):
+        # Load transformation matrices (binary trajectories are memory mapped, CSVs parsed once)
+        trajectory = load_trajectory(transformation_path)
+        pose_index = PoseIndex.from_trajectory(trajectory, clock_offset_ms)
+
+        # Load camera intrinsics (and the depth scale) from JSON file
+        with open(intrinsic_json_path, 'r') as f:
+            intrinsics_data = json.load(f)
+
+    output_paths, point_count = build_point_cloud(depth_folder, color_folder, pose_index, intrinsics_data,
+                                                  output_point_cloud_path, interpolate_poses, workers, chunk_size,
+                                                  min_translation, min_rotation, max_fps, min_distance, max_distance,
+                                                  voxel_size, cache_folder, int(cache_gb * 1024 ** 3), tile_size,
+                                                  max_vertices)
+
+    # Optional: visualize the point cloud using Open3D's visualization tools (needs a display)
+    if show_cloud and point_count:
+        import open3d as o3d
+        o3d.visualization.draw_geometries([o3d.io.read_point_cloud(path) for path in output_paths])
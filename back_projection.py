@@ -0,0 +1,68 @@
+# Numpy back-projection of depth frames for the PLY builder.
+# The ray through every pixel ((u - cx) / fx, (v - cy) / fy, 1) only depends on the intrinsics, so it is
+# computed once from camera_intrinsic.json. Per frame, pixels without depth or outside the min/max
+# clipping distances (the same distances the recorder asks for) are masked out on the raw uint16 depth
+# first, and only the remaining pixels are turned into points: ray * depth, rotated and translated into
+# the robot frame with a single matrix multiply.
+#
+# Depth is scaled with the depth_scale stored in the intrinsics (meters per depth unit) and returned in
+# millimeters by default, the unit of the robot translations in the trajectories.
+
+import numpy as np
+
+# points (N,3) -> R @ p + t for every point
+def transform_points(points, transformation_matrix):
+    T = np.asarray(transformation_matrix, dtype=np.float64)
+    return points @ T[:3, :3].T + T[:3, 3]
+
+class BackProjector:
+    def __init__(self, intrinsics_data, min_distance=0.070, max_distance=0.500, units_per_meter=1000.0, stride=1):
+        # Everything the projected points depend on, e.g. for cache keys
+        self.settings = {"intrinsics": intrinsics_data, "min_distance": min_distance, "max_distance": max_distance,
+                         "units_per_meter": units_per_meter, "stride": stride}
+        self.width = intrinsics_data['width']
+        self.height = intrinsics_data['height']
+        self.depth_scale = intrinsics_data['depth_scale']
+        self.stride = stride
+        # Output units per depth unit, and the clipping distances (meters) in raw depth units
+        self.scale = self.depth_scale * units_per_meter
+        self.min_raw = max(int(np.ceil(min_distance / self.depth_scale)), 1)
+        self.max_raw = int(np.floor(max_distance / self.depth_scale))
+
+        fx = intrinsics_data['intrinsic_matrix'][0]
+        fy = intrinsics_data['intrinsic_matrix'][4]
+        cx = intrinsics_data['intrinsic_matrix'][6]
+        cy = intrinsics_data['intrinsic_matrix'][7]
+        v, u = np.mgrid[0:self.height:stride, 0:self.width:stride]
+        self.rays = np.column_stack([((u - cx) / fx).ravel(), ((v - cy) / fy).ravel(), np.ones(u.size)])
+
+    # Pixels kept for a depth image (h, w) of raw depth units
+    def mask(self, depth):
+        depth = depth[::self.stride, ::self.stride].ravel()
+        return (depth >= self.min_raw) & (depth <= self.max_raw)
+
+    # Camera frame points (N,3) float32 and RGB colors (N,3) uint8 of the valid pixels, the compact form
+    # kept by frame_cache.py
+    def project_camera(self, depth, color):
+        if depth.shape != (self.height, self.width):
+            raise ValueError(f"Depth image is {depth.shape[1]}x{depth.shape[0]}, intrinsics are {self.width}x{self.height}")
+        keep = self.mask(depth)
+        z = depth[::self.stride, ::self.stride].ravel()[keep] * self.scale
+        points = (self.rays[keep] * z[:, None]).astype(np.float32)
+        return points, color[::self.stride, ::self.stride].reshape(-1, 3)[keep]
+
+    # depth (h, w) raw units, color (h, w, 3) RGB uint8, transformation_matrix (4,4) camera -> robot frame.
+    # Returns points (N,3) and colors (N,3) in [0, 1] of the valid pixels.
+    def project(self, depth, color, transformation_matrix=None):
+        if depth.shape != (self.height, self.width):
+            raise ValueError(f"Depth image is {depth.shape[1]}x{depth.shape[0]}, intrinsics are {self.width}x{self.height}")
+        keep = self.mask(depth)
+        z = depth[::self.stride, ::self.stride].ravel()[keep] * self.scale
+        colors = color[::self.stride, ::self.stride].reshape(-1, 3)[keep] / 255.0
+
+        if transformation_matrix is None:
+            return self.rays[keep] * z[:, None], colors
+        T = np.asarray(transformation_matrix, dtype=np.float64)
+        # R @ (ray * z) + t == z * (ray @ R^T) + t
+        points = (self.rays[keep] @ T[:3, :3].T) * z[:, None] + T[:3, 3]
+        return points, colors
@@ -0,0 +1,281 @@
+# End-to-end benchmark of the post-processing pipeline on synthetic data.
+# Generates an RSI log (robot_data.csv and robot_data.rsilog, the receiver's two formats) of a robot
+# sweeping back and forth, and a frame recording of the same time span (SyntheticSource from
+# frame_source.py: depth/color image folders or a frames/ container, plus camera_intrinsic.json). Then
+# every stage is timed and, in a second run, its peak memory traced:
+#   log_write        receiver logging (RSICsvWriter / RSILogWriter)
+#   rsi_parse        parse_rsi() on the datagrams the controller would send
+#   process_csv      stage 2, log -> transformations.traj
+#   checker_load     stage 3, loading and precomputing the trajectory for the viewer
+#   register         stage 4, frame listing and pose lookup
+#   project          stage 4, decoding and back-projection
+#   fuse             stage 4, voxel fusion (integrate time only, the projection feeding it is excluded)
+#   ply_write        stage 4, writing the fused cloud
+# The results go to a JSON report. With --compare, stages whose throughput dropped by more than
+# --tolerance against an earlier report are listed and the exit code is 1.
+#
+# Peak memory is traced with tracemalloc (numpy buffers included) in a separate run of each stage, so
+# the timings are not slowed down by it. Only this process is traced, so the PLY builder stages run
+# with --workers 1 by default.
+#
+#   python benchmark.py --rsi-rows 100000 --frames 60 --size 640x480 --report benchmark_report.json
+#   python benchmark.py --compare benchmark_report.json
+
+import argparse
+import importlib
+import json
+import matplotlib
+import numpy as np
+import os
+import platform
+import shutil
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+matplotlib.use('Agg')  # The checker's figure is built offscreen
+import matplotlib.pyplot as plt
+
+from frame_container import ContainerSink
+from frame_source import SyntheticSource, parse_size
+from frame_writer import ImageFolderSink
+from pose_index import PoseIndex
+from ply_stream import SplitPlyWriter
+from rsi_log import RSICsvWriter, RSILogWriter
+from rsi_parser import FIELDNAMES, POSE_KEYS, format_rsi_message, parse_rsi
+from trajectory_store import load_trajectory
+from voxel_fusion import VoxelGrid
+
+RSI_CYCLE_MS = 4
+
+# The stage scripts start with a digit, so they are imported by name
+process_rsi = importlib.import_module('2_process_rsi_to_transformations')
+check_transformations = importlib.import_module('3_check_transformations')
+process_frames = importlib.import_module('4_process_frames_to_ply')
+
+# Rows of robot_data.csv (values as strings, like parse_rsi() returns them) of a robot sweeping over
+# the scene in 4 ms RSI cycles, starting at start_ms
+def synthetic_rsi_rows(count, start_ms, sweep_seconds=4.0):
+    t = np.arange(count) * RSI_CYCLE_MS / 1000.0
+    phase = 2 * np.pi * t / sweep_seconds
+    poses = np.column_stack([1200.0 + 150.0 * np.sin(phase), 200.0 + 20.0 * t % 300.0, 950.0 + 10.0 * np.cos(phase),
+                             80.0 + 5.0 * np.sin(phase), 60.0 + 2.0 * np.cos(phase), 116.0 + 3.0 * np.sin(2 * phase)])
+    poses = np.round(poses, 3)
+    template = {field: '0' for field in FIELDNAMES}
+    template.update({'WeldVolt': '14417', 'WeldAmps': '12320', 'MotorAmps': '46', 'WFS': '1475'})
+    rows = []
+    for i in range(count):
+        row = dict(template)
+        row['Timestamp'] = str(start_ms + i * RSI_CYCLE_MS)
+        row['IPOC'] = str(1210441551 + i * RSI_CYCLE_MS)
+        for key, value in zip(POSE_KEYS, poses[i]):
+            row[key + '_RIst'] = row[key + '_RSol'] = str(value)
+        rows.append(row)
+    return rows
+
+# Writes a synthetic recording to folder (depth/ and color/, or a frames/ container) with its
+# camera_intrinsic.json and returns (depth folder, color folder, intrinsics path)
+def write_synthetic_recording(folder, frame_count, width, height, start_ms, fps=30, container=False):
+    source = SyntheticSource(width, height, fps=fps, frame_count=frame_count, speed=0, start_time_ms=start_ms)
+    if container:
+        depth_folder = color_folder = os.path.join(folder, "frames")
+        os.makedirs(folder, exist_ok=True)
+        sink = ContainerSink(depth_folder, width, height)
+    else:
+        depth_folder = os.path.join(folder, "depth")
+        color_folder = os.path.join(folder, "color")
+        os.makedirs(depth_folder, exist_ok=True)
+        os.makedirs(color_folder, exist_ok=True)
+        sink = ImageFolderSink(depth_folder, color_folder)
+
+    source.start()
+    while True:
+        frame = source.read()
+        if frame is None:
+            break
+        sink.write(frame.frame_number, frame.timestamp, frame.timestamp_domain, frame.depth_image, frame.color_image)
+    sink.close()
+    intrinsics_path = os.path.join(folder, "camera_intrinsic.json")
+    source.save_intrinsics(intrinsics_path, fps, int(frame_count * 1000000 / fps))
+    return depth_folder, color_folder, intrinsics_path
+
+# Runs stage_function(record) once untraced for the timing and, with trace_memory, once more under
+# tracemalloc for the peak memory only, since tracing slows Python-heavy stages down several times.
+# The function fills in items (and unit) and may set seconds itself to leave out work that is not part
+# of the stage. Returns the result of the timed run.
+def run_stage(report, stage, stage_function, trace_memory=True):
+    record = {"stage": stage}
+    start = time.perf_counter()
+    result = stage_function(record)
+    record.setdefault("seconds", time.perf_counter() - start)
+    if record.get("items") is not None:
+        record["items_per_second"] = record["items"] / max(record["seconds"], 1e-9)
+
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            stage_function({})
+            record["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+    report.append(record)
+    memory = f", peak {record['peak_memory_mb']:.1f} MB (traced run)" if trace_memory else ""
+    print(f"{stage:24} {record['seconds']:8.3f} s  {record.get('items_per_second', 0):12.0f} "
+          f"{record.get('unit', 'items')}/s{memory}")
+    return result
+
+def run_benchmark(data_folder, rsi_rows=100000, frame_count=60, width=640, height=480, container=False,
+                  workers=1, voxel_size=1.0, trace_memory=True):
+    report = []
+    start_ms = 1700000000000
+    os.makedirs(data_folder, exist_ok=True)
+    rows = synthetic_rsi_rows(rsi_rows, start_ms)
+
+    # Receiver logging and parsing
+    log_paths = {}
+    for log_format, writer_class, name in [('csv', RSICsvWriter, "robot_data.csv"),
+                                           ('binary', RSILogWriter, "robot_data.rsilog")]:
+        log_paths[log_format] = log_path = os.path.join(data_folder, name)
+
+        def write_log(record):
+            with writer_class(log_path) as log:
+                for row in rows:
+                    log.append(row)
+            record.update(items=len(rows), unit="rows")
+        run_stage(report, f"log_write[{log_format}]", write_log, trace_memory)
+
+    messages = [format_rsi_message(row) for row in rows]
+
+    def parse_messages(record):
+        for i, message in enumerate(messages):
+            parse_rsi(message, start_ms + i * RSI_CYCLE_MS)
+        record.update(items=len(messages), unit="packets")
+    run_stage(report, "rsi_parse", parse_messages, trace_memory)
+    del messages, rows
+
+    # Stage 2, from both log formats
+    trajectory_path = os.path.join(data_folder, "transformations.traj")
+    for log_format, log_path in log_paths.items():
+        def convert_log(record):
+            count = process_rsi.process_csv(log_path, trajectory_path)
+            record.update(items=count, unit="poses")
+        run_stage(report, f"process_csv[{log_format}]", convert_log, trace_memory)
+
+    # Stage 3: what the viewer does before showing the first frame
+    check_transformations.trajectory_path = trajectory_path
+
+    def load_checker(record):
+        check_transformations.create_animation()
+        record.update(items=len(check_transformations.timestamps), unit="poses")
+        plt.close('all')
+    run_stage(report, "checker_load", load_checker, trace_memory)
+
+    # Stage 4
+    recording_folder = os.path.join(data_folder, "recording")
+    depth_folder, color_folder, intrinsics_path = write_synthetic_recording(recording_folder, frame_count, width,
+                                                                            height, start_ms, container=container)
+    with open(intrinsics_path, 'r') as f:
+        intrinsics_data = json.load(f)
+
+    def register(record):
+        pose_index = PoseIndex.from_trajectory(load_trajectory(trajectory_path))
+        frames = process_frames.list_frames(depth_folder, color_folder)
+        frame_times = np.array([epoch_time for epoch_time, _ in frames], dtype=np.int64)
+        record.update(items=len(frames), unit="frames")
+        return frames, pose_index.lookup(frame_times, True)
+    frames, frame_poses = run_stage(report, "register", register, trace_memory)
+
+    def project(record):
+        points_projected = 0
+        for _, points, _ in process_frames.project_frames(frames, frame_poses, intrinsics_data, workers):
+            points_projected += len(points)
+        record.update(items=len(frames), unit="frames", points=points_projected)
+    run_stage(report, "project", project, trace_memory)
+
+    def fuse(record):
+        grid = VoxelGrid(voxel_size)
+        fuse_seconds = 0.0
+        for _, points, colors in process_frames.project_frames(frames, frame_poses, intrinsics_data, workers):
+            start = time.perf_counter()
+            grid.integrate(points, colors)
+            fuse_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        points, colors, _ = grid.to_arrays()
+        fuse_seconds += time.perf_counter() - start
+        record.update(items=grid.points_integrated, unit="points", voxels=len(points), seconds=fuse_seconds)
+        return points, colors
+    points, colors = run_stage(report, "fuse", fuse, trace_memory)
+
+    def ply_write(record):
+        writer = SplitPlyWriter(os.path.join(data_folder, "combined.ply"))
+        for start in range(0, len(points), 1000000):
+            writer.write(points[start:start + 1000000], colors[start:start + 1000000])
+        writer.close()
+        record.update(items=writer.count, unit="points")
+    run_stage(report, "ply_write", ply_write, trace_memory)
+    return report
+
+# Stages of report whose throughput is more than tolerance below the baseline's
+def compare_reports(report, baseline, tolerance=0.2):
+    baseline_stages = {record["stage"]: record for record in baseline["stages"]}
+    regressions = []
+    for record in report["stages"]:
+        previous = baseline_stages.get(record["stage"])
+        if not previous or not previous.get("items_per_second") or "items_per_second" not in record:
+            continue
+        ratio = record["items_per_second"] / previous["items_per_second"]
+        if ratio < 1.0 - tolerance:
+            regressions.append((record["stage"], previous["items_per_second"], record["items_per_second"], ratio))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the post-processing stages on synthetic data")
+    parser.add_argument("--rsi-rows", type=int, default=100000, help="rows of the synthetic RSI log")
+    parser.add_argument("--frames", type=int, default=60, help="frames of the synthetic recording")
+    parser.add_argument("--size", type=parse_size, default=(640, 480), help="WIDTHxHEIGHT of the frames")
+    parser.add_argument("--container", action="store_true", help="record to a frame container instead of images")
+    parser.add_argument("--workers", type=int, default=1, help="PLY builder worker processes")
+    parser.add_argument("--voxel-size", type=float, default=1.0, help="voxel size in mm")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run of every stage")
+    parser.add_argument("--data", default="benchmark_data", help="folder for the generated data")
+    parser.add_argument("--keep", action="store_true", help="keep the generated data")
+    parser.add_argument("--report", default="benchmark_report.json")
+    parser.add_argument("--compare", help="earlier report to check for throughput regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    if os.path.exists(args.data):
+        shutil.rmtree(args.data)
+    try:
+        stages = run_benchmark(args.data, args.rsi_rows, args.frames, *args.size, args.container, args.workers,
+                               args.voxel_size, not args.no_memory)
+    finally:
+        if not args.keep:
+            shutil.rmtree(args.data, ignore_errors=True)
+
+    report = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "config": {"rsi_rows": args.rsi_rows, "frames": args.frames, "size": list(args.size),
+                   "container": args.container, "workers": args.workers, "voxel_size": args.voxel_size,
+                   "trace_memory": not args.no_memory},
+        "system": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                   "cpu_count": os.cpu_count()},
+        "stages": stages,
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Saved the report to {args.report}")
+
+    if baseline is not None:
+        regressions = compare_reports(report, baseline, args.tolerance)
+        for stage, before, after, ratio in regressions:
+            print(f"Regression in {stage}: {before:.0f} -> {after:.0f} per second ({(1 - ratio) * 100:.0f}% slower)")
+        if baseline.get("config") != report["config"]:
+            print("Note: the baseline was run with a different configuration")
+        sys.exit(1 if regressions else 0)
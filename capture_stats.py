@@ -0,0 +1,149 @@
+# Per-frame latency and frame-drop instrumentation for the recorder.
+# Every stage of the capture pipeline reports how long it took:
+#   wait     waiting for the next frameset from the source
+#   align    aligning depth to color
+#   convert  copying the frames out of the librealsense buffers into numpy
+#   submit   handing the frame to the writer queue (grows when the queue is full and the policy blocks)
+#   write    encoding and writing the frame to disk (writer threads)
+#   preview  rendering the preview (preview thread)
+# Dropped frames are detected from gaps in the hardware frame counter and in the frame timestamps.
+# Rolling percentiles are printed while recording and a JSON summary is written at shutdown, next to
+# camera_intrinsic.json, so a recording can be shown to be lossless (or the bottleneck stage found).
+
+import numpy as np
+import json
+import threading
+import time
+from array import array
+from collections import deque
+
+STAGES = ['wait', 'align', 'convert', 'submit', 'write', 'preview']
+
+class CaptureStats:
+    def __init__(self, fps, window=300, report_interval=5.0):
+        self.fps = fps
+        self.frame_interval_ms = 1000.0 / fps if fps else None
+        self.report_interval = report_interval
+        self.lock = threading.Lock()
+
+        # Every sample is kept for the summary (8 bytes each), the deque holds the rolling window
+        self.samples = {stage: array('d') for stage in STAGES}
+        self.recent = {stage: deque(maxlen=window) for stage in STAGES}
+
+        self.frames = 0
+        self.first_frame_number = None
+        self.last_frame_number = None
+        self.last_timestamp = None
+        self.frame_number_gaps = 0
+        self.frames_missing_by_counter = 0
+        self.frame_counter_resets = 0
+        self.timestamp_gaps = 0
+        self.frames_missing_by_timestamp = 0
+        self.max_timestamp_delta_ms = 0.0
+        self.first_timestamp = None
+
+        self.start_time = time.perf_counter()
+        self.last_report = self.start_time
+
+    # Stage durations are in seconds
+    def record(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+            self.recent[stage].append(seconds)
+
+    def frame(self, frame_number, timestamp):
+        with self.lock:
+            self.frames += 1
+            if self.last_frame_number is not None:
+                step = frame_number - self.last_frame_number
+                if step > 1:
+                    self.frame_number_gaps += 1
+                    self.frames_missing_by_counter += step - 1
+                elif step <= 0:
+                    # Counter restarted (e.g. after a sensor option change), not a drop
+                    self.frame_counter_resets += 1
+            else:
+                self.first_frame_number = frame_number
+                self.first_timestamp = timestamp
+
+            if self.last_timestamp is not None and self.frame_interval_ms:
+                delta = timestamp - self.last_timestamp
+                self.max_timestamp_delta_ms = max(self.max_timestamp_delta_ms, delta)
+                # Allow half an interval of jitter before calling it a missed frame
+                if delta > 1.5 * self.frame_interval_ms:
+                    self.timestamp_gaps += 1
+                    self.frames_missing_by_timestamp += int(round(delta / self.frame_interval_ms)) - 1
+
+            self.last_frame_number = frame_number
+            self.last_timestamp = timestamp
+
+    @staticmethod
+    def _percentiles(values):
+        if len(values) == 0:
+            return None
+        values_ms = np.asarray(values) * 1000.0
+        p50, p95, p99 = np.percentile(values_ms, [50, 95, 99])
+        return {"count": int(values_ms.size), "mean_ms": float(values_ms.mean()), "p50_ms": float(p50),
+                "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(values_ms.max())}
+
+    def rolling(self):
+        with self.lock:
+            recent = {stage: list(values) for stage, values in self.recent.items()}
+        return {stage: self._percentiles(values) for stage, values in recent.items() if values}
+
+    # Prints the rolling percentiles every report_interval seconds, cheap to call every frame
+    def maybe_report(self, writer=None):
+        now = time.perf_counter()
+        if now - self.last_report < self.report_interval:
+            return
+        self.last_report = now
+        line = [f"[{now - self.start_time:7.1f} s] frames {self.frames}, missing {self.frames_missing_by_counter}"]
+        if writer is not None:
+            line.append(f"queue {writer.queue_depth()}")
+        for stage, p in self.rolling().items():
+            line.append(f"{stage} p50/p95/p99 {p['p50_ms']:.1f}/{p['p95_ms']:.1f}/{p['p99_ms']:.1f} ms")
+        print(" | ".join(line))
+
+    def summary(self, writer_stats=None):
+        with self.lock:
+            stages = {stage: self._percentiles(values) for stage, values in self.samples.items() if len(values)}
+            duration_s = time.perf_counter() - self.start_time
+            recorded_span_ms = (self.last_timestamp - self.first_timestamp) if self.frames > 1 else 0.0
+            summary = {
+                "frames_captured": self.frames,
+                "duration_s": duration_s,
+                "capture_fps": self.frames / duration_s if duration_s > 0 else 0.0,
+                "requested_fps": self.fps,
+                "first_frame_number": self.first_frame_number,
+                "last_frame_number": self.last_frame_number,
+                "frame_number_gaps": self.frame_number_gaps,
+                "frames_missing_by_counter": self.frames_missing_by_counter,
+                "frame_counter_resets": self.frame_counter_resets,
+                "timestamp_gaps": self.timestamp_gaps,
+                "frames_missing_by_timestamp": self.frames_missing_by_timestamp,
+                "max_timestamp_delta_ms": self.max_timestamp_delta_ms,
+                "recorded_span_ms": recorded_span_ms,
+                "stages": stages,
+            }
+        writer_dropped = 0
+        writer_errors = 0
+        if writer_stats is not None:
+            summary["writer"] = writer_stats
+            writer_dropped = writer_stats.get("frames_dropped", 0)
+            writer_errors = writer_stats.get("write_errors", 0)
+        summary["lossless"] = (summary["frames_missing_by_counter"] == 0 and summary["frames_missing_by_timestamp"] == 0
+                               and writer_dropped == 0 and writer_errors == 0)
+        # The working stage that can take the fewest frames per second is the most likely bottleneck
+        # ('wait' is idle time while the camera produces the next frame). The writer threads encode
+        # frames in parallel, so a write only holds up the pipeline for p95 / workers.
+        workers = {'write': writer_stats.get("workers", 1) if writer_stats else 1}
+        busy = [stage for stage in stages if stage != 'wait']
+        if busy:
+            summary["slowest_stage"] = max(busy, key=lambda stage: stages[stage]["p95_ms"] / workers.get(stage, 1))
+        return summary
+
+    def save(self, filename, writer_stats=None):
+        summary = self.summary(writer_stats)
+        with open(filename, 'w') as outfile:
+            json.dump(summary, outfile, indent=4)
+        return summary
@@ -0,0 +1,119 @@
+# On-disk cache of back-projected frames for re-running the PLY builder.
+# Decoding the PNG/JPG pair and back-projecting it only depends on the frame files and the projection
+# settings (intrinsics, clipping distances), not on the robot pose. FrameCache stores the camera-frame
+# points and colors of every frame under a key made of the file identities (path, size, mtime) and the
+# settings, so a re-run with other transformations or clock offsets only redoes the rigid transform and
+# the fusion.
+#
+# One file per frame (float32 xyz + uint8 rgb records). Reading a frame marks it as recently used, and
+# the least recently used files are deleted when the cache grows past max_bytes. Several worker
+# processes can share one cache folder: files are written under a temporary name and renamed. Temporary
+# files older than stale_seconds were left behind by a crashed writer and are deleted when the cache is
+# opened and on every eviction.
+
+import hashlib
+import json
+import numpy as np
+import os
+import time
+
+CACHE_DTYPE = np.dtype([('xyz', '<f4', (3,)), ('rgb', 'u1', (3,))])
+CACHE_EXTENSION = '.npy'
+TEMPORARY_EXTENSION = '.tmp'
+
+# Identity of a file on disk: changes whenever the file is rewritten
+def file_identity(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+class FrameCache:
+    # settings: anything JSON serializable the cached arrays depend on besides the frame files
+    def __init__(self, folder, max_bytes=10 * 1024 ** 3, settings=None, stale_seconds=600):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self.settings = json.dumps(settings, sort_keys=True, default=str)
+        self.hits = 0
+        self.misses = 0
+        self.bytes_written = 0
+        os.makedirs(folder, exist_ok=True)
+        self.remove_stale()
+
+    def key(self, identity):
+        text = json.dumps(identity, default=str) + self.settings
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + CACHE_EXTENSION)
+
+    # (points (N,3) float32, colors (N,3) uint8) or None
+    def get(self, key):
+        path = self._path(key)
+        try:
+            records = np.load(path)
+            os.utime(path)  # Mark as recently used
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return records['xyz'], records['rgb']
+
+    def put(self, key, points, colors):
+        records = np.empty(len(points), dtype=CACHE_DTYPE)
+        records['xyz'] = points
+        records['rgb'] = colors
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}{TEMPORARY_EXTENSION}"
+        with open(temporary_path, 'wb') as f:
+            np.save(f, records)
+        os.replace(temporary_path, path)
+
+        # Check the size limit every tenth of it written, not on every frame
+        self.bytes_written += records.nbytes
+        if self.bytes_written > self.max_bytes / 10:
+            self.evict()
+
+    # Deletes the temporary files of writers that died before renaming them, returns the bytes of the
+    # temporary files still being written
+    def remove_stale(self):
+        oldest = time.time() - self.stale_seconds
+        in_progress = 0
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith(TEMPORARY_EXTENSION):
+                continue
+            try:
+                stat = entry.stat()
+                if stat.st_mtime < oldest:
+                    os.remove(entry.path)
+                else:
+                    in_progress += stat.st_size
+            except OSError:
+                pass
+        return in_progress
+
+    # Deletes stale temporary files, then the least recently used files until the cache fits in max_bytes
+    def evict(self):
+        self.bytes_written = 0
+        in_progress = self.remove_stale()
+        entries = []
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(CACHE_EXTENSION):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        # Files still being written count towards the limit but can not be deleted
+        total = in_progress + sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        return total
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
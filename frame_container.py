@@ -0,0 +1,203 @@
+# Segmented binary container for aligned depth + color recordings.
+# Instead of one PNG and one JPG per frame, raw Z16 depth and BGR8 color are appended to fixed-size
+# segment files that can be memory mapped, and every frame gets a fixed-width record in index.bin:
+#   (frame number, hardware timestamp in ms, timestamp domain, byte offset)
+# Reading frame N or all frames in a time range is then a lookup plus a zero-copy numpy view.
+#
+# Folder layout:
+#   container.json       width, height, frames per segment, byte sizes
+#   index.bin            packed INDEX_DTYPE records, appended after each frame's data is written
+#   segment_00000.bin    frames_per_segment records of [depth (h*w*2 bytes) | color (h*w*3 bytes)]
+
+import numpy as np
+import json
+import threading
+from os import makedirs
+from os.path import exists, join, getsize
+
+CONTAINER_META = "container.json"
+CONTAINER_INDEX = "index.bin"
+
+INDEX_DTYPE = np.dtype([
+    ('frame_number', '<i8'),
+    ('timestamp', '<f8'),
+    ('domain', 'u1'),
+    ('offset', '<u8'),
+])
+
+# Same order as rs.timestamp_domain so the integer value can be stored directly
+TIMESTAMP_DOMAINS = ['hardware_clock', 'system_time', 'global_time']
+
+def timestamp_domain_code(domain):
+    name = str(domain).split('.')[-1]
+    return TIMESTAMP_DOMAINS.index(name) if name in TIMESTAMP_DOMAINS else 255
+
+def is_container(path):
+    return exists(join(path, CONTAINER_META))
+
+def segment_path(path, segment):
+    return join(path, f"segment_{segment:05d}.bin")
+
+class ContainerWriter:
+    def __init__(self, path, width, height, frames_per_segment=300):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.frames_per_segment = frames_per_segment
+        self.depth_bytes = width * height * 2
+        self.color_bytes = width * height * 3
+        self.frame_bytes = self.depth_bytes + self.color_bytes
+        self.frame_count = 0
+        self.segment = None
+        self.segment_number = -1
+        self.lock = threading.Lock()
+
+        makedirs(path, exist_ok=True)
+        meta = {
+            "version": 1,
+            "width": width,
+            "height": height,
+            "depth_format": "Z16",
+            "color_format": "BGR8",
+            "frames_per_segment": frames_per_segment,
+            "depth_bytes": self.depth_bytes,
+            "color_bytes": self.color_bytes,
+            "frame_bytes": self.frame_bytes,
+        }
+        with open(join(path, CONTAINER_META), 'w') as outfile:
+            json.dump(meta, outfile, indent=4)
+        self.index_file = open(join(path, CONTAINER_INDEX), 'wb')
+
+    def _open_segment(self, segment_number):
+        if self.segment is not None:
+            self.segment.flush()
+        # Segments are preallocated at full size so the mapping never has to grow
+        self.segment = np.memmap(segment_path(self.path, segment_number), dtype=np.uint8, mode='w+',
+                                 shape=(self.frames_per_segment, self.frame_bytes))
+        self.segment_number = segment_number
+
+    def write(self, frame_number, timestamp, domain, depth_image, color_image):
+        if depth_image.shape != (self.height, self.width) or color_image.shape != (self.height, self.width, 3):
+            raise ValueError(f"Frame size {depth_image.shape}/{color_image.shape} does not match container "
+                             f"{self.width}x{self.height}")
+        with self.lock:
+            slot = self.frame_count
+            segment_number, row = divmod(slot, self.frames_per_segment)
+            if segment_number != self.segment_number:
+                self._open_segment(segment_number)
+
+            record = self.segment[row]
+            record[:self.depth_bytes].view('<u2').reshape(self.height, self.width)[:] = depth_image
+            record[self.depth_bytes:].reshape(self.height, self.width, 3)[:] = color_image
+
+            # The index record is only written once the frame data is in place, so a reader never
+            # sees an index entry pointing at a half written frame
+            entry = np.zeros(1, dtype=INDEX_DTYPE)
+            entry['frame_number'] = frame_number
+            entry['timestamp'] = timestamp
+            entry['domain'] = timestamp_domain_code(domain)
+            entry['offset'] = slot * self.frame_bytes
+            self.index_file.write(entry.tobytes())
+            self.frame_count += 1
+
+    def flush(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment.flush()
+            self.index_file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment.flush()
+                used = self.frame_count - self.segment_number * self.frames_per_segment
+                del self.segment
+                self.segment = None
+                # Trim the unused tail of the last segment
+                with open(segment_path(self.path, self.segment_number), 'r+b') as f:
+                    f.truncate(used * self.frame_bytes)
+            self.index_file.close()
+
+# Adapter so a ContainerWriter can be used as a FrameWriter sink (thread workers only, the memory
+# maps can not be shared with worker processes)
+class ContainerSink:
+    def __init__(self, path, width, height, frames_per_segment=300):
+        self.container = ContainerWriter(path, width, height, frames_per_segment)
+
+    def write(self, frame_number, timestamp, domain, depth_image, color_image):
+        self.container.write(frame_number, timestamp, domain, depth_image, color_image)
+
+    def close(self):
+        self.container.close()
+
+class FrameContainer:
+    def __init__(self, path):
+        self.path = path
+        with open(join(path, CONTAINER_META), 'r') as f:
+            meta = json.load(f)
+        self.width = meta['width']
+        self.height = meta['height']
+        self.frames_per_segment = meta['frames_per_segment']
+        self.depth_bytes = meta['depth_bytes']
+        self.frame_bytes = meta['frame_bytes']
+        self.segment_bytes = self.frames_per_segment * self.frame_bytes
+
+        # Ignore a trailing partial record left by a crash
+        index_path = join(path, CONTAINER_INDEX)
+        count = getsize(index_path) // INDEX_DTYPE.itemsize
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE, count=count)
+        order = np.argsort(index['timestamp'], kind='stable')
+        self.index = index[order]
+        self.timestamps = self.index['timestamp']
+        self.segments = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def _segment(self, segment_number):
+        segment = self.segments.get(segment_number)
+        if segment is None:
+            filename = segment_path(self.path, segment_number)
+            rows = getsize(filename) // self.frame_bytes
+            segment = np.memmap(filename, dtype=np.uint8, mode='r', shape=(rows, self.frame_bytes))
+            self.segments[segment_number] = segment
+        return segment
+
+    # Zero-copy views of the depth (uint16, h x w) and color (BGR uint8, h x w x 3) images of frame i,
+    # where i is the position in timestamp order
+    def frame(self, i):
+        segment_number, row = divmod(int(self.index['offset'][i]) // self.frame_bytes, self.frames_per_segment)
+        record = self._segment(segment_number)[row]
+        depth = record[:self.depth_bytes].view('<u2').reshape(self.height, self.width)
+        color = record[self.depth_bytes:].reshape(self.height, self.width, 3)
+        return depth, color
+
+    # Positions [start, stop) of the frames with start_time <= timestamp < end_time
+    def index_range(self, start_time, end_time):
+        start = np.searchsorted(self.timestamps, start_time, side='left')
+        stop = np.searchsorted(self.timestamps, end_time, side='left')
+        return int(start), int(stop)
+
+    def frames_between(self, start_time, end_time):
+        start, stop = self.index_range(start_time, end_time)
+        for i in range(start, stop):
+            yield self.index[i], *self.frame(i)
+
+    # Zero-copy (n, h, w) depth view of positions [start, stop) when they are stored back to back in
+    # one segment, which is the normal case for a recording written in order. Returns None otherwise.
+    def depth_block(self, start, stop):
+        if stop <= start:
+            return None
+        offsets = self.index['offset'][start:stop].astype(np.int64)
+        if np.any(np.diff(offsets) != self.frame_bytes):
+            return None
+        first = int(offsets[0]) // self.frame_bytes
+        segment_number, row = divmod(first, self.frames_per_segment)
+        if row + (stop - start) > self.frames_per_segment:
+            return None
+        rows = self._segment(segment_number)[row:row + (stop - start)]
+        return rows[:, :self.depth_bytes].view('<u2').reshape(stop - start, self.height, self.width)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.index[i], *self.frame(i)
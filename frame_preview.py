@@ -0,0 +1,85 @@
+# Live preview for the realsense recorder, rendered on its own thread.
+# The capture loop only hands over its latest frame; the preview thread renders at a capped rate and
+# scale, so background removal, the colormap and the GUI calls never slow down capture. Frames that
+# arrive while a render is in progress are simply replaced by newer ones.
+
+import cv2
+import numpy as np
+import threading
+import time
+
+class FramePreview:
+    def __init__(self, clipping_distance, min_distance, max_fps=10.0, scale=0.5,
+                 window_name='Recorder Realsense D405', grey_color=153, stats=None):
+        self.clipping_distance = clipping_distance
+        self.min_distance = min_distance
+        self.interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.scale = scale
+        self.window_name = window_name
+        self.grey_color = grey_color
+        # Optional CaptureStats that receives the render time of each preview frame
+        self.capture_stats = stats
+
+        self.lock = threading.Lock()
+        self.new_frame = threading.Event()
+        self.stop_event = threading.Event()
+        # Set when the user presses esc in the preview window
+        self.exit_requested = threading.Event()
+        self.latest = None
+        self.frames_rendered = 0
+
+        self.thread = threading.Thread(target=self._run, name="frame-preview", daemon=True)
+        self.thread.start()
+
+    # Called from the capture loop; only keeps a reference to the most recent frame pair.
+    # The arrays must not be modified afterwards.
+    def submit(self, depth_image, color_image):
+        with self.lock:
+            self.latest = (depth_image, color_image)
+        self.new_frame.set()
+
+    def render(self, depth_image, color_image):
+        if self.scale != 1.0:
+            width = max(1, int(depth_image.shape[1] * self.scale))
+            height = max(1, int(depth_image.shape[0] * self.scale))
+            depth_image = cv2.resize(depth_image, (width, height), interpolation=cv2.INTER_NEAREST)
+            color_image = cv2.resize(color_image, (width, height), interpolation=cv2.INTER_AREA)
+
+        # Remove background - Set pixels further than clipping_distance (or closer than min_distance) to grey.
+        # The single channel mask broadcasts over the color channels, no 3 channel depth copy is needed.
+        background = (depth_image > self.clipping_distance) | (depth_image < self.min_distance)
+        bg_removed = np.where(background[:, :, None], np.uint8(self.grey_color), color_image)
+
+        depth_colormap = cv2.applyColorMap(cv2.convertScaleAbs(depth_image, alpha=0.09), cv2.COLORMAP_JET)
+
+        return np.hstack((bg_removed, depth_colormap))
+
+    def _run(self):
+        cv2.namedWindow(self.window_name, cv2.WINDOW_AUTOSIZE)
+        last_render = 0.0
+        while not self.stop_event.is_set():
+            if self.new_frame.wait(timeout=0.05):
+                wait = self.interval - (time.perf_counter() - last_render)
+                if wait > 0:
+                    self.stop_event.wait(wait)
+                with self.lock:
+                    frame = self.latest
+                    self.new_frame.clear()
+                if frame is not None:
+                    last_render = time.perf_counter()
+                    cv2.imshow(self.window_name, self.render(*frame))
+                    self.frames_rendered += 1
+                    if self.capture_stats is not None:
+                        self.capture_stats.record('preview', time.perf_counter() - last_render)
+
+            # Keep the window responsive even when no new frame arrives
+            key = cv2.waitKey(1)
+
+            # If 'esc' button pressed, ask the capture loop to stop
+            if key == 27:
+                self.exit_requested.set()
+        cv2.destroyWindow(self.window_name)
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
@@ -0,0 +1,82 @@
+# Per-frame work of 4_process_frames_to_ply.py: decode a depth/color frame pair, back-project it to a
+# point cloud and move it into the robot frame with its pose. Runs in the worker processes of the PLY
+# builder, so everything crossing the process boundary is plain numpy: a task is
+# (epoch_time, source, 4x4 pose) and a result is (epoch_time, points (N,3), colors (N,3)).
+#
+# A source is either ('files', depth_image_path, color_image_path) for an image folder recording or
+# ('container', container_path, position) for a frames/ container, which every worker maps once.
+#
+# With a cache folder, the camera-frame points of every frame are kept in a FrameCache (frame_cache.py)
+# and a re-run only applies the poses.
+
+import cv2
+import os
+from back_projection import BackProjector, transform_points
+from frame_cache import FrameCache, file_identity
+from frame_container import FrameContainer, CONTAINER_INDEX
+from stage_profiler import span
+
+# Set in each worker by init_worker()
+_settings = {}
+_containers = {}
+
+# The ray grid is built once per worker
+def init_worker(intrinsics_data, min_distance=0.070, max_distance=0.500, stride=1, cache_folder=None,
+                cache_bytes=10 * 1024 ** 3):
+    projector = BackProjector(intrinsics_data, min_distance, max_distance, stride=stride)
+    _settings['projector'] = projector
+    _settings['cache'] = FrameCache(cache_folder, cache_bytes, projector.settings) if cache_folder else None
+
+def _container(path):
+    container = _containers.get(path)
+    if container is None:
+        container = _containers[path] = FrameContainer(path)
+    return container
+
+# (depth uint16 image, RGB color image) of a frame source
+def load_images(source):
+    kind, location, item = source
+    if kind == 'container':
+        depth, color = _container(location).frame(item)
+        return depth, color[:, :, ::-1]  # Stored as BGR
+    depth = cv2.imread(location, cv2.IMREAD_UNCHANGED)
+    color = cv2.imread(item, cv2.IMREAD_COLOR)
+    if depth is None or color is None:
+        raise ValueError(f"Could not read {location} or {item}")
+    return depth, color[:, :, ::-1]
+
+# Identity of the files a frame is read from, for the cache key
+def source_identity(source):
+    kind, location, item = source
+    if kind == 'container':
+        return [file_identity(os.path.join(location, CONTAINER_INDEX)), item]
+    return [file_identity(location), file_identity(item)]
+
+def project_frame(epoch_time, source, transformation_matrix):
+    # The spans only record anything when the frames are projected in the profiling process
+    cache = _settings['cache']
+    if cache is None:
+        with span('load'):
+            depth, color = load_images(source)
+        with span('convert'):
+            points, colors = _settings['projector'].project(depth, color, transformation_matrix)
+        return epoch_time, points, colors
+
+    key = cache.key(source_identity(source))
+    with span('load'):
+        cached = cache.get(key)
+    if cached is None:
+        with span('load'):
+            depth, color = load_images(source)
+        with span('convert'):
+            cached = _settings['projector'].project_camera(depth, color)
+        with span('write'):
+            cache.put(key, *cached)
+    points, colors = cached
+    with span('convert'):
+        points, colors = transform_points(points, transformation_matrix), colors / 255.0
+    return epoch_time, points, colors
+
+# One scheduling unit: a list of tasks processed back to back by the same worker
+def project_chunk(tasks):
+    return [project_frame(*task) for task in tasks]
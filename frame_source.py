@@ -0,0 +1,327 @@
+# Frame sources for the recorder capture loop.
+# The capture loop only needs read() to return the next aligned depth/color pair, so the live
+# RealSense camera (RealSenseSource in 1_friendly_realsense_recorder.py) can be swapped for a replay
+# of an earlier recording or a synthetic generator. That way the writer and preview code can be
+# profiled and regression tested on a machine without a D405.
+#
+# Benchmark example (headless, no camera needed):
+#   python frame_source.py --synthetic 640x480 --frames 900 --output bench_recording/
+#   python frame_source.py --replay friendly_recorder/ --speed 0 --output bench_recording/
+
+import numpy as np
+import cv2
+import json
+import os
+import time
+import argparse
+import shutil
+from collections import namedtuple
+from os.path import exists, join
+
+from frame_container import FrameContainer, ContainerSink, is_container
+from frame_writer import FrameWriter, ImageFolderSink, FullQueuePolicy
+from capture_stats import CaptureStats
+
+Frame = namedtuple('Frame', ['frame_number', 'timestamp', 'timestamp_domain', 'depth_image', 'color_image'])
+
+class FrameSource:
+    depth_scale = 0.001
+    # Sources that can break a read() down into stages (see capture_stats.py) fill this in,
+    # e.g. {'wait': 0.030, 'align': 0.004, 'convert': 0.001} in seconds
+    last_timings = None
+
+    def start(self):
+        pass
+
+    # Returns the next Frame, or None when the source has no more frames
+    def read(self):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def save_intrinsics(self, filename, fps, stream_length_usec):
+        raise NotImplementedError
+
+# Sleeps until a frame with the given timestamp (ms) is due, relative to the first frame played.
+# speed is a multiplier on real time; 0 means as fast as possible.
+class _Pacer:
+    def __init__(self, speed):
+        self.speed = speed
+        self.first_timestamp = None
+        self.start = None
+
+    def wait(self, timestamp):
+        if self.speed <= 0:
+            return
+        now = time.perf_counter()
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamp
+            self.start = now
+            return
+        due = self.start + (timestamp - self.first_timestamp) / 1000.0 / self.speed
+        if due > now:
+            time.sleep(due - now)
+
+def _write_intrinsics(filename, data, fps, stream_length_usec):
+    data = dict(data)
+    data["fps"] = fps
+    data["stream_length_usec"] = stream_length_usec
+    with open(filename, 'w') as outfile:
+        json.dump(data, outfile, indent=4)
+
+# Plays back a recorder output folder, either the depth/ + color/ image folders or a frames/ container
+class ReplaySource(FrameSource):
+    def __init__(self, recording_folder, speed=1.0, preload=False, loop_count=1):
+        self.recording_folder = recording_folder
+        self.speed = speed
+        self.loop_count = loop_count
+        self.container = None
+        self.cache = None
+
+        intrinsic_path = join(recording_folder, "camera_intrinsic.json")
+        self.intrinsics = None
+        if exists(intrinsic_path):
+            with open(intrinsic_path, 'r') as f:
+                self.intrinsics = json.load(f)
+            self.depth_scale = self.intrinsics.get("depth_scale", self.depth_scale)
+
+        frames_folder = join(recording_folder, "frames")
+        if is_container(frames_folder):
+            self.container = FrameContainer(frames_folder)
+            self.timestamps = self.container.timestamps.tolist()
+            self.frame_numbers = self.container.index['frame_number'].tolist()
+        else:
+            self.path_depth = join(recording_folder, "depth")
+            self.path_color = join(recording_folder, "color")
+            self.timestamps = sorted(int(os.path.splitext(f)[0]) for f in os.listdir(self.path_depth)
+                                     if f.endswith(".png") and exists(join(self.path_color, os.path.splitext(f)[0] + ".jpg")))
+            # Image folders only keep the timestamps, the frames are numbered in recording order
+            self.frame_numbers = list(range(1, len(self.timestamps) + 1))
+        if not self.timestamps:
+            raise ValueError(f"No frames found in {recording_folder}")
+
+        # Decoding up front keeps PNG/JPG decode time out of a max speed benchmark
+        if preload:
+            self.cache = [self._load(i) for i in range(len(self.timestamps))]
+
+    def _load(self, i):
+        if self.container is not None:
+            depth_image, color_image = self.container.frame(i)
+            return np.array(depth_image), np.array(color_image)
+        name = f"{self.timestamps[i]}"
+        depth_image = cv2.imread(join(self.path_depth, name + ".png"), cv2.IMREAD_UNCHANGED)
+        color_image = cv2.imread(join(self.path_color, name + ".jpg"), cv2.IMREAD_COLOR)
+        return depth_image, color_image
+
+    def start(self):
+        self.position = 0
+        self.pacer = _Pacer(self.speed)
+        self.timestamp_offset = 0.0
+        self.frame_number_offset = 0
+
+    def read(self):
+        count = len(self.timestamps)
+        if self.position >= count * self.loop_count:
+            return None
+        i = self.position % count
+        if i == 0 and self.position > 0:
+            # Keep timestamps increasing when looping over the recording
+            period = (self.timestamps[-1] - self.timestamps[0]) * count / max(1, count - 1)
+            self.timestamp_offset += period
+            self.frame_number_offset += self.frame_numbers[-1] - self.frame_numbers[0] + 1
+        self.position += 1
+
+        depth_image, color_image = self.cache[i] if self.cache is not None else self._load(i)
+        timestamp = self.timestamps[i] + self.timestamp_offset
+        self.pacer.wait(timestamp)
+        # The recorded frame numbers, so dropped frames of the recording still show up as gaps
+        frame_number = self.frame_numbers[i] + self.frame_number_offset
+        return Frame(frame_number, timestamp, "timestamp_domain.global_time", depth_image, color_image)
+
+    def save_intrinsics(self, filename, fps, stream_length_usec):
+        data = self.intrinsics or synthetic_intrinsics(*self._size())
+        _write_intrinsics(filename, data, fps, stream_length_usec)
+
+    def _size(self):
+        depth_image, _ = self._load(0)
+        return depth_image.shape[1], depth_image.shape[0]
+
+# True when writing a fresh recording to output_folder would delete recording_folder: the same folder,
+# or one inside the other
+def overlaps_recording(output_folder, recording_folder):
+    output_folder = os.path.realpath(output_folder)
+    recording_folder = os.path.realpath(recording_folder)
+    return os.path.commonpath([output_folder, recording_folder]) in (output_folder, recording_folder)
+
+def synthetic_intrinsics(width, height, depth_scale=0.0001):
+    fx = fy = 0.6 * width
+    return {
+        "color_format": "RGB8",
+        "depth_format": "Z16",
+        "depth_scale": depth_scale,
+        "device_name": "Synthetic",
+        "fps": 0,
+        "height": height,
+        "intrinsic_matrix": [
+            fx, 0.0, 0.0,
+            0.0, fy, 0.0,
+            width / 2.0, height / 2.0, 1.0
+        ],
+        "serial_number": "0",
+        "stream_length_usec": 0,
+        "width": width
+    }
+
+# Generates a tilted plane with a bump moving across it, at real time (speed 1) or as fast as possible (speed 0).
+# A handful of distinct frames are generated up front and cycled so generation cost does not skew benchmarks.
+class SyntheticSource(FrameSource):
+    def __init__(self, width=640, height=480, fps=30, frame_count=300, speed=1.0, depth_scale=0.0001,
+                 distinct_frames=16, start_time_ms=None):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_count = frame_count
+        self.speed = speed
+        self.depth_scale = depth_scale
+        self.start_time_ms = start_time_ms if start_time_ms is not None else time.time() * 1000.0
+        self.frames = [synthetic_frame(width, height, i / max(1, distinct_frames), depth_scale)
+                       for i in range(distinct_frames)]
+
+    def start(self):
+        self.position = 0
+        self.pacer = _Pacer(self.speed)
+
+    def read(self):
+        if self.frame_count is not None and self.position >= self.frame_count:
+            return None
+        depth_image, color_image = self.frames[self.position % len(self.frames)]
+        timestamp = self.start_time_ms + self.position * 1000.0 / self.fps
+        self.position += 1
+        self.pacer.wait(timestamp)
+        return Frame(self.position, timestamp, "timestamp_domain.global_time", depth_image, color_image)
+
+    def save_intrinsics(self, filename, fps, stream_length_usec):
+        _write_intrinsics(filename, synthetic_intrinsics(self.width, self.height, self.depth_scale), fps, stream_length_usec)
+
+# Depth in sensor units (depth_scale meters per unit) and a BGR color image for phase in [0, 1)
+def synthetic_frame(width, height, phase=0.0, depth_scale=0.0001):
+    v, u = np.mgrid[0:height, 0:width].astype(np.float32)
+    distance = 0.25 + 0.10 * u / width + 0.05 * v / height
+    bump_u = width * (0.2 + 0.6 * phase)
+    bump = np.exp(-((u - bump_u) ** 2 + (v - height / 2.0) ** 2) / (2 * (0.08 * width) ** 2))
+    distance -= 0.03 * bump
+    depth_image = np.round(distance / depth_scale).astype(np.uint16)
+
+    color_image = np.empty((height, width, 3), dtype=np.uint8)
+    color_image[:, :, 0] = (255 * v / height).astype(np.uint8)
+    color_image[:, :, 1] = (255 * bump).astype(np.uint8)
+    color_image[:, :, 2] = (255 * u / width).astype(np.uint8)
+    return depth_image, color_image
+
+# The recorder's capture loop: pulls frames from the source and hands them to the writer and the
+# optional preview until the source runs out, max_frames is reached, esc is pressed in the preview
+# or Ctrl+C is hit.
+# Returns the number of captured frames and the last frame.
+def run_capture(source, writer, preview=None, max_frames=None, verbose=True, stats=None):
+    frame_count = 0
+    last_frame = None
+    try:
+        while max_frames is None or frame_count < max_frames:
+            read_start = time.perf_counter()
+            frame = source.read()
+            read_end = time.perf_counter()
+            if frame is None:
+                break
+            last_frame = frame
+
+            writer.submit(frame.frame_number, frame.timestamp, frame.timestamp_domain,
+                          frame.depth_image, frame.color_image)
+
+            if stats is not None:
+                if source.last_timings:
+                    for stage, seconds in source.last_timings.items():
+                        stats.record(stage, seconds)
+                else:
+                    stats.record('wait', read_end - read_start)
+                stats.record('submit', time.perf_counter() - read_end)
+                stats.frame(frame.frame_number, frame.timestamp)
+                stats.maybe_report(writer)
+
+            if verbose:
+                print(f"Queued color + depth image {frame_count:06d} (write queue: {writer.queue_depth()})")
+
+            frame_count += 1
+
+            # Hand the latest frame to the preview thread, it renders whenever it is ready
+            if preview is not None:
+                preview.submit(frame.depth_image, frame.color_image)
+
+                # If 'esc' button pressed in the preview window, escape loop and exit program
+                if preview.exit_requested.is_set():
+                    break
+    except KeyboardInterrupt:
+        print("Recording stopped.")
+    return frame_count, last_frame
+
+def parse_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the recorder writer pipeline without a camera")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--replay", help="recorder output folder to replay")
+    group.add_argument("--synthetic", type=parse_size, help="generate WIDTHxHEIGHT synthetic frames")
+    parser.add_argument("--frames", type=int, default=300, help="number of synthetic frames")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--speed", type=float, default=0.0, help="1 = real time, 0 = as fast as possible")
+    parser.add_argument("--output", default="bench_recording/")
+    parser.add_argument("--container", action="store_true", help="write a frame container instead of images")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--processes", action="store_true")
+    parser.add_argument("--queue", type=int, default=90)
+    parser.add_argument("--policy", default="Block", choices=[p.name for p in FullQueuePolicy])
+    args = parser.parse_args()
+
+    if args.replay:
+        source = ReplaySource(args.replay, speed=args.speed, preload=True)
+        if source.intrinsics and source.intrinsics.get("fps"):
+            args.fps = int(source.intrinsics["fps"])
+    else:
+        source = SyntheticSource(*args.synthetic, fps=args.fps, frame_count=args.frames, speed=args.speed)
+
+    if args.replay and overlaps_recording(args.output, args.replay):
+        parser.error(f"--output {args.output} would overwrite the replayed recording {args.replay}")
+    if exists(args.output):
+        shutil.rmtree(args.output)
+
+    # Peek at the first frame for the image size, then rewind
+    source.start()
+    height, width = source.read().depth_image.shape
+    source.start()
+
+    if args.container:
+        os.makedirs(args.output)
+        sink = ContainerSink(join(args.output, "frames"), width, height)
+    else:
+        os.makedirs(join(args.output, "depth"))
+        os.makedirs(join(args.output, "color"))
+        sink = ImageFolderSink(join(args.output, "depth"), join(args.output, "color"))
+    stats = CaptureStats(args.fps)
+    writer = FrameWriter(sink, workers=args.workers, max_queue=args.queue,
+                         policy=FullQueuePolicy[args.policy], use_processes=args.processes and not args.container,
+                         stats=stats)
+
+    start_time = time.time()
+    frame_count, _ = run_capture(source, writer, verbose=False, stats=stats)
+    capture_time = time.time() - start_time
+    writer_stats = writer.close()
+    total_time = time.time() - start_time
+    source.stop()
+    source.save_intrinsics(join(args.output, "camera_intrinsic.json"), args.fps, int(total_time * 1000000))
+    summary = stats.save(join(args.output, "capture_stats.json"), writer_stats)
+
+    print(f"Captured {frame_count} frames in {capture_time:.2f} s ({frame_count / max(capture_time, 1e-9):.1f} fps)")
+    print(f"All frames written after {total_time:.2f} s ({writer_stats['frames_written'] / max(total_time, 1e-9):.1f} fps)")
+    print(json.dumps(summary, indent=4))
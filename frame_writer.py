@@ -0,0 +1,162 @@
+# Background writer pool for the realsense recorder.
+# Encoding the depth PNG can take longer than one frame interval at 30 fps, so the capture loop
+# only hands frames to a bounded queue and a pool of worker threads (or processes) does the
+# cv2 encoding and the disk writes. Counters for queue depth, encode time and dropped frames
+# are kept so the recorder can report them.
+
+import cv2
+import queue
+import threading
+import time
+from os.path import join
+from enum import IntEnum
+from concurrent.futures import ProcessPoolExecutor
+
+class FullQueuePolicy(IntEnum):
+    Block = 0       # Capture waits until a worker frees a slot (no frames lost, capture may stall)
+    DropOldest = 1  # Discard the oldest queued frame to make room for the new one
+    DropNewest = 2  # Discard the frame that was just captured
+
+# Writes a depth/color pair as <timestamp>.png and <timestamp>.jpg, the layout the rest of the
+# pipeline expects. Kept as a plain picklable class so it can also be used from worker processes.
+class ImageFolderSink:
+    def __init__(self, path_depth, path_color):
+        self.path_depth = path_depth
+        self.path_color = path_color
+
+    def write(self, frame_number, timestamp, domain, depth_image, color_image):
+        timestamp_str = f"{int(timestamp)}"
+        cv2.imwrite(join(self.path_depth, f"{timestamp_str}.png"), depth_image)
+        cv2.imwrite(join(self.path_color, f"{timestamp_str}.jpg"), color_image)
+
+    def close(self):
+        pass
+
+# Runs inside a worker process, returns the time spent encoding/writing in seconds
+def _write_in_process(sink, frame_number, timestamp, domain, depth_image, color_image):
+    start = time.perf_counter()
+    sink.write(frame_number, timestamp, domain, depth_image, color_image)
+    return time.perf_counter() - start
+
+class FrameWriter:
+    def __init__(self, sink, workers=2, max_queue=64, policy=FullQueuePolicy.Block, use_processes=False, stats=None):
+        self.sink = sink
+        # Optional CaptureStats that receives the per-frame encode/write time
+        self.policy = FullQueuePolicy(policy)
+        self.queue = queue.Queue(maxsize=max(1, max_queue))
+        self.lock = threading.Lock()
+        self.capture_stats = stats
+
+        self.frames_submitted = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.write_errors = 0
+        self.max_queue_depth = 0
+        self.encode_time_total = 0.0
+        self.encode_time_max = 0.0
+
+        workers = max(1, workers)
+        self.executor = ProcessPoolExecutor(max_workers=workers) if use_processes else None
+        self.threads = [threading.Thread(target=self._worker, name=f"frame-writer-{i}", daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    # Queue a frame pair for writing. The images must not be reused by the caller afterwards
+    # (copy librealsense buffers before submitting). Returns False if a frame was dropped.
+    def submit(self, frame_number, timestamp, domain, depth_image, color_image):
+        item = (frame_number, timestamp, domain, depth_image, color_image)
+        with self.lock:
+            self.frames_submitted += 1
+
+        if self.policy == FullQueuePolicy.Block:
+            self.queue.put(item)
+            accepted = True
+        elif self.policy == FullQueuePolicy.DropNewest:
+            try:
+                self.queue.put_nowait(item)
+                accepted = True
+            except queue.Full:
+                self._count_drop()
+                accepted = False
+        else:
+            accepted = True
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.queue.task_done()
+                        self._count_drop()
+                        accepted = False
+                    except queue.Empty:
+                        pass
+
+        depth = self.queue.qsize()
+        with self.lock:
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+        return accepted
+
+    def _count_drop(self):
+        with self.lock:
+            self.frames_dropped += 1
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            try:
+                if self.executor is not None:
+                    elapsed = self.executor.submit(_write_in_process, self.sink, *item).result()
+                else:
+                    start = time.perf_counter()
+                    self.sink.write(*item)
+                    elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.frames_written += 1
+                    self.encode_time_total += elapsed
+                    self.encode_time_max = max(self.encode_time_max, elapsed)
+                if self.capture_stats is not None:
+                    self.capture_stats.record('write', elapsed)
+            except Exception as e:
+                with self.lock:
+                    self.write_errors += 1
+                print(f"Error writing frame {item[0]}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        with self.lock:
+            written = self.frames_written
+            return {
+                "frames_submitted": self.frames_submitted,
+                "frames_written": written,
+                "frames_dropped": self.frames_dropped,
+                "write_errors": self.write_errors,
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "queue_capacity": self.queue.maxsize,
+                "encode_time_mean_ms": (self.encode_time_total / written * 1000.0) if written else 0.0,
+                "encode_time_max_ms": self.encode_time_max * 1000.0,
+                "policy": self.policy.name,
+                "workers": len(self.threads),
+            }
+
+    # Waits for every queued frame to be written, then stops the workers
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.sink.close()
+        return self.stats()
@@ -0,0 +1,36 @@
+# Pose-driven keyframe selection for the PLY builder.
+# While the torch dwells the robot stands still and the camera keeps recording the same view. Using the
+# registered pose of every frame, select_keyframes() keeps a frame only when the camera has moved at
+# least min_translation (mm) or turned at least min_rotation (degrees) since the last kept frame, and
+# optionally no more than max_fps frames per second. A threshold of 0 is not used; with both at 0 every
+# frame counts as moved.
+
+import numpy as np
+
+# Angle in degrees of the rotation between the rotation parts of two poses
+def rotation_angle(T0, T1):
+    cos_angle = (np.trace(T0[:3, :3].T @ T1[:3, :3]) - 1.0) / 2.0
+    return np.degrees(np.arccos(np.clip(cos_angle, -1.0, 1.0)))
+
+# timestamps (N,) ms in ascending order, poses (N,4,4). Returns a boolean mask of the frames to keep;
+# the first frame is always kept.
+def select_keyframes(timestamps, poses, min_translation=0.0, min_rotation=0.0, max_fps=0.0):
+    keep = np.zeros(len(timestamps), dtype=bool)
+    if len(timestamps) == 0:
+        return keep
+    min_interval = 1000.0 / max_fps if max_fps > 0 else 0.0
+    translations = np.asarray(poses)[:, :3, 3]
+
+    last = 0
+    keep[0] = True
+    for i in range(1, len(timestamps)):
+        if timestamps[i] - timestamps[last] < min_interval:
+            continue
+        if min_translation > 0 or min_rotation > 0:
+            moved = ((min_translation > 0 and np.linalg.norm(translations[i] - translations[last]) >= min_translation) or
+                     (min_rotation > 0 and rotation_angle(poses[last], poses[i]) >= min_rotation))
+            if not moved:
+                continue
+        keep[i] = True
+        last = i
+    return keep
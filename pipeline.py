@@ -0,0 +1,328 @@
+# Non-interactive runner for the post-processing stages, for batch runs over many recordings.
+# Reads a JSON config instead of prompting, and runs, in one process and per recording:
+#   transformations  stage 2, RSI log -> transformations.traj
+#   check            stage 3 without a display: check_summary.json (pose count, time span, gaps, extent)
+#                    and optionally the exported animation
+#   ply              stage 4, frames + poses -> point cloud
+# The transformations are handed to the later stages in memory. Heavy libraries (pandas, matplotlib,
+# OpenCV) are only imported when a stage that needs them actually runs.
+#
+# Every stage gets a key made of its input files (content hashes; image folders by name, size and
+# modification time), its settings and the key of the stage it depends on. The keys of the last run are
+# kept in pipeline_state.json in the output folder, and a stage whose key and outputs are unchanged is
+# skipped. Content hashes are cached by (size, modification time), so unchanged logs are not re-read.
+#
+# Config (relative paths are relative to the config file; settings in "defaults" apply to every
+# recording and can be overridden per recording, see DEFAULT_SETTINGS):
+#   {
+#       "defaults": {"voxel_size": 1.0, "max_distance": 0.5, "animation": "animation.gif"},
+#       "recordings": [
+#           {"rsi_log": "run1/robot_data.rsilog", "recording": "run1/friendly_recorder", "output": "run1/out"},
+#           {"rsi_log": "run2/robot_data.csv", "depth_folder": "run2/depth", "color_folder": "run2/color",
+#            "intrinsics": "run2/camera_intrinsic.json", "output": "run2/out", "clock_offset_ms": 12}
+#       ]
+#   }
+#
+#   python pipeline.py batch.json
+#   python pipeline.py batch.json --force ply
+#   python pipeline.py batch.json --profile profile      (stage timings and memory, see stage_profiler.py)
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sys
+import stage_profiler
+import time
+
+STAGES = ['transformations', 'check', 'ply']
+STATE_FILE = "pipeline_state.json"
+
+DEFAULT_SETTINGS = {
+    "stages": STAGES,
+    # check
+    "gap_warning_ms": 100,
+    "animation": None,  # e.g. "animation.gif" or "animation.mp4", written to the output folder
+    "animation_stride": 10,
+    "animation_width": 640,
+    "animation_height": 480,
+    "animation_fps": 30,
+    # ply
+    "point_cloud": "combined.ply",
+    "clock_offset_ms": 0.0,
+    "interpolate_poses": True,
+    "min_translation": 0.0,
+    "min_rotation": 0.0,
+    "max_fps": 0.0,
+    "min_distance": 0.070,
+    "max_distance": 0.500,
+    "voxel_size": 1.0,
+    "tile_size": 0.0,
+    "max_vertices": 0,
+    # Do not change the results, so they are left out of the stage keys
+    "workers": None,
+    "chunk_size": 8,
+    "cache_folder": None,
+    "cache_gb": 10.0,
+}
+
+# Settings each stage's output depends on
+STAGE_SETTINGS = {
+    'transformations': [],
+    'check': ["gap_warning_ms", "animation", "animation_stride", "animation_width", "animation_height", "animation_fps"],
+    'ply': ["point_cloud", "clock_offset_ms", "interpolate_poses", "min_translation", "min_rotation", "max_fps",
+            "min_distance", "max_distance", "voxel_size", "tile_size", "max_vertices"],
+}
+
+def _key(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+# Content hash of a file, reused from hash_cache while its size and modification time are unchanged
+def file_hash(path, hash_cache):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    cached = hash_cache.get(path)
+    if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return cached[2]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    hash_cache[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+# Identity of a frame recording: the index of a frame container (the frames themselves are only ever
+# appended with it), or name, size and modification time of every image in the folders
+def frames_hash(depth_folder, color_folder, hash_cache):
+    from frame_container import CONTAINER_INDEX, CONTAINER_META, is_container
+    if is_container(depth_folder):
+        return _key(file_hash(os.path.join(depth_folder, CONTAINER_META), hash_cache),
+                    file_hash(os.path.join(depth_folder, CONTAINER_INDEX), hash_cache))
+    listing = []
+    for folder in sorted({depth_folder, color_folder}):
+        for entry in sorted(os.scandir(folder), key=lambda entry: entry.name):
+            stat = entry.stat()
+            listing.append([entry.name, stat.st_size, stat.st_mtime_ns])
+    return _key(listing)
+
+# Settings of a recording (defaults, then the recording's own entries) with the input paths resolved
+def recording_settings(recording, defaults, base_folder):
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(defaults)
+    settings.update(recording)
+
+    def resolve(path):
+        return os.path.join(base_folder, path) if path is not None else None
+
+    for name in ["rsi_log", "recording", "depth_folder", "color_folder", "intrinsics", "output", "cache_folder"]:
+        settings[name] = resolve(settings.get(name))
+    if settings["recording"]:
+        # Layout of 1_friendly_realsense_recorder.py: a frames/ container or depth/ and color/ folders
+        frames_folder = os.path.join(settings["recording"], "frames")
+        if os.path.isdir(frames_folder):
+            settings["depth_folder"] = settings["depth_folder"] or frames_folder
+        else:
+            settings["depth_folder"] = settings["depth_folder"] or os.path.join(settings["recording"], "depth")
+            settings["color_folder"] = settings["color_folder"] or os.path.join(settings["recording"], "color")
+        settings["intrinsics"] = settings["intrinsics"] or os.path.join(settings["recording"], "camera_intrinsic.json")
+    settings["color_folder"] = settings["color_folder"] or settings["depth_folder"]
+    if not settings["output"]:
+        raise ValueError("Every recording needs an output folder")
+    settings["name"] = settings.get("name") or os.path.basename(os.path.normpath(settings["output"]))
+    return settings
+
+def load_state(output_folder):
+    try:
+        with open(os.path.join(output_folder, STATE_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"hashes": {}, "stages": {}}
+
+def save_state(output_folder, state):
+    path = os.path.join(output_folder, STATE_FILE)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+def is_current(state, stage, key):
+    entry = state["stages"].get(stage)
+    return bool(entry) and entry["key"] == key and all(os.path.exists(path) for path in entry["outputs"])
+
+# Pose count, time span, gaps and translation extent of a trajectory
+def summarize_trajectory(timestamps, matrices, gap_warning_ms=100):
+    import numpy as np
+    summary = {"poses": int(len(timestamps))}
+    if len(timestamps) == 0:
+        summary["warnings"] = ["The trajectory is empty"]
+        return summary
+    gaps = np.diff(timestamps)
+    translations = np.asarray(matrices[:, :3, 3])
+    steps = np.linalg.norm(np.diff(translations, axis=0), axis=1)
+    summary.update({
+        "first_timestamp": int(timestamps[0]),
+        "last_timestamp": int(timestamps[-1]),
+        "duration_s": float(timestamps[-1] - timestamps[0]) / 1000.0,
+        "median_gap_ms": float(np.median(gaps)) if len(gaps) else 0.0,
+        "max_gap_ms": float(gaps.max()) if len(gaps) else 0.0,
+        "translation_min": translations.min(axis=0).tolist(),
+        "translation_max": translations.max(axis=0).tolist(),
+        "max_step": float(steps.max()) if len(steps) else 0.0,
+    })
+    warnings = []
+    long_gaps = int(np.count_nonzero(gaps > gap_warning_ms))
+    if long_gaps:
+        warnings.append(f"{long_gaps} gaps longer than {gap_warning_ms} ms (longest {summary['max_gap_ms']:.0f} ms)")
+    summary["warnings"] = warnings
+    return summary
+
+def run_transformations(settings, trajectory_path):
+    import numpy as np
+    from trajectory_store import Trajectory
+    process_rsi = importlib.import_module('2_process_rsi_to_transformations')
+
+    timestamp_chunks = []
+    matrix_chunks = []
+    count = process_rsi.process_csv(settings["rsi_log"], trajectory_path,
+                                    on_chunk=lambda timestamps, matrices: (timestamp_chunks.append(timestamps),
+                                                                           matrix_chunks.append(matrices)))
+    if count is None:
+        raise RuntimeError(f"Could not convert {settings['rsi_log']}")
+    timestamps = np.concatenate(timestamp_chunks)
+    matrices = np.concatenate(matrix_chunks)
+    # Same order as the file: the writer sorts by timestamp when the log was not in order
+    if np.any(np.diff(timestamps) < 0):
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, matrices = timestamps[order], matrices[order]
+    return Trajectory(timestamps, matrices, {})
+
+def run_check(settings, trajectory, trajectory_path, summary_path, animation_path):
+    summary = summarize_trajectory(trajectory.timestamps, trajectory.matrices, settings["gap_warning_ms"])
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=4)
+    for warning in summary["warnings"]:
+        print(f"Warning: {warning}")
+    if animation_path:
+        from trajectory_render import export_animation
+        count = export_animation(trajectory_path, animation_path, settings["animation_stride"],
+                                 width=settings["animation_width"], height=settings["animation_height"],
+                                 fps=settings["animation_fps"], workers=settings["workers"])
+        print(f"Wrote {count} frames to {animation_path}")
+
+def run_ply(settings, trajectory, output_path):
+    from pose_index import PoseIndex
+    process_frames = importlib.import_module('4_process_frames_to_ply')
+    with open(settings["intrinsics"], 'r') as f:
+        intrinsics_data = json.load(f)
+    pose_index = PoseIndex.from_trajectory(trajectory, settings["clock_offset_ms"])
+    output_paths, _ = process_frames.build_point_cloud(
+        settings["depth_folder"], settings["color_folder"], pose_index, intrinsics_data, output_path,
+        settings["interpolate_poses"], settings["workers"], settings["chunk_size"], settings["min_translation"],
+        settings["min_rotation"], settings["max_fps"], settings["min_distance"], settings["max_distance"],
+        settings["voxel_size"], settings["cache_folder"], int(settings["cache_gb"] * 1024 ** 3),
+        settings["tile_size"], settings["max_vertices"])
+    return output_paths
+
+# Runs the stages of one recording, skipping those that are up to date. force lists stages to re-run
+# anyway. Returns {stage: 'ran' | 'skipped'}.
+def run_recording(settings, force=()):
+    output_folder = settings["output"]
+    os.makedirs(output_folder, exist_ok=True)
+    state = load_state(output_folder)
+    hashes = state["hashes"]
+    stages = settings["stages"]
+    results = {}
+
+    trajectory_path = os.path.join(output_folder, "transformations.traj")
+    trajectory = None
+
+    def stage_settings(stage):
+        return {name: settings[name] for name in STAGE_SETTINGS[stage]}
+
+    def finish(stage, key, outputs, started):
+        state["stages"][stage] = {"key": key, "outputs": outputs}
+        save_state(output_folder, state)
+        results[stage] = 'ran'
+        print(f"[{settings['name']}] {stage} done in {time.time() - started:.1f} s")
+
+    def skip(stage):
+        results[stage] = 'skipped'
+        print(f"[{settings['name']}] {stage} is up to date")
+
+    # Stage 2. The later stages depend on its key, so it is computed even when the stage is not run.
+    with stage_profiler.span('hash'):
+        transformations_key = _key('transformations', file_hash(settings["rsi_log"], hashes))
+    if 'transformations' in stages:
+        if 'transformations' not in force and is_current(state, 'transformations', transformations_key):
+            skip('transformations')
+        else:
+            started = time.time()
+            trajectory = run_transformations(settings, trajectory_path)
+            finish('transformations', transformations_key, [trajectory_path], started)
+
+    def current_trajectory():
+        nonlocal trajectory
+        if trajectory is None:
+            from trajectory_store import load_trajectory
+            trajectory = load_trajectory(trajectory_path)  # Memory mapped, nothing is parsed
+        return trajectory
+
+    if 'check' in stages:
+        summary_path = os.path.join(output_folder, "check_summary.json")
+        animation_path = os.path.join(output_folder, settings["animation"]) if settings["animation"] else None
+        key = _key('check', transformations_key, stage_settings('check'))
+        if 'check' not in force and is_current(state, 'check', key):
+            skip('check')
+        else:
+            started = time.time()
+            with stage_profiler.span('check'):
+                run_check(settings, current_trajectory(), trajectory_path, summary_path, animation_path)
+            finish('check', key, [summary_path] + ([animation_path] if animation_path else []), started)
+
+    if 'ply' in stages:
+        with stage_profiler.span('hash'):
+            key = _key('ply', transformations_key, stage_settings('ply'),
+                       frames_hash(settings["depth_folder"], settings["color_folder"], hashes),
+                       file_hash(settings["intrinsics"], hashes))
+        if 'ply' not in force and is_current(state, 'ply', key):
+            skip('ply')
+        else:
+            started = time.time()
+            output_paths = run_ply(settings, current_trajectory(), os.path.join(output_folder, settings["point_cloud"]))
+            finish('ply', key, output_paths, started)
+    return results
+
+def load_config(config_path):
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    base_folder = os.path.dirname(os.path.abspath(config_path))
+    defaults = config.get("defaults", {})
+    recordings = config.get("recordings", [config] if "rsi_log" in config else [])
+    return [recording_settings(recording, defaults, base_folder) for recording in recordings]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the post-processing stages for the recordings of a config file")
+    parser.add_argument("config", help="JSON config, see the top of pipeline.py")
+    parser.add_argument("--force", nargs='*', choices=STAGES, default=[],
+                        help="re-run these stages (all when given without names) even if they are up to date")
+    parser.add_argument("--profile", help="profile the stages and save the results under this prefix")
+    args = parser.parse_args()
+    force = STAGES if args.force == [] and '--force' in sys.argv else args.force
+
+    if args.profile:
+        stage_profiler.enable()
+    failed = []
+    for settings in load_config(args.config):
+        try:
+            run_recording(settings, force)
+        except Exception as e:
+            # One broken recording should not stop an overnight batch
+            print(f"[{settings['name']}] failed: {e}")
+            failed.append(settings["name"])
+    if args.profile:
+        profiler = stage_profiler.disable()
+        print(profiler.summary())
+        print(f"Saved {', '.join(profiler.save(args.profile))}")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,155 @@
+# Streaming binary PLY output for the PLY builder.
+# PlyStreamWriter appends vertices to a binary little endian PLY as they are produced and patches the
+# vertex count into the header when it is closed, so a cloud never has to be held in memory to be
+# saved. The count field in the header is written fixed width for that reason.
+#
+# SplitPlyWriter spreads the vertices over several PLY files, either by spatial tile (cubes of
+# tile_size) or in parts of at most max_vertices, for clouds too large for one file or one viewer.
+# Small tiles can mean thousands of files, so at most max_open_files of them are kept open; the least
+# recently written one is suspended and reopened for appending when it gets vertices again.
+#
+# Vertices are stored as float32 x, y, z and uint8 red, green, blue.
+
+import numpy as np
+import os
+from collections import OrderedDict
+
+VERTEX_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+_COUNT_WIDTH = 12
+
+def _header(count):
+    return ("ply\n"
+            "format binary_little_endian 1.0\n"
+            "comment written by ply_stream.py\n"
+            f"element vertex {count:0{_COUNT_WIDTH}d}\n"
+            "property float x\n"
+            "property float y\n"
+            "property float z\n"
+            "property uchar red\n"
+            "property uchar green\n"
+            "property uchar blue\n"
+            "end_header\n").encode('ascii')
+
+# points (N,3), colors (N,3) in [0, 1] (or None for white) -> VERTEX_DTYPE records
+def to_vertices(points, colors=None):
+    vertices = np.empty(len(points), dtype=VERTEX_DTYPE)
+    vertices['x'], vertices['y'], vertices['z'] = np.asarray(points, dtype=np.float32).T
+    if colors is None or len(colors) != len(points):
+        rgb = np.full((len(points), 3), 255, dtype=np.uint8)
+    else:
+        rgb = np.clip(np.rint(np.asarray(colors) * 255.0), 0, 255).astype(np.uint8)
+    vertices['red'], vertices['green'], vertices['blue'] = rgb.T
+    return vertices
+
+class PlyStreamWriter:
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.file = open(path, 'wb')
+        self.file.write(_header(0))
+
+    def write(self, points, colors=None):
+        if len(points) == 0:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'ab')  # Reopened after suspend()
+        self.file.write(to_vertices(points, colors).tobytes())
+        self.count += len(points)
+
+    # Closes the file handle; the next write reopens the file and appends
+    def suspend(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        self.suspend()
+        with open(self.path, 'r+b') as f:
+            f.write(_header(self.count))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Writes path itself, or path_tile_<x>_<y>_<z>.ply / path_part_<n>.ply files when splitting
+class SplitPlyWriter:
+    def __init__(self, path, tile_size=0, max_vertices=0, max_open_files=64):
+        self.path = path
+        self.base, self.extension = os.path.splitext(path)
+        self.extension = self.extension or '.ply'
+        self.tile_size = tile_size
+        self.max_vertices = max_vertices
+        self.max_open_files = max(max_open_files, 1)
+        self.writers = {}
+        self.open_keys = OrderedDict()  # Keys of the writers with an open file, least recently used first
+        self.closed_writers = []
+        self.count = 0
+
+    def _writer(self, key):
+        writer = self.writers.get(key)
+        if writer is None:
+            if key is None:
+                path = self.path
+            elif self.tile_size:
+                path = f"{self.base}_tile_{key[0]}_{key[1]}_{key[2]}{self.extension}"
+            else:
+                path = f"{self.base}_part_{key:05d}{self.extension}"
+            writer = self.writers[key] = PlyStreamWriter(path)
+        self.open_keys[key] = None
+        self.open_keys.move_to_end(key)
+        while len(self.open_keys) > self.max_open_files:
+            least_recent, _ = self.open_keys.popitem(last=False)
+            self.writers[least_recent].suspend()
+        return writer
+
+    def _write_parts(self, points, colors):
+        start = 0
+        while start < len(points):
+            key = len(self.closed_writers)
+            writer = self._writer(key)
+            take = min(len(points) - start, self.max_vertices - writer.count)
+            writer.write(points[start:start + take], None if colors is None else colors[start:start + take])
+            start += take
+            if writer.count >= self.max_vertices:
+                # Part full, close it now so only one file is open at a time
+                writer.close()
+                self.open_keys.pop(key, None)
+                self.closed_writers.append(self.writers.pop(key))
+
+    def write(self, points, colors=None):
+        if len(points) == 0:
+            return
+        self.count += len(points)
+        if self.tile_size:
+            tiles = np.floor(np.asarray(points) / self.tile_size).astype(np.int64)
+            unique, inverse = np.unique(tiles, axis=0, return_inverse=True)
+            # Group the points by tile once (stable, so each tile keeps the input order) and split the groups
+            order = np.argsort(inverse.reshape(-1), kind='stable')
+            ends = np.cumsum(np.bincount(inverse.reshape(-1), minlength=len(unique)))
+            points = np.asarray(points)[order]
+            colors = None if colors is None else np.asarray(colors)[order]
+            start = 0
+            for tile, end in zip(unique, ends):
+                self._writer(tuple(tile.tolist())).write(points[start:end], None if colors is None else colors[start:end])
+                start = end
+        elif self.max_vertices:
+            self._write_parts(points, colors)
+        else:
+            self._writer(None).write(points, colors)
+
+    # Paths of all files written
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.closed_writers.extend(self.writers.values())
+        self.writers = {}
+        self.open_keys.clear()
+        return [writer.path for writer in self.closed_writers]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,53 @@
+# Batched pose math shared by the post-processing stages.
+# Converts whole columns of KUKA X/Y/Z/A/B/C poses to (N,4,4) transformation matrices in a few
+# vectorized numpy operations instead of one matrix product per row.
+
+import numpy as np
+
+# KUKA convention:
+# R = Rz(C) @ Ry(B) @ Rx(A), angles in degrees, translation in the last column
+def euler_to_matrices(x, y, z, a, b, c):
+    x, y, z, a, b, c = (np.asarray(v, dtype=np.float64) for v in (x, y, z, a, b, c))
+    a, b, c = np.radians(a), np.radians(b), np.radians(c)
+    ca, sa = np.cos(a), np.sin(a)
+    cb, sb = np.cos(b), np.sin(b)
+    cc, sc = np.cos(c), np.sin(c)
+
+    T = np.zeros(x.shape + (4, 4))
+    T[..., 0, 0] = cc * cb
+    T[..., 0, 1] = cc * sb * sa - sc * ca
+    T[..., 0, 2] = cc * sb * ca + sc * sa
+    T[..., 1, 0] = sc * cb
+    T[..., 1, 1] = sc * sb * sa + cc * ca
+    T[..., 1, 2] = sc * sb * ca - cc * sa
+    T[..., 2, 0] = -sb
+    T[..., 2, 1] = cb * sa
+    T[..., 2, 2] = cb * ca
+    T[..., 0, 3] = x
+    T[..., 1, 3] = y
+    T[..., 2, 3] = z
+    T[..., 3, 3] = 1.0
+    return T
+
+# Inverse of rigid transforms (single (4,4) or (N,4,4)) in closed form: [R^T | -R^T t]
+def invert_rigid(T):
+    T = np.asarray(T, dtype=np.float64)
+    R_t = np.swapaxes(T[..., :3, :3], -1, -2)
+    inverse = np.zeros_like(T)
+    inverse[..., :3, :3] = R_t
+    inverse[..., :3, 3] = -(R_t @ T[..., :3, 3:4])[..., 0]
+    inverse[..., 3, 3] = 1.0
+    return inverse
+
+# Transforms of every pose relative to reference_T (the first pose by default): inv(reference) @ T
+def relative_transforms(T, reference_T=None):
+    T = np.asarray(T, dtype=np.float64)
+    if reference_T is None:
+        reference_T = T[0]
+    return invert_rigid(reference_T) @ T
+
+# (N,6) block of X, Y, Z, A, B, C columns -> (N,4,4) poses relative to the first one
+def poses_to_relative_transforms(xyzabc, reference_T=None):
+    xyzabc = np.asarray(xyzabc, dtype=np.float64)
+    T = euler_to_matrices(*xyzabc.T)
+    return relative_transforms(T, reference_T)
@@ -0,0 +1,84 @@
+# Timestamp-indexed robot pose lookup for registering camera frames.
+# Built once on the sorted timestamps of a trajectory (see trajectory_store.py). Queries are batches of
+# frame timestamps answered with np.searchsorted, either snapped to the nearest robot pose (what
+# find_closest_transformation() did with min() over every pose) or interpolated at the exact frame time:
+# linear interpolation of the translation, SLERP of the rotation between the two poses around it.
+#
+# Camera and robot clocks are not synchronised; clock_offset_ms is added to every frame timestamp
+# before the lookup (robot time = camera time + clock_offset_ms).
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+class PoseIndex:
+    # timestamps (N,) ascending EPOCH ms, matrices (N,4,4)
+    def __init__(self, timestamps, matrices, clock_offset_ms=0.0):
+        self.timestamps = np.asarray(timestamps)
+        self.matrices = matrices
+        self.clock_offset_ms = clock_offset_ms
+        if len(self.timestamps) == 0:
+            raise ValueError("PoseIndex needs at least one pose")
+        if np.any(np.diff(self.timestamps) < 0):
+            raise ValueError("PoseIndex needs timestamps in ascending order")
+
+    @classmethod
+    def from_trajectory(cls, trajectory, clock_offset_ms=0.0):
+        return cls(trajectory.timestamps, trajectory.matrices, clock_offset_ms)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _robot_times(self, frame_times):
+        return np.asarray(frame_times, dtype=np.float64) + self.clock_offset_ms
+
+    # Index of the closest pose for every frame time; ties go to the earlier pose
+    def nearest_indices(self, frame_times):
+        times = self._robot_times(frame_times)
+        after = np.clip(np.searchsorted(self.timestamps, times, side='left'), 1, len(self.timestamps) - 1)
+        before = after - 1
+        if len(self.timestamps) == 1:
+            return np.zeros(times.shape, dtype=np.intp)
+        take_before = np.abs(times - self.timestamps[before]) <= np.abs(self.timestamps[after] - times)
+        return np.where(take_before, before, after)
+
+    # (M,4,4) closest robot pose for every frame time
+    def nearest(self, frame_times):
+        return np.asarray(self.matrices[self.nearest_indices(frame_times)])
+
+    # Distance in ms from every frame time to its closest pose, to spot frames outside the robot log
+    def time_to_nearest(self, frame_times):
+        times = self._robot_times(frame_times)
+        return np.abs(times - self.timestamps[self.nearest_indices(frame_times)])
+
+    # (M,4,4) poses at the exact frame times. Frames before the first or after the last pose get the
+    # first or last pose.
+    def interpolate(self, frame_times):
+        times = self._robot_times(frame_times)
+        if len(self.timestamps) == 1:
+            return np.repeat(np.asarray(self.matrices[:1]), len(times), axis=0)
+
+        after = np.clip(np.searchsorted(self.timestamps, times, side='right'), 1, len(self.timestamps) - 1)
+        before = after - 1
+        t0 = self.timestamps[before].astype(np.float64)
+        t1 = self.timestamps[after].astype(np.float64)
+        span = t1 - t0
+        alpha = np.clip(np.divide(times - t0, span, out=np.zeros_like(times), where=span > 0), 0.0, 1.0)
+
+        T0 = np.asarray(self.matrices[before])
+        T1 = np.asarray(self.matrices[after])
+        result = np.zeros_like(T0)
+        result[:, :3, 3] = T0[:, :3, 3] + alpha[:, None] * (T1[:, :3, 3] - T0[:, :3, 3])
+
+        # SLERP: rotate from R0 by the fraction alpha of the rotation taking R0 to R1
+        R0 = R.from_matrix(T0[:, :3, :3])
+        R1 = R.from_matrix(T1[:, :3, :3])
+        step = R.from_rotvec((R0.inv() * R1).as_rotvec() * alpha[:, None])
+        result[:, :3, :3] = (R0 * step).as_matrix()
+        result[:, 3, 3] = 1.0
+        return result
+
+    def lookup(self, frame_times, interpolate=False):
+        frame_times = np.atleast_1d(frame_times)
+        if len(frame_times) == 0:
+            return np.zeros((0, 4, 4))
+        return self.interpolate(frame_times) if interpolate else self.nearest(frame_times)
@@ -0,0 +1,304 @@
+# asyncio RSI receiver for one or more robots.
+# Each robot gets its own UDP endpoint (asyncio DatagramProtocol) and its own log file. Datagrams are
+# parsed in the event loop (see rsi_parser.py) and handed to a per-robot writer thread through a queue,
+# so a stalled disk never blocks the sockets: packets pile up in the queue instead of being lost in the
+# socket buffer. Missed RSI cycles are counted from gaps in the IPOC counter, and the time from
+# receiving a datagram to the row being flushed to the log file is reported as
+# receive-to-write latency.
+#
+# Usage (prompts for the endpoints):
+#   python rsi_async_receiver.py
+
+import asyncio
+import numpy as np
+import os
+import queue
+import socket
+import threading
+import time
+from collections import Counter, deque
+
+from rsi_parser import RSIParseError, parse_rsi
+from rsi_log import RSILogWriter, RSICsvWriter
+
+# Counts missed and out of order RSI cycles from the IPOC values of the received packets.
+# Every advance of the highest IPOC is counted by its size, so the missed cycles can be recomputed when the
+# step changes. The recent advances larger than the smallest one seen are kept as holes: a late packet fills
+# its place in the hole, and a hole whose cycles all arrived late no longer counts as a gap. Holes more than
+# reorder_window cycles behind the newest packet are final.
+class IpocTracker:
+    def __init__(self, step=None, reorder_window=10000):
+        # IPOC increase per cycle; inferred as the most common advance when not given
+        self.step = step
+        self.fixed_step = step is not None
+        self.reorder_window = reorder_window
+        self.packets = 0
+        self.first_ipoc = None
+        self.last_ipoc = None
+        self.max_ipoc = None
+        self.advances = Counter()  # IPOC advance of the highest IPOC -> times seen
+        self.min_advance = None
+        self.holes = deque()  # [previous highest IPOC, next IPOC, IPOCs that arrived late], oldest first
+        self.final_filled = 0  # Late cycles and filled gaps of the holes dropped from the window
+        self.final_closed = 0
+        self.out_of_order = 0
+        self.duplicates = 0
+
+    def _missed(self, advance):
+        return max(int(round(advance / self.step)) - 1, 0)
+
+    # Hole containing ipoc, the newest holes are the likeliest
+    def _hole(self, ipoc):
+        for hole in reversed(self.holes):
+            if hole[0] < ipoc < hole[1]:
+                return hole
+            if hole[1] <= ipoc:
+                return None
+        return None
+
+    # (late cycles counted against the missed ones, holes filled completely)
+    def _filled(self, hole):
+        missed = self._missed(hole[1] - hole[0])
+        filled = min(len(hole[2]), missed)
+        return filled, int(missed > 0 and filled == missed)
+
+    def update(self, ipoc):
+        self.packets += 1
+        if self.last_ipoc is None:
+            self.first_ipoc = self.max_ipoc = self.last_ipoc = ipoc
+            return 0
+        delta = ipoc - self.max_ipoc
+        missed = 0
+        if delta <= 0:
+            hole = self._hole(ipoc) if delta < 0 else None
+            if delta == 0 or ipoc == self.last_ipoc or (hole is not None and ipoc in hole[2]):
+                self.duplicates += 1
+            else:
+                # Arrived late; fills its place in the hole it was counted as missed in
+                self.out_of_order += 1
+                if hole is not None:
+                    hole[2].add(ipoc)
+        else:
+            self.advances[delta] += 1
+            if not self.fixed_step and (self.step is None or self.advances[delta] > self.advances[self.step]):
+                self.step = delta
+            if self.min_advance is None or delta < self.min_advance:
+                self.min_advance = delta
+            if delta > self.min_advance:
+                self.holes.append([self.max_ipoc, ipoc, set()])
+            missed = self._missed(delta)
+            self.max_ipoc = ipoc
+            while self.holes and self.max_ipoc - self.holes[0][1] > self.reorder_window * self.step:
+                filled, closed = self._filled(self.holes.popleft())
+                self.final_filled += filled
+                self.final_closed += closed
+        self.last_ipoc = ipoc
+        return missed
+
+    def stats(self):
+        missed_cycles = gaps = 0
+        if self.step:
+            for advance, count in self.advances.items():
+                missed = self._missed(advance)
+                missed_cycles += count * missed
+                gaps += count * (missed > 0)
+            filled, closed = self.final_filled, self.final_closed
+            for hole in self.holes:
+                hole_filled, hole_closed = self._filled(hole)
+                filled += hole_filled
+                closed += hole_closed
+            missed_cycles -= filled
+            gaps -= closed
+        return {"packets": self.packets, "ipoc_step": self.step, "gaps": gaps,
+                "missed_cycles": missed_cycles, "out_of_order": self.out_of_order,
+                "duplicates": self.duplicates, "first_ipoc": self.first_ipoc, "last_ipoc": self.max_ipoc}
+
+# Writes the rows of one robot on its own thread and measures receive-to-write latency: the time until
+# the log's batch containing the row has been flushed to the file
+class RobotSink:
+    def __init__(self, name, log, max_queue=15000, latency_window=5000, idle_flush=1.0):
+        self.name = name
+        self.log = log
+        self.idle_flush = idle_flush  # Seconds without rows after which the log's batch is flushed
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.latencies = deque(maxlen=latency_window)
+        self.unflushed = deque()  # Receive times of the rows still buffered by the log
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.write_errors = 0
+        self.max_queue_depth = 0
+        self.thread = threading.Thread(target=self._run, name=f"rsi-writer-{name}", daemon=True)
+        self.thread.start()
+
+    # Called from the event loop, never blocks
+    def submit(self, row, received):
+        try:
+            self.queue.put_nowait((row, received))
+        except queue.Full:
+            # Only happens when the disk has stalled for longer than the whole queue
+            self.rows_dropped += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_flush)
+            except queue.Empty:
+                item = False
+            if item is None:
+                return
+            try:
+                if item is False:
+                    # The log only flushes when rows arrive; without this the last batch would wait for the
+                    # next packet
+                    self._written(self.log.flush())
+                else:
+                    row, received = item
+                    self.unflushed.append(received)
+                    self._written(self.log.append(row))
+            except Exception as e:
+                # A failed write must not stop the thread, every later row would be lost
+                self.write_errors += 1
+                self.unflushed.clear()
+                print(f"[{self.name}] Failed to write to the log: {e}")
+
+    # The log flushed its oldest buffered rows to the file
+    def _written(self, rows):
+        if not rows:
+            return
+        now = time.perf_counter()
+        for _ in range(min(rows, len(self.unflushed))):
+            self.latencies.append(now - self.unflushed.popleft())
+        self.rows_written += rows
+
+    def latency(self):
+        if not self.latencies:
+            return None
+        latencies_ms = np.array(self.latencies) * 1000.0
+        p50, p99 = np.percentile(latencies_ms, [50, 99])
+        return {"p50_ms": float(p50), "p99_ms": float(p99), "max_ms": float(latencies_ms.max())}
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self._written(self.log.flush())
+        self.log.close()
+
+class RSIProtocol(asyncio.DatagramProtocol):
+    def __init__(self, name, sink, ipoc_step=None, echo=False):
+        self.name = name
+        self.sink = sink
+        self.tracker = IpocTracker(ipoc_step)
+        self.echo = echo
+        self.parse_errors = 0
+
+    def datagram_received(self, data, addr):
+        received = time.perf_counter()
+        timestamp = int(time.time() * 1000)
+        if self.echo:
+            print(f"[{self.name}] Received data from {addr}: {data.decode('utf-8', errors='replace')}")
+        try:
+            row = parse_rsi(data, timestamp)
+        except RSIParseError as e:
+            self.parse_errors += 1
+            print(f"[{self.name}] Failed to parse XML: {e}")
+            return
+        try:
+            self.tracker.update(int(row['IPOC']))
+        except (TypeError, ValueError):
+            pass
+        self.sink.submit(row, received)
+
+    def stats(self):
+        stats = self.tracker.stats()
+        stats.update({"parse_errors": self.parse_errors,
+                      "rows_written": self.sink.rows_written,
+                      "rows_dropped": self.sink.rows_dropped,
+                      "bad_rows": self.sink.log.bad_rows,
+                      "write_errors": self.sink.write_errors,
+                      "queue_depth": self.sink.queue.qsize(),
+                      "max_queue_depth": self.sink.max_queue_depth,
+                      "receive_to_write": self.sink.latency()})
+        return stats
+
+# A large receive buffer lets the socket ride out short event loop pauses without dropping datagrams
+def open_socket(ip, port, receive_buffer=4 * 1024 * 1024):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    except OSError:
+        pass
+    sock.bind((ip, port))
+    sock.setblocking(False)
+    return sock
+
+def open_log(save_dir, name, log_format):
+    if log_format == 'binary':
+        return RSILogWriter(os.path.join(save_dir, f"robot_data_{name}.rsilog"))
+    return RSICsvWriter(os.path.join(save_dir, f"robot_data_{name}.csv"))
+
+def print_status(protocols):
+    for protocol in protocols:
+        stats = protocol.stats()
+        latency = stats["receive_to_write"]
+        latency_str = f"{latency['p50_ms']:.2f}/{latency['p99_ms']:.2f} ms" if latency else "-"
+        print(f"[{protocol.name}] packets {stats['packets']}, missed cycles {stats['missed_cycles']} "
+              f"({stats['gaps']} gaps), out of order {stats['out_of_order']}, queue {stats['queue_depth']}, "
+              f"dropped {stats['rows_dropped']}, bad rows {stats['bad_rows']}, write errors {stats['write_errors']}, "
+              f"receive-to-write p50/p99 {latency_str}")
+
+# endpoints: list of (name, ip, port). Runs until cancelled (Ctrl+C) or for duration seconds.
+async def receive_robots(endpoints, save_dir, log_format='csv', ipoc_step=None, echo=False,
+                         report_interval=10.0, duration=None):
+    loop = asyncio.get_running_loop()
+    os.makedirs(save_dir, exist_ok=True)
+    transports = []
+    protocols = []
+    try:
+        for name, ip, port in endpoints:
+            sink = RobotSink(name, open_log(save_dir, name, log_format))
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda name=name, sink=sink: RSIProtocol(name, sink, ipoc_step, echo), sock=open_socket(ip, port))
+            transports.append(transport)
+            protocols.append(protocol)
+            print(f"[{name}] Listening on {ip}:{port}")
+
+        start = loop.time()
+        while duration is None or loop.time() - start < duration:
+            wait = report_interval if duration is None else min(report_interval, duration - (loop.time() - start))
+            await asyncio.sleep(max(wait, 0))
+            print_status(protocols)
+    finally:
+        for transport in transports:
+            transport.close()
+        for protocol in protocols:
+            protocol.sink.close()
+    return {protocol.name: protocol.stats() for protocol in protocols}
+
+# "name=ip:port, name=ip:port" -> [(name, ip, port), ...]
+def parse_endpoints(text):
+    endpoints = []
+    for index, item in enumerate(text.split(',')):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, address = item.rpartition('=')
+        ip, _, port = address.rpartition(':')
+        endpoints.append((name or f"robot{index + 1}", ip, int(port)))
+    return endpoints
+
+if __name__ == "__main__":
+    desktop = os.path.join(os.path.expanduser("~"), "Desktop")
+    save_dir = os.path.join(desktop, "Experiment Data")
+
+    # IP and port of your computer for each robot (Check the KUKA setup)
+    endpoints = parse_endpoints(input("Robots as name=ip:port, comma separated "
+                                      "(default: robot1=192.168.1.25:59152): ") or "robot1=192.168.1.25:59152")
+    log_format = (input("Log format, csv or binary (default: csv): ") or 'csv').lower()
+    ipoc_step_text = input("IPOC increase per RSI cycle (default: detect): ")
+    ipoc_step = int(ipoc_step_text) if ipoc_step_text else None
+
+    try:
+        asyncio.run(receive_robots(endpoints, save_dir, log_format, ipoc_step))
+    except KeyboardInterrupt:
+        print("Stopped receiving.")
@@ -0,0 +1,239 @@
+# Binary columnar log for the RSI receiver.
+# Formatting ~34 string fields per packet for csv.DictWriter costs more than the rest of the receive
+# loop at RSI rates. RSILogWriter instead collects packets in memory and, once per batch (flush_records
+# packets or flush_interval seconds), converts them in one vectorized pass into fixed-width records
+# (RSI_DTYPE) in a preallocated, memory-mapped file. append() only checks the batch when a row arrives,
+# so the receivers also call flush() when no packet came in for flush_interval seconds.
+# load_rsi_log() maps a finished (or still growing) log as a numpy structured array without parsing
+# anything, and rsi_log_to_csv() produces the usual robot_data.csv layout on demand.
+#
+# File layout:
+#   [0:8]      magic b'RSILOG1\n'
+#   [8:16]     record count (uint64), only updated after the records it covers have been flushed, so
+#              after a crash the file still opens with every record that was completely written
+#   [16:4096]  JSON header (dtype description), zero padded
+#   [4096:]    records, preallocated in blocks of grow_records
+#
+# Convert to CSV:
+#   python rsi_log.py robot_data.rsilog robot_data.csv
+
+import numpy as np
+import csv
+import json
+import mmap
+import struct
+import sys
+import time
+
+from rsi_parser import FIELDNAMES, POSE_KEYS, TECH_KEYS, STATUS_KEYS
+
+MAGIC = b'RSILOG1\n'
+HEADER_SIZE = 4096
+COUNT_OFFSET = 8
+
+# Same columns as robot_data.csv. Positions, Tech values and analog readings are float64 so any
+# value the controller sends survives the round trip; counters and flags are integers.
+INTEGER_FIELDS = ['Timestamp', 'IPOC', 'Delay', 'ErrorNum'] + STATUS_KEYS
+RSI_DTYPE = np.dtype([
+    ('Timestamp', '<i8'),
+    *[(key + '_RIst', '<f8') for key in POSE_KEYS],
+    *[(key + '_RSol', '<f8') for key in POSE_KEYS],
+    ('Delay', '<i4'),
+    ('WeldVolt', '<f8'),
+    ('WeldAmps', '<f8'),
+    ('MotorAmps', '<f8'),
+    ('WFS', '<f8'),
+    ('IPOC', '<i8'),
+    ('ErrorNum', '<i4'),
+    *[(key, '<f8') for key in TECH_KEYS],
+    *[(key, '<i4') for key in STATUS_KEYS],
+])
+assert list(RSI_DTYPE.names) == FIELDNAMES
+
+# Fallback for a batch containing a value np.loadtxt can not parse; unreadable values are stored as 0.
+# A value containing a comma splits into extra fields, so lines are padded with 0 or cut to the record
+# length. Returns (values, True if the line was unreadable or had the wrong number of fields).
+def _line_values(line):
+    texts = line.split(',')
+    bad = len(texts) != len(FIELDNAMES)
+    texts = texts[:len(FIELDNAMES)] + ['0'] * (len(FIELDNAMES) - len(texts))
+    values = []
+    for text in texts:
+        try:
+            values.append(float(text))
+        except ValueError:
+            values.append(0.0)
+            bad = True
+    return values, bad
+
+class RSILogWriter:
+    def __init__(self, path, grow_records=900000, flush_interval=1.0, flush_records=1000):
+        self.path = path
+        self.grow_records = grow_records
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.record_size = RSI_DTYPE.itemsize
+        self.count = 0
+        self.bad_rows = 0  # Rows with values that could not be read, stored with 0 in their place
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+        header = json.dumps({"version": 1, "dtype": RSI_DTYPE.descr, "record_size": self.record_size}).encode()
+        if len(header) > HEADER_SIZE - 16:
+            raise ValueError("RSI log header does not fit")
+        self.file = open(path, 'w+b')
+        self.file.write(MAGIC + struct.pack('<Q', 0) + header.ljust(HEADER_SIZE - 16, b'\0'))
+        self.capacity = 0
+        self.mm = None
+        self._grow()
+
+    # Extends the file by another block of records and remaps it
+    def _grow(self):
+        if self.mm is not None:
+            self.mm.flush()
+            del self.records
+            self.mm.close()
+        self.capacity += self.grow_records
+        self.file.truncate(HEADER_SIZE + self.capacity * self.record_size)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.records = np.ndarray((self.capacity,), dtype=RSI_DTYPE, buffer=self.mm, offset=HEADER_SIZE)
+
+    # row is a dict of strings keyed by FIELDNAMES (Timestamp may be an int), as returned by parse_rsi().
+    # Rows are only joined into a text line here; the conversion to numbers happens once per batch.
+    # Returns the number of rows written to the file by this call (0 while the batch is collecting).
+    def append(self, row):
+        self.pending.append(f"{row['Timestamp']}," + ','.join([row[field] or '0' for field in FIELDNAMES[1:]]))
+        if len(self.pending) >= self.flush_records or time.monotonic() - self.last_flush >= self.flush_interval:
+            return self.flush()
+        return 0
+
+    # Returns the number of rows written
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return 0
+        rows = len(self.pending)
+        try:
+            # numpy's C text parser converts the whole batch straight into records
+            values = np.loadtxt(self.pending, delimiter=',', dtype=RSI_DTYPE, ndmin=1)
+        except ValueError:
+            lines = [_line_values(line) for line in self.pending]
+            values = np.array([tuple(line_values) for line_values, _ in lines], dtype=RSI_DTYPE)
+            bad_rows = sum(bad for _, bad in lines)
+            self.bad_rows += bad_rows
+            print(f"{self.path}: {bad_rows} of {rows} rows had unreadable values, stored as 0 "
+                  f"({self.bad_rows} so far)")
+        self.pending = []
+
+        while self.count + rows > self.capacity:
+            self._grow()
+        self.records[self.count:self.count + rows] = values
+
+        # Records first, then the count that makes them visible
+        self.mm.flush()
+        self.count += rows
+        self.mm[COUNT_OFFSET:COUNT_OFFSET + 8] = struct.pack('<Q', self.count)
+        self.mm.flush(0, mmap.PAGESIZE)
+        return rows
+
+    def close(self):
+        self.flush()
+        del self.records
+        self.mm.close()
+        # Drop the unused preallocated tail
+        self.file.truncate(HEADER_SIZE + self.count * self.record_size)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Same append/flush/close interface as RSILogWriter for the plain robot_data.csv format. Rows are
+# buffered by the file object and handed to the OS once per batch.
+class RSICsvWriter:
+    def __init__(self, path, flush_interval=1.0, flush_records=1000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.pending = 0
+        self.bad_rows = 0  # The CSV keeps the received text, nothing is converted
+        self.last_flush = time.monotonic()
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=FIELDNAMES)
+        self.writer.writeheader()
+
+    def append(self, row):
+        self.writer.writerow(row)
+        self.pending += 1
+        if self.pending >= self.flush_records or time.monotonic() - self.last_flush >= self.flush_interval:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        self.file.flush()
+        rows, self.pending = self.pending, 0
+        return rows
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def is_rsi_log(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+# (record count, record dtype) of an RSI log
+def read_rsi_log_header(path):
+    with open(path, 'rb') as f:
+        head = f.read(HEADER_SIZE)
+    if head[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an RSI log")
+    count = struct.unpack('<Q', head[COUNT_OFFSET:COUNT_OFFSET + 8])[0]
+    header = json.loads(head[16:].rstrip(b'\0'))
+    return count, np.dtype([tuple(field) for field in header["dtype"]])
+
+# Memory maps the records of an RSI log (no parsing, constant time). Works on a log that is still being
+# written; only flushed records are returned.
+def load_rsi_log(path):
+    count, dtype = read_rsi_log_header(path)
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+# Writes robot_data.csv with the same header and columns as receive_data()
+def rsi_log_to_csv(log_path, csv_path, chunk_records=100000):
+    records = load_rsi_log(log_path)
+    formats = []
+    for field in FIELDNAMES:
+        if field in INTEGER_FIELDS:
+            formats.append('%d')
+        elif field in ['WeldVolt', 'WeldAmps', 'MotorAmps', 'WFS']:
+            formats.append('%.10g')
+        else:
+            formats.append(None)
+    with open(csv_path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(FIELDNAMES)
+        for start in range(0, len(records), chunk_records):
+            chunk = records[start:start + chunk_records]
+            # repr() keeps floats like 1279.5 and 0.0 exactly as the controller sent them
+            columns = [[fmt % value for value in chunk[field].tolist()] if fmt else
+                       [repr(value) for value in chunk[field].tolist()]
+                       for field, fmt in zip(FIELDNAMES, formats)]
+            writer.writerows(zip(*columns))
+    return len(records)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python rsi_log.py <log.rsilog> <output.csv>")
+        sys.exit(1)
+    count = rsi_log_to_csv(sys.argv[1], sys.argv[2])
+    print(f"Wrote {count} rows to {sys.argv[2]}")
@@ -0,0 +1,179 @@
+# Fast parser for the KUKA RSI datagrams logged by 1_rsi_data_udp_txt_csv_tstamp_dsktop.py
+# At the 4 ms RSI cycle, building an ElementTree and doing ~35 find/attrib lookups per packet is a large
+# part of the logger's CPU time on the shop floor PCs. The message layout is fixed by the RSI config,
+# so parse_rsi() matches the received bytes against one precompiled regex for the exact layout we send
+# (RIst, RSol, Delay, WeldVolt, WeldAmps, MotorAmps, WFS, Tech C11-C110, Status i1-i4, ErrorNum, IPOC).
+# Only messages that do not match (malformed, incomplete or a changed RSI config) go through the
+# original ElementTree path. Both return the same row dict of strings, keyed by FIELDNAMES, ready for
+# csv.DictWriter.
+#
+# Microbenchmark (packets/second of the fast path against the ElementTree path):
+#   python rsi_parser.py [robot_data.csv]
+
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+FIELDNAMES = ['Timestamp', 'X_RIst', 'Y_RIst', 'Z_RIst', 'A_RIst', 'B_RIst', 'C_RIst',
+              'X_RSol', 'Y_RSol', 'Z_RSol', 'A_RSol', 'B_RSol', 'C_RSol',
+              'Delay', 'WeldVolt', 'WeldAmps', 'MotorAmps', 'WFS', 'IPOC', 'ErrorNum',
+              'C11', 'C12', 'C13', 'C14', 'C15', 'C16', 'C17', 'C18', 'C19', 'C110',
+              'i1', 'i2', 'i3', 'i4']
+
+POSE_KEYS = ['X', 'Y', 'Z', 'A', 'B', 'C']
+TEXT_FIELDS = ['WeldVolt', 'WeldAmps', 'MotorAmps', 'WFS', 'IPOC', 'ErrorNum']
+TECH_KEYS = ['C11', 'C12', 'C13', 'C14', 'C15', 'C16', 'C17', 'C18', 'C19', 'C110']
+STATUS_KEYS = ['i1', 'i2', 'i3', 'i4']
+
+class RSIParseError(ValueError):
+    pass
+
+def _attribute_pattern(tag, keys):
+    attributes = rb'\s+'.join(key.encode() + rb'="([^"]*)"' for key in keys)
+    return rb'<' + tag.encode() + rb'\s+' + attributes + rb'\s*/>'
+
+def _text_pattern(tag):
+    return rb'<' + tag.encode() + rb'>([^<]*)</' + tag.encode() + rb'>'
+
+# The exact layout sent by the controller, from <Rob> to </Rob> (surrounding whitespace allowed)
+_LAYOUT = re.compile(rb'\s*'.join([
+    rb'\s*<Rob[^>]*>',
+    _attribute_pattern('RIst', POSE_KEYS),
+    _attribute_pattern('RSol', POSE_KEYS),
+    _attribute_pattern('Delay', ['D']),
+    _text_pattern('WeldVolt'),
+    _text_pattern('WeldAmps'),
+    _text_pattern('MotorAmps'),
+    _text_pattern('WFS'),
+    _attribute_pattern('Tech', TECH_KEYS),
+    _attribute_pattern('Status', STATUS_KEYS),
+    _text_pattern('ErrorNum'),
+    _text_pattern('IPOC'),
+    rb'</Rob>\s*',
+]))
+_LAYOUT_FIELDS = ([key + '_RIst' for key in POSE_KEYS] + [key + '_RSol' for key in POSE_KEYS] +
+                  ['Delay', 'WeldVolt', 'WeldAmps', 'MotorAmps', 'WFS'] + TECH_KEYS + STATUS_KEYS +
+                  ['ErrorNum', 'IPOC'])
+
+def _parse_layout(data, timestamp):
+    # The whole datagram must be the layout; extra elements or trailing data go to ElementTree
+    match = _LAYOUT.fullmatch(data)
+    if match is None:
+        return None
+    row = dict(zip(_LAYOUT_FIELDS, map(bytes.decode, match.groups())))
+    row['Timestamp'] = timestamp
+    return row
+
+# The original ElementTree implementation, used for anything the layout regex does not match and as
+# the reference for the fast path
+def parse_rsi_et(data, timestamp):
+    data_str = data.decode('utf-8') if isinstance(data, bytes) else data
+    try:
+        root = ET.fromstring(data_str)
+
+        # Extract the relevant fields from the XML
+        RIst = root.find('RIst')
+        RSol = root.find('RSol')
+        Delay = root.find('Delay')
+        WeldVolt = root.find('WeldVolt').text
+        WeldAmps = root.find('WeldAmps').text
+        MotorAmps = root.find('MotorAmps').text
+        WFS = root.find('WFS').text
+        IPOC = root.find('IPOC').text
+        ErrorNum = root.find('ErrorNum').text
+
+        # Extract the Tech data (C11 to C110) and the Status data (i1 to i4)
+        Tech = root.find('Tech')
+        Status = root.find('Status')
+
+        # Prepare data for writing into the CSV file
+        row = {
+            'Timestamp': timestamp,
+            'X_RIst': RIst.attrib['X'],
+            'Y_RIst': RIst.attrib['Y'],
+            'Z_RIst': RIst.attrib['Z'],
+            'A_RIst': RIst.attrib['A'],
+            'B_RIst': RIst.attrib['B'],
+            'C_RIst': RIst.attrib['C'],
+            'X_RSol': RSol.attrib['X'],
+            'Y_RSol': RSol.attrib['Y'],
+            'Z_RSol': RSol.attrib['Z'],
+            'A_RSol': RSol.attrib['A'],
+            'B_RSol': RSol.attrib['B'],
+            'C_RSol': RSol.attrib['C'],
+            'Delay': Delay.attrib['D'],
+            'WeldVolt': WeldVolt,
+            'WeldAmps': WeldAmps,
+            'MotorAmps': MotorAmps,
+            'WFS': WFS,
+            'IPOC': IPOC,
+            'ErrorNum': ErrorNum,
+        }
+        for key in TECH_KEYS:
+            row[key] = Tech.attrib.get(key, '0.0')
+        for key in STATUS_KEYS:
+            row[key] = Status.attrib.get(key, '0')
+        return row
+    except (ET.ParseError, AttributeError, KeyError) as e:
+        raise RSIParseError(e)
+
+def parse_rsi(data, timestamp):
+    row = _parse_layout(data, timestamp)
+    if row is None:
+        row = parse_rsi_et(data, timestamp)
+    return row
+
+# Builds the datagram the controller would send for a row of robot_data.csv (values as strings)
+def format_rsi_message(row):
+    def pose(tag, suffix):
+        return f'<{tag} ' + ' '.join(f'{key}="{row[key + suffix]}"' for key in POSE_KEYS) + ' />'
+    tech = ' '.join(f'{key}="{row[key]}"' for key in TECH_KEYS)
+    status = ' '.join(f'{key}="{row[key]}"' for key in STATUS_KEYS)
+    message = ('<Rob Type="KUKA">' + pose('RIst', '_RIst') + pose('RSol', '_RSol') +
+               f'<Delay D="{row["Delay"]}" />' +
+               ''.join(f'<{tag}>{row[tag]}</{tag}>' for tag in ['WeldVolt', 'WeldAmps', 'MotorAmps', 'WFS']) +
+               f'<Tech {tech} />' + f'<Status {status} />' +
+               f'<ErrorNum>{row["ErrorNum"]}</ErrorNum>' + f'<IPOC>{row["IPOC"]}</IPOC>' + '</Rob>')
+    return message.encode('utf-8')
+
+def _sample_row(csv_path=None):
+    if csv_path:
+        import csv
+        with open(csv_path, 'r', newline='') as f:
+            return next(csv.DictReader(f))
+    row = {field: '0' for field in FIELDNAMES}
+    row.update({'X_RIst': '1279.5', 'Y_RIst': '192.4', 'Z_RIst': '977.3', 'A_RIst': '80.4', 'B_RIst': '60.3',
+                'C_RIst': '116.8', 'X_RSol': '1279.5', 'Y_RSol': '192.2', 'Z_RSol': '977.3', 'A_RSol': '80.5',
+                'B_RSol': '60.3', 'C_RSol': '116.8', 'WeldVolt': '14417', 'WeldAmps': '12320',
+                'MotorAmps': '46', 'WFS': '1475', 'IPOC': '1210441551'})
+    for key in TECH_KEYS:
+        row[key] = '0.0'
+    return row
+
+def _packets_per_second(parser, data, seconds=1.0):
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while True:
+        for _ in range(1000):
+            parser(data, 0)
+        count += 1000
+        now = time.perf_counter()
+        if now >= end:
+            return count / (now - start)
+
+if __name__ == "__main__":
+    message = format_rsi_message(_sample_row(sys.argv[1] if len(sys.argv) > 1 else None))
+    # A message the layout regex does not know takes the ElementTree fallback
+    unknown_layout = message.replace(b'<Delay', b'<Extra Z="1" /><Delay')
+
+    assert _parse_layout(message, 0) == parse_rsi_et(message, 0)
+    assert parse_rsi(unknown_layout, 0) == parse_rsi_et(unknown_layout, 0)
+
+    et_rate = _packets_per_second(parse_rsi_et, message)
+    print(f"ElementTree:       {et_rate:10.0f} packets/s")
+    for name, data in [("Fast parser", message), ("Fallback", unknown_layout)]:
+        rate = _packets_per_second(parse_rsi, data)
+        print(f"{name + ':':18} {rate:10.0f} packets/s ({rate / et_rate:.1f}x)")
+    print("The 4 ms RSI cycle needs 250 packets/s per robot")
@@ -0,0 +1,157 @@
+# RSI traffic simulator: replays robot_data.csv to a receiver over local UDP.
+# Every row (the columns receive_data() writes) is turned back into an RSI XML datagram and sent to
+# the receiver. Pacing follows the IPOC counter in real time, N times faster, or flat out, and packets
+# can be dropped or swapped on purpose. The report lists exactly which IPOCs were sent, so the
+# receiver's log can be diffed against it automatically.
+#
+# Examples:
+#   python rsi_simulator.py robot_data.csv --speed 1                      (real time)
+#   python rsi_simulator.py robot_data.csv --speed 10 --loss 0.01         (10x, 1% loss)
+#   python rsi_simulator.py robot_data.csv --speed 0 --repeat 100         (flat out)
+#   python rsi_simulator.py --compare expected.json robot_data.csv        (diff a receiver log)
+
+import argparse
+import csv
+import json
+import random
+import socket
+import sys
+import time
+
+import numpy as np
+
+from rsi_parser import format_rsi_message
+from rsi_log import is_rsi_log, load_rsi_log
+
+def read_rows(csv_path):
+    with open(csv_path, 'r', newline='') as f:
+        return list(csv.DictReader(f))
+
+# Yields (ipoc, datagram) for every row, repeat times; IPOCs keep increasing across repeats
+def generate_packets(rows, repeat=1):
+    ipocs = [int(row['IPOC']) for row in rows]
+    step = min((b - a for a, b in zip(ipocs, ipocs[1:]) if b > a), default=1)
+    period = ipocs[-1] - ipocs[0] + step
+    for loop in range(repeat):
+        offset = loop * period
+        for row, ipoc in zip(rows, ipocs):
+            if offset:
+                row = dict(row)
+                row['IPOC'] = str(ipoc + offset)
+            yield ipoc + offset, format_rsi_message(row)
+
+# Sends the packets to host:port. speed 1 paces by IPOC in real time (ipoc_unit_ms per IPOC count),
+# speed N is N times faster and speed 0 sends as fast as possible. loss drops a packet with the given
+# probability, reorder swaps a packet with the next one with the given probability.
+def simulate(rows, host='127.0.0.1', port=59152, speed=1.0, loss=0.0, reorder=0.0, repeat=1,
+             ipoc_unit_ms=1.0, seed=0):
+    rng = random.Random(seed)
+    sent_ipocs = []
+    dropped_ipocs = []
+    reordered = 0
+    held = None
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        start = time.perf_counter()
+        first_ipoc = None
+        for ipoc, datagram in generate_packets(rows, repeat):
+            if first_ipoc is None:
+                first_ipoc = ipoc
+            if speed > 0:
+                due = start + (ipoc - first_ipoc) * ipoc_unit_ms / 1000.0 / speed
+                wait = due - time.perf_counter()
+                if wait > 0.002:
+                    time.sleep(wait - 0.001)
+                while time.perf_counter() < due:
+                    pass
+
+            if loss and rng.random() < loss:
+                dropped_ipocs.append(ipoc)
+                continue
+            if held is None and reorder and rng.random() < reorder:
+                # Send this one after the next packet
+                held = (ipoc, datagram)
+                reordered += 1
+                continue
+
+            s.sendto(datagram, (host, port))
+            sent_ipocs.append(ipoc)
+            if held is not None:
+                s.sendto(held[1], (host, port))
+                sent_ipocs.append(held[0])
+                held = None
+        if held is not None:
+            s.sendto(held[1], (host, port))
+            sent_ipocs.append(held[0])
+        duration = time.perf_counter() - start
+
+    return {
+        "target": f"{host}:{port}",
+        "speed": speed,
+        "rows": len(rows),
+        "repeat": repeat,
+        "packets_generated": len(sent_ipocs) + len(dropped_ipocs),
+        "packets_sent": len(sent_ipocs),
+        "packets_dropped": len(dropped_ipocs),
+        "packets_reordered": reordered,
+        "duration_s": duration,
+        "send_rate_pps": len(sent_ipocs) / duration if duration > 0 else 0.0,
+        # The receiver should capture exactly these IPOCs (in any order)
+        "expected_ipocs": sorted(sent_ipocs),
+        "dropped_ipocs": dropped_ipocs,
+    }
+
+def load_captured_ipocs(log_path):
+    if is_rsi_log(log_path):
+        return np.asarray(load_rsi_log(log_path)['IPOC'], dtype=np.int64)
+    with open(log_path, 'r', newline='') as f:
+        return np.array([int(row['IPOC']) for row in csv.DictReader(f)], dtype=np.int64)
+
+# Diffs a receiver log (robot_data.csv or .rsilog) against a simulator report
+def compare_capture(report, log_path):
+    expected = np.asarray(report["expected_ipocs"], dtype=np.int64)
+    captured = load_captured_ipocs(log_path)
+    unique, counts = np.unique(captured, return_counts=True)
+    missing = np.setdiff1d(expected, unique)
+    unexpected = np.setdiff1d(unique, expected)
+    return {
+        "expected": int(expected.size),
+        "captured": int(captured.size),
+        "missing": int(missing.size),
+        "unexpected": int(unexpected.size),
+        "duplicates": int((counts > 1).sum()),
+        "out_of_order": int((np.diff(captured) < 0).sum()),
+        "missing_ipocs": missing[:100].tolist(),
+        "complete": bool(missing.size == 0 and unexpected.size == 0),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay robot_data.csv as RSI datagrams over UDP")
+    parser.add_argument("csv_path", nargs='?', default="robot_data.csv")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=59152)
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, N = N x faster, 0 = flat out")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability of dropping a packet")
+    parser.add_argument("--reorder", type=float, default=0.0, help="probability of swapping a packet with the next")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the file this many times")
+    parser.add_argument("--ipoc-unit-ms", type=float, default=1.0, help="milliseconds per IPOC count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", default="expected.json", help="where to write the simulator report")
+    parser.add_argument("--compare", metavar="REPORT", help="diff csv_path (a receiver log) against REPORT")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            report = json.load(f)
+        result = compare_capture(report, args.csv_path)
+        print(json.dumps(result, indent=4))
+        sys.exit(0 if result["complete"] else 1)
+
+    rows = read_rows(args.csv_path)
+    report = simulate(rows, args.host, args.port, args.speed, args.loss, args.reorder, args.repeat,
+                      args.ipoc_unit_ms, args.seed)
+    with open(args.report, 'w') as f:
+        json.dump(report, f)
+    print(f"Sent {report['packets_sent']} packets ({report['packets_dropped']} dropped on purpose, "
+          f"{report['packets_reordered']} reordered) in {report['duration_s']:.2f} s "
+          f"({report['send_rate_pps']:.0f} packets/s). Report written to {args.report}")
@@ -0,0 +1,229 @@
+# Incremental reader of the log the RSI receiver is still writing, for the live view of
+# 3_check_transformations.py. A tail keeps its position in robot_data.csv (byte offset, holding back a
+# partly written last line) or robot_data.rsilog (record index; the record count at offset 8 only covers
+# flushed records) and every poll() only reads what was appended since the last one. The new rows are
+# turned into transformation matrices relative to the first pose of the log in one batch (pose_batch.py),
+# the same poses 2_process_rsi_to_transformations.py produces.
+#
+# A poll never reads more than max_rows rows: when the viewer falls behind (or is started late in a long
+# run) it skips ahead to the newest rows, so the work per poll does not grow with the length of the run.
+#
+# Print the poses of a running log:
+#   python rsi_tail.py "robot_data.csv"
+
+import argparse
+import numpy as np
+import os
+import struct
+import time
+from datetime import datetime
+from pose_batch import euler_to_matrices, relative_transforms
+from rsi_log import COUNT_OFFSET, HEADER_SIZE, read_rsi_log_header
+
+POSE_COLUMNS = ['X_RIst', 'Y_RIst', 'Z_RIst', 'A_RIst', 'B_RIst', 'C_RIst']
+RSI_LOG_EXTENSION = '.rsilog'
+
+# Epoch milliseconds of Timestamp column values: epoch ms from the receiver, or local date times in the
+# older '%Y-%m-%d %H:%M:%S[.%f]' format
+def _epoch_ms(texts):
+    try:
+        return np.array(texts, dtype=np.float64).astype(np.int64)
+    except ValueError:
+        return np.array([int(datetime.fromisoformat(text).timestamp() * 1000) for text in texts], dtype=np.int64)
+
+# Shared by both log formats: turns the poses read by _read() into relative transformation matrices
+class _Tail:
+    def __init__(self, path, max_rows):
+        self.path = path
+        self.max_rows = max_rows
+        self.reference_T = None
+        self.rows_read = 0
+        self.skips = 0  # Times the tail skipped ahead to the newest rows
+
+    # (timestamps (N,) epoch ms, matrices (N,4,4)) of the rows appended since the last poll
+    def poll(self):
+        timestamps, poses = self._read()
+        if len(poses) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 4, 4))
+        if self.reference_T is None:
+            self.reference_T = euler_to_matrices(*self._first_pose(poses))
+        self.rows_read += len(poses)
+        return timestamps, relative_transforms(euler_to_matrices(*poses.T), self.reference_T)
+
+    def _restart(self):
+        self.reference_T = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CsvTail(_Tail):
+    def __init__(self, path, max_rows=5000, max_line_bytes=256):
+        super().__init__(path, max_rows)
+        self.max_bytes = max_rows * max_line_bytes
+        self.file = open(path, 'rb')
+        self.columns = None
+        self.offset = 0
+        self.partial = b''
+        self.resync = False  # After a skip, the bytes up to the next line break are the end of a row
+
+    # Reads the header line; the receiver may not have written it yet
+    def _read_header(self):
+        self.file.seek(0)
+        line = self.file.readline()
+        if not line.endswith(b'\n'):
+            return False
+        names = line.decode().strip().split(',')
+        missing = [column for column in ['Timestamp'] + POSE_COLUMNS if column not in names]
+        if missing:
+            raise ValueError(f"{self.path} is missing the columns {missing}")
+        self.columns = [names.index(column) for column in ['Timestamp'] + POSE_COLUMNS]
+        self.field_count = len(names)
+        self.offset = self.file.tell()
+        self.data_start = self.offset
+        return True
+
+    # Pose of the first data row of the file, the reference of the relative poses
+    def _first_pose(self, poses):
+        self.file.seek(self.data_start)
+        _, first = self._parse([self.file.readline().decode(errors='replace')])
+        return first[0] if len(first) else poses[0]
+
+    def _restart(self):
+        super()._restart()
+        self.columns = None
+        self.offset = 0
+        self.partial = b''
+        self.resync = False
+
+    # (timestamps, poses (N,6)) of complete CSV lines; lines that do not parse are dropped
+    def _parse(self, lines):
+        lines = [line for line in lines if line.count(',') == self.field_count - 1]
+        if not lines:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 6))
+        try:
+            table = np.loadtxt(lines, delimiter=',', usecols=self.columns, dtype=str, ndmin=2)
+            return _epoch_ms(table[:, 0]), table[:, 1:].astype(np.float64)
+        except ValueError:
+            rows = [self._parse([line]) for line in lines] if len(lines) > 1 else []
+            rows = [row for row in rows if len(row[1])]
+            if not rows:
+                return np.zeros(0, dtype=np.int64), np.zeros((0, 6))
+            return np.concatenate([row[0] for row in rows]), np.concatenate([row[1] for row in rows])
+
+    def _read(self):
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.offset:
+            self._restart()  # The receiver started a new file
+        if self.columns is None and not self._read_header():
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 6))
+
+        if size - self.offset > self.max_bytes:
+            self.skips += 1
+            self.offset = size - self.max_bytes
+            self.partial = b''
+            self.resync = True
+        self.file.seek(self.offset)
+        data = self.file.read(size - self.offset)
+        self.offset += len(data)
+
+        data = self.partial + data
+        end = data.rfind(b'\n') + 1
+        self.partial = data[end:]
+        data = data[:end]
+        if self.resync and end:
+            data = data[data.find(b'\n') + 1:]
+            self.resync = False
+        timestamps, poses = self._parse(data.decode(errors='replace').splitlines())
+        return timestamps[-self.max_rows:], poses[-self.max_rows:]
+
+    def close(self):
+        self.file.close()
+
+class RsiLogTail(_Tail):
+    def __init__(self, path, max_rows=5000):
+        super().__init__(path, max_rows)
+        self.file = open(path, 'rb')
+        _, self.dtype = read_rsi_log_header(path)
+        self.position = 0
+
+    def _count(self):
+        self.file.seek(COUNT_OFFSET)
+        return struct.unpack('<Q', self.file.read(8))[0]
+
+    def _records(self, start, count):
+        self.file.seek(HEADER_SIZE + start * self.dtype.itemsize)
+        data = self.file.read(count * self.dtype.itemsize)
+        return np.frombuffer(data, dtype=self.dtype, count=len(data) // self.dtype.itemsize)
+
+    def _first_pose(self, poses):
+        first = self._records(0, 1)
+        return np.column_stack([first[column] for column in POSE_COLUMNS])[0]
+
+    def _restart(self):
+        super()._restart()
+        self.position = 0
+
+    def _read(self):
+        count = self._count()
+        if count < self.position:
+            self._restart()  # The receiver started a new log
+        if count - self.position > self.max_rows:
+            self.skips += 1
+            self.position = count - self.max_rows
+        records = self._records(self.position, count - self.position)
+        self.position += len(records)
+        poses = np.column_stack([records[column] for column in POSE_COLUMNS]) if len(records) else np.zeros((0, 6))
+        return records['Timestamp'].astype(np.int64), poses
+
+    def close(self):
+        self.file.close()
+
+# CSV or binary tail by file extension (the binary log may still be empty when the tail is opened)
+def open_tail(path, max_rows=5000):
+    if path.lower().endswith(RSI_LOG_EXTENSION):
+        return RsiLogTail(path, max_rows)
+    return CsvTail(path, max_rows)
+
+# Fixed size history of the newest positions. Rows are appended to a buffer twice the capacity and moved
+# back to its start when it fills up, so latest() is always a contiguous view and appends cost O(1)
+# amortized.
+class PoseHistory:
+    def __init__(self, capacity=5000):
+        self.capacity = capacity
+        self.buffer = np.zeros((2 * capacity, 3))
+        self.end = 0
+
+    def append(self, positions):
+        positions = positions[-self.capacity:]
+        if self.end + len(positions) > len(self.buffer):
+            keep = min(self.end, self.capacity - len(positions))
+            self.buffer[:keep] = self.buffer[self.end - keep:self.end]
+            self.end = keep
+        self.buffer[self.end:self.end + len(positions)] = positions
+        self.end += len(positions)
+
+    def latest(self):
+        return self.buffer[max(self.end - self.capacity, 0):self.end]
+
+    def __len__(self):
+        return min(self.end, self.capacity)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the relative poses appended to a running RSI log")
+    parser.add_argument("log_path", help="robot_data.csv or robot_data.rsilog")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between polls")
+    args = parser.parse_args()
+
+    with open_tail(args.log_path) as tail:
+        try:
+            while True:
+                timestamps, matrices = tail.poll()
+                if len(timestamps):
+                    position = np.round(matrices[-1, :3, 3], 3)
+                    print(f"{tail.rows_read} poses, latest {timestamps[-1]}: XYZ {position}")
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,215 @@
+# Opt-in profiling of the post-processing stages.
+# The stages mark their steps with named spans (load, parse, convert, register, project, fuse, write):
+#   with span('fuse'):
+#       grid.integrate(points, colors)
+#   for chunk in profile_iter('parse', read_pose_chunks(...)):   (times every next() of the iterator)
+#   @profiled('process_csv')                                      (times every call of a function)
+# Spans nest, so every span is identified by its stack of names. While no profiler is enabled, span()
+# returns a shared do-nothing context manager, profile_iter() returns the iterator itself and profiled
+# functions only check one global, so the instrumentation can stay in the stages.
+#
+# An enabled StageProfiler sums the time and the number of calls per stack and, with trace_memory,
+# the peak memory traced by tracemalloc (numpy buffers included) while the span was open. Spans only
+# count in the profiling process, not in the worker processes of the PLY builder; with 1 worker the
+# projection runs in-process and its steps show up too.
+#
+# Results:
+#   <output>.folded   one "stage;step;substep microseconds" line per stack (self time), the input of
+#                     flamegraph.pl, speedscope or inferno
+#   <output>.txt      summary table: calls, total and self time, share of the run, peak memory
+#
+# Profile a stage script (it prompts as usual):
+#   python stage_profiler.py --output profile 4_process_frames_to_ply.py
+#   python stage_profiler.py --no-memory 2_process_rsi_to_transformations.py
+
+import argparse
+import os
+import runpy
+import sys
+import time
+import tracemalloc
+from functools import wraps
+
+# The enabled profiler, None while profiling is off
+_profiler = None
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._exit()
+        return False
+
+class StageProfiler:
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stats = {}  # stack (tuple of names) -> [calls, seconds, peak traced bytes]
+        self.open = []  # [stack, start time, peak traced bytes so far] of every open span
+        self.started_tracing = False
+
+    def start(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        while self.open:
+            self._exit()
+        self.seconds = time.perf_counter() - self.start_time
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def span(self, name):
+        return _Span(self, name)
+
+    # The tracemalloc peak is reset when a span opens, so each span's peak is the highest of its own
+    # reading and those of its children; the parent keeps what it saw before the child opened
+    def _enter(self, name):
+        peak = 0
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            if self.open:
+                self.open[-1][2] = max(self.open[-1][2], peak)
+            tracemalloc.reset_peak()
+            peak = tracemalloc.get_traced_memory()[0]
+        stack = (self.open[-1][0] if self.open else ()) + (name,)
+        self.open.append([stack, time.perf_counter(), peak])
+
+    def _exit(self):
+        stack, start, peak = self.open.pop()
+        seconds = time.perf_counter() - start
+        if self.trace_memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if self.open:
+                self.open[-1][2] = max(self.open[-1][2], peak)
+            tracemalloc.reset_peak()
+        entry = self.stats.get(stack)
+        if entry is None:
+            self.stats[stack] = [1, seconds, peak]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], peak)
+
+    # Time of every stack minus the time of its direct children
+    def self_times(self):
+        self_seconds = {stack: entry[1] for stack, entry in self.stats.items()}
+        for stack, entry in self.stats.items():
+            if len(stack) > 1 and stack[:-1] in self_seconds:
+                self_seconds[stack[:-1]] -= entry[1]
+        return {stack: max(seconds, 0.0) for stack, seconds in self_seconds.items()}
+
+    # Folded stacks with self time in microseconds, the flame graph input format
+    def folded(self):
+        return [f"{';'.join(stack)} {int(round(seconds * 1e6))}"
+                for stack, seconds in sorted(self.self_times().items()) if seconds > 0]
+
+    def summary(self):
+        self_seconds = self.self_times()
+        total = getattr(self, 'seconds', None) or sum(entry[1] for stack, entry in self.stats.items() if len(stack) == 1)
+        lines = [f"{'span':40} {'calls':>8} {'total s':>10} {'self s':>10} {'share':>7}" +
+                 (f" {'peak MB':>9}" if self.trace_memory else "")]
+        for stack, (calls, seconds, peak) in sorted(self.stats.items()):
+            name = '  ' * (len(stack) - 1) + stack[-1]
+            line = (f"{name:40} {calls:8d} {seconds:10.3f} {self_seconds[stack]:10.3f} "
+                    f"{100 * seconds / max(total, 1e-9):6.1f}%")
+            if self.trace_memory:
+                line += f" {peak / 1024 ** 2:9.1f}"
+            lines.append(line)
+        lines.append(f"Profiled {total:.3f} s")
+        return '\n'.join(lines)
+
+    # Writes <output_prefix>.folded and <output_prefix>.txt, returns their paths
+    def save(self, output_prefix):
+        folded_path = output_prefix + '.folded'
+        summary_path = output_prefix + '.txt'
+        with open(folded_path, 'w') as f:
+            f.write('\n'.join(self.folded()) + '\n')
+        with open(summary_path, 'w') as f:
+            f.write(self.summary() + '\n')
+        return folded_path, summary_path
+
+def enable(trace_memory=True):
+    global _profiler
+    _profiler = StageProfiler(trace_memory)
+    _profiler.start()
+    return _profiler
+
+# Stops profiling and returns the profiler with the results
+def disable():
+    global _profiler
+    profiler = _profiler
+    _profiler = None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+def span(name):
+    if _profiler is None:
+        return _NULL_SPAN
+    return _profiler.span(name)
+
+# Yields the items of iterable, timing the production of each one as span name
+def profile_iter(name, iterable):
+    if _profiler is None:
+        return iterable
+    return _profiled_iter(name, iterable)
+
+def _profiled_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with span(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def profiled(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with _profiler.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a post-processing script with stage profiling")
+    parser.add_argument("--output", default="profile", help="prefix of the .folded and .txt results")
+    parser.add_argument("--no-memory", action="store_true", help="only time the spans, no tracemalloc")
+    parser.add_argument("script")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    sys.argv = [args.script] + args.script_args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    # The stages import this file as stage_profiler, a different module object than __main__
+    import stage_profiler
+    stage_profiler.enable(not args.no_memory)
+    try:
+        with stage_profiler.span(os.path.splitext(os.path.basename(args.script))[0]):
+            runpy.run_path(args.script, run_name='__main__')
+    finally:
+        profiler = stage_profiler.disable()
+        print(profiler.summary())
+        print(f"Saved {', '.join(profiler.save(args.output))}")
@@ -0,0 +1,40 @@
+# Tests for ply_stream.py (python -m pytest)
+
+import numpy as np
+from ply_stream import VERTEX_DTYPE, SplitPlyWriter, to_vertices
+
+def read_ply(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    header_end = data.index(b'end_header\n') + len(b'end_header\n')
+    count = int(data[:header_end].split(b'element vertex ')[1].split(b'\n')[0])
+    return count, np.frombuffer(data[header_end:], dtype=VERTEX_DTYPE)
+
+# More tiles than open files allowed: tiles are suspended and reopened, every file ends up complete
+def test_more_tiles_than_open_files(tmp_path):
+    rng = np.random.default_rng(0)
+    tile_size = 10.0
+    max_open_files = 8
+    writer = SplitPlyWriter(str(tmp_path / "cloud.ply"), tile_size=tile_size, max_open_files=max_open_files)
+    batches = []
+    for _ in range(5):
+        points = rng.uniform(0, 60, size=(3000, 3))  # 6x6x6 = 216 tiles
+        colors = rng.uniform(0, 1, size=(3000, 3))
+        writer.write(points, colors)
+        batches.append((points, colors))
+        assert sum(w.file is not None for w in writer.writers.values()) <= max_open_files
+    paths = writer.close()
+    assert len(paths) > max_open_files
+
+    points = np.concatenate([batch[0] for batch in batches])
+    colors = np.concatenate([batch[1] for batch in batches])
+    tiles = np.floor(points / tile_size).astype(np.int64)
+    total = 0
+    for path in paths:
+        tile = tuple(int(v) for v in path[:-len('.ply')].split('_tile_')[1].split('_'))
+        expected = to_vertices(*(array[(tiles == tile).all(axis=1)] for array in (points, colors)))
+        count, vertices = read_ply(path)
+        assert count == len(vertices) == len(expected)
+        assert np.array_equal(vertices, expected)  # Input order kept across suspends
+        total += count
+    assert total == writer.count == len(points)
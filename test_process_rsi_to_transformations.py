@@ -0,0 +1,44 @@
+# Tests for 2_process_rsi_to_transformations.py (python -m pytest)
+
+import importlib
+import os
+import pytest
+from trajectory_store import load_trajectory
+
+stage = importlib.import_module('2_process_rsi_to_transformations')
+
+def write_log(path, rows, bad_row=None):
+    with open(path, 'w') as f:
+        f.write(','.join(stage.REQUIRED_COLUMNS) + '\n')
+        for index in range(rows):
+            timestamp = 'not a time' if index == bad_row else 1727186715000 + 4 * index
+            f.write(f"{timestamp},{1279.5 + index * 0.01},192.4,977.3,80.4,60.3,116.8\n")
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    read_pose_chunks = stage.read_pose_chunks
+    monkeypatch.setattr(stage, 'read_pose_chunks',
+                        lambda path, timestamp_format: read_pose_chunks(path, timestamp_format, chunk_rows=100))
+
+def test_complete_run(tmp_path, small_chunks):
+    log_path = str(tmp_path / "robot_data.csv")
+    output_path = str(tmp_path / "transformations.traj")
+    write_log(log_path, 450)
+    assert stage.process_csv(log_path, output_path) == 450
+    assert len(load_trajectory(output_path)[0]) == 450
+    assert sorted(os.listdir(tmp_path)) == ["robot_data.csv", "transformations.traj"]
+
+# A chunk that fails after others were written leaves no partial trajectory, and an earlier output stays
+@pytest.mark.parametrize("extension", [".traj", ".csv"])
+def test_failed_run_leaves_no_partial_output(tmp_path, small_chunks, extension):
+    log_path = str(tmp_path / "robot_data.csv")
+    output_path = str(tmp_path / f"transformations{extension}")
+    write_log(log_path, 450, bad_row=320)
+    assert stage.process_csv(log_path, output_path) is None
+    assert sorted(os.listdir(tmp_path)) == ["robot_data.csv"]
+
+    with open(output_path, 'w') as f:
+        f.write("previous run")
+    assert stage.process_csv(log_path, output_path) is None
+    with open(output_path) as f:
+        assert f.read() == "previous run"
@@ -0,0 +1,114 @@
+# Tests for rsi_async_receiver.py (python -m pytest)
+
+import time
+from rsi_async_receiver import IpocTracker, RobotSink
+from rsi_log import RSILogWriter, read_rsi_log_header
+from rsi_parser import FIELDNAMES
+
+def track(ipocs, step=None):
+    tracker = IpocTracker(step)
+    for ipoc in ipocs:
+        tracker.update(ipoc)
+    return tracker.stats()
+
+# Reordered packets fill the gaps they opened: nothing was missed
+def test_reordered_packets_are_not_missed():
+    ipocs = list(range(0, 4000, 4))
+    for index in range(10, len(ipocs) - 3, 20):
+        ipocs[index], ipocs[index + 2] = ipocs[index + 2], ipocs[index]
+    stats = track(ipocs)
+    assert stats["ipoc_step"] == 4
+    assert stats["missed_cycles"] == 0
+    assert stats["gaps"] == 0
+    assert stats["out_of_order"] == 100  # Two late packets per swap
+    assert stats["duplicates"] == 0
+
+# A hole only partly filled by late packets stays a gap with the cycles that never arrived
+def test_partly_filled_gap():
+    ipocs = [0, 4, 8, 20, 12, 24, 28]  # 12 late, 16 lost
+    stats = track(ipocs)
+    assert stats["missed_cycles"] == 1
+    assert stats["gaps"] == 1
+    assert stats["out_of_order"] == 1
+
+def test_late_duplicate_is_counted_once():
+    stats = track([0, 4, 8, 20, 12, 12, 24])
+    assert stats["missed_cycles"] == 1
+    assert stats["out_of_order"] == 1
+    assert stats["duplicates"] == 1
+
+# A gap right at the start does not fix the step: it follows the most common advance, and the early gap
+# is recounted with it
+def test_step_inferred_from_most_common_advance():
+    ipocs = [0, 12] + list(range(16, 400, 4))
+    stats = track(ipocs)
+    assert stats["ipoc_step"] == 4
+    assert stats["missed_cycles"] == 2
+    assert stats["gaps"] == 1
+
+def test_fixed_step():
+    stats = track([0, 8, 16, 24], step=4)
+    assert stats["ipoc_step"] == 4
+    assert stats["missed_cycles"] == 3
+    assert stats["gaps"] == 3
+
+class BatchLog:
+    def __init__(self, batch):
+        self.batch = batch
+        self.rows = []
+        self.written = 0
+
+    def append(self, row):
+        self.rows.append(row)
+        if len(self.rows) - self.written >= self.batch:
+            return self.flush()
+        return 0
+
+    def flush(self):
+        rows = len(self.rows) - self.written
+        self.written = len(self.rows)
+        return rows
+
+    def close(self):
+        pass
+
+# Latency is only measured once the log has flushed the rows, not when they are buffered
+def test_latency_measured_after_flush():
+    log = BatchLog(batch=10)
+    sink = RobotSink("robot", log)
+    for index in range(25):
+        sink.submit({"IPOC": str(index)}, 0.0)
+    sink.close()
+    assert sink.rows_written == 25
+    assert len(sink.latencies) == 25
+    assert log.written == 25
+
+# Rows buffered by the binary log reach the file once no packet arrived for idle_flush seconds
+def test_idle_flush(tmp_path):
+    path = str(tmp_path / "robot_data.rsilog")
+    sink = RobotSink("robot", RSILogWriter(path, grow_records=100, flush_interval=60.0), idle_flush=0.05)
+    for index in range(3):
+        sink.submit(dict(zip(FIELDNAMES, [str(index)] * len(FIELDNAMES))), time.perf_counter())
+    deadline = time.monotonic() + 5.0
+    while read_rsi_log_header(path)[0] < 3 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert read_rsi_log_header(path)[0] == 3
+    assert sink.rows_written == 3
+    sink.close()
+
+class FailingLog(BatchLog):
+    def append(self, row):
+        if row["IPOC"] == "3":
+            raise ValueError("unwritable row")
+        return super().append(row)
+
+# An exception from the log is counted and the writer thread keeps going with the next rows
+def test_write_error_keeps_thread_running():
+    log = FailingLog(batch=1)
+    sink = RobotSink("robot", log)
+    for index in range(6):
+        sink.submit({"IPOC": str(index)}, 0.0)
+    sink.close()
+    assert sink.write_errors == 1
+    assert [row["IPOC"] for row in log.rows] == ["0", "1", "2", "4", "5"]
+    assert sink.rows_written == 5
@@ -0,0 +1,34 @@
+# Tests for rsi_log.py (python -m pytest)
+
+from rsi_log import RSILogWriter, load_rsi_log
+from rsi_parser import FIELDNAMES
+
+def row(index, **values):
+    row = dict(zip(FIELDNAMES, [str(index)] * len(FIELDNAMES)))
+    row.update(values)
+    return row
+
+# A row with an unreadable value is stored with 0 in its place and counted, the rest of the batch is intact
+def test_bad_rows_are_counted(tmp_path):
+    path = str(tmp_path / "robot_data.rsilog")
+    with RSILogWriter(path, grow_records=100) as log:
+        log.append(row(1))
+        log.append(row(2, X_RIst='1.5.2'))
+        log.append(row(3, WFS='nan?', Delay='x'))
+        log.append(row(4))
+    assert log.bad_rows == 2
+    records = load_rsi_log(path)
+    assert records['IPOC'].tolist() == [1, 2, 3, 4]
+    assert records['X_RIst'].tolist() == [1.0, 0.0, 3.0, 4.0]
+    assert records['Delay'].tolist() == [1, 2, 0, 4]
+
+# A value with a comma splits into an extra field; the row is cut to the record length and counted, the
+# batch is still written
+def test_row_with_comma_is_kept(tmp_path):
+    path = str(tmp_path / "robot_data.rsilog")
+    with RSILogWriter(path, grow_records=100) as log:
+        log.append(row(1))
+        log.append(row(2, WeldVolt='14,5'))
+        log.append(row(3))
+    assert log.bad_rows == 1
+    assert load_rsi_log(path)['Timestamp'].tolist() == [1, 2, 3]
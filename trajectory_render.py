@@ -0,0 +1,156 @@
+# Offscreen rendering of the trajectory animation of 3_check_transformations.py.
+# TrajectoryRenderer draws the same view as the live viewer (initial vector, transformed vector, time and
+# XYZABC text) on a plain Agg canvas, so no display is needed. export_animation() splits the frames into
+# chunks rendered by a process pool and writes them in order to a GIF (Pillow) or MP4/AVI (OpenCV).
+#
+# Export without the GUI:
+#   python trajectory_render.py transformations.traj animation.mp4 --stride 10 --fps 30
+
+import argparse
+import cv2
+import numpy as np
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+from scipy.spatial.transform import Rotation as R
+from trajectory_store import load_trajectory
+
+SCALING_FACTOR = 500.0  # Increase this value to scale up the vector magnitude
+
+# XYZABC values of every transformation matrix in one batch
+def calculate_xyzabc(matrices):
+    translations = matrices[:, :3, 3]
+    euler_angles = R.from_matrix(matrices[:, :3, :3]).as_euler('xyz', degrees=True)
+    return np.hstack((translations, euler_angles))
+
+# Line segments of 3D arrows from starts (N,3) along vectors (N,3), drawn like ax.quiver: a shaft and
+# two head lines. Returns (N,3,2,3).
+def arrow_segments(starts, vectors, head_ratio=0.3, head_angle=15.0):
+    tips = starts + vectors
+    # Head lines: the reversed vector, shortened and turned by +-head_angle about an axis perpendicular to it
+    axes = np.cross(vectors, [0.0, 0.0, 1.0])
+    flat = np.linalg.norm(axes, axis=1) < 1e-9
+    axes[flat] = np.cross(vectors[flat], [0.0, 1.0, 0.0])
+    axes /= np.maximum(np.linalg.norm(axes, axis=1, keepdims=True), 1e-12)
+    back = -vectors * head_ratio
+    angle = np.radians(head_angle)
+    side = np.cross(axes, back) * np.sin(angle)
+    head_1 = tips + back * np.cos(angle) + side
+    head_2 = tips + back * np.cos(angle) - side
+    return np.stack([np.stack([starts, tips], axis=1),
+                     np.stack([tips, head_1], axis=1),
+                     np.stack([tips, head_2], axis=1)], axis=1)
+
+def frame_text(timestamp, frame, frame_count, xyzabc_formatted):
+    timestamp_str = datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d %H:%M:%S')
+    return f'Time: {timestamp_str} (EPOCH: {timestamp})\nFrame: {frame + 1}/{frame_count}\nXYZABC: {xyzabc_formatted}'
+
+class TrajectoryRenderer:
+    def __init__(self, trajectory_path, width=640, height=480, dpi=100):
+        self.timestamps, self.matrices, _ = load_trajectory(trajectory_path)
+        self.initial_vector = np.array([1, 0, 0]) * SCALING_FACTOR
+
+        self.figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot(111, projection='3d')
+        v = self.initial_vector
+        self.ax.quiver(0, 0, 0, v[0], v[1], v[2], color='blue', label='Initial Vector')
+        self.transformed_arrow = self.ax.quiver(0, 0, 0, 1, 0, 0, color='red', label='Transformed Vector')
+        self.text_time = self.figure.text(0.02, 0.9, '', fontsize=10)
+
+        max_extent = np.max(np.abs(self.matrices[:, :3, 3])) if len(self.matrices) else 1.0
+        self.ax.set_xlim(-max_extent * 1.5, max_extent * 1.5)
+        self.ax.set_ylim(-max_extent * 1.5, max_extent * 1.5)
+        self.ax.set_zlim(-max_extent * 1.5, max_extent * 1.5)
+
+    # RGB images (h, w, 3) of the given frame numbers
+    def render(self, frames):
+        frames = np.asarray(frames)
+        matrices = np.asarray(self.matrices[frames])
+        xyzabc_values = calculate_xyzabc(matrices)
+        arrows = arrow_segments(xyzabc_values[:, :3], matrices[:, :3, :3] @ self.initial_vector)
+        images = []
+        for i, frame in enumerate(frames):
+            self.transformed_arrow.set_segments(arrows[i])
+            self.text_time.set_text(frame_text(int(self.timestamps[frame]), int(frame), len(self.timestamps),
+                                               np.round(xyzabc_values[i], 3)))
+            self.canvas.draw()
+            images.append(np.asarray(self.canvas.buffer_rgba())[:, :, :3].copy())
+        return images
+
+# Set in each worker by init_worker()
+_renderer = None
+
+def init_worker(trajectory_path, width, height):
+    global _renderer
+    _renderer = TrajectoryRenderer(trajectory_path, width, height)
+
+def render_chunk(frames):
+    return _renderer.render(frames)
+
+# Yields the RGB image of every frame, in order. At most two chunks per worker are in flight.
+def render_frames(trajectory_path, frames, width=640, height=480, workers=None, chunk_size=16):
+    chunks = [frames[i:i + chunk_size] for i in range(0, len(frames), chunk_size)]
+    if workers == 1:
+        init_worker(trajectory_path, width, height)
+        for chunk in chunks:
+            yield from render_chunk(chunk)
+        return
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(trajectory_path, width, height)) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(render_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+# Renders every stride-th frame of [start, stop) to output_path (.gif, .mp4 or .avi). Returns the number
+# of frames written.
+def export_animation(trajectory_path, output_path, stride=1, start=0, stop=None, width=640, height=480, fps=30,
+                     workers=None, chunk_size=16):
+    frame_count = len(load_trajectory(trajectory_path).timestamps)
+    frames = np.arange(frame_count)[start:stop:stride]
+    if len(frames) == 0:
+        return 0
+    images = render_frames(trajectory_path, frames, width, height, workers, chunk_size)
+
+    if output_path.lower().endswith('.gif'):
+        first = Image.fromarray(next(images))
+        first.save(output_path, save_all=True, append_images=(Image.fromarray(image) for image in images),
+                   duration=int(round(1000 / fps)), loop=0)
+        return len(frames)
+
+    fourcc = cv2.VideoWriter_fourcc(*('XVID' if output_path.lower().endswith('.avi') else 'mp4v'))
+    video = None
+    for image in images:
+        if video is None:
+            video = cv2.VideoWriter(output_path, fourcc, fps, (image.shape[1], image.shape[0]))
+        video.write(np.ascontiguousarray(image[:, :, ::-1]))  # OpenCV wants BGR
+    video.release()
+    return len(frames)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the trajectory animation to GIF/MP4 without a display")
+    parser.add_argument("trajectory_path")
+    parser.add_argument("output_path", nargs='?', default="animation.gif")
+    parser.add_argument("--stride", type=int, default=1, help="render every Nth pose")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--stop", type=int, default=None)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    args = parser.parse_args()
+
+    count = export_animation(args.trajectory_path, args.output_path, args.stride, args.start, args.stop,
+                             args.width, args.height, args.fps, args.workers, args.chunk_size)
+    print(f"Wrote {count} frames to {args.output_path}")
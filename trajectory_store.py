@@ -0,0 +1,166 @@
+# Binary trajectory store shared by stages 2, 3 and 4.
+# 2_process_rsi_to_transformations.py writes the relative transformation of every robot pose here
+# instead of 17 text columns per pose; 3_check_transformations.py and 4_process_frames_to_ply.py map the
+# file as numpy arrays without parsing anything, so loading takes constant time.
+#
+# File layout:
+#   [0:8]      magic b'RSITRAJ\n'
+#   [8:16]     pose count (uint64), written when the writer is closed
+#   [16:4096]  JSON header (reference pose, units, record layout), zero padded
+#   [4096:]    records of TRAJECTORY_DTYPE (EPOCH timestamp in ms + 4x4 float64 matrix), sorted by timestamp
+#
+# load_trajectory() also reads the old transformation CSVs, so every stage accepts both.
+#
+# Convert a transformation CSV:
+#   python trajectory_store.py transformations.csv transformations.traj
+
+import numpy as np
+import pandas as pd
+import json
+import struct
+import sys
+from collections import namedtuple
+
+MAGIC = b'RSITRAJ\n'
+HEADER_SIZE = 4096
+COUNT_OFFSET = 8
+TRAJECTORY_EXTENSION = '.traj'
+
+TRAJECTORY_DTYPE = np.dtype([('timestamp', '<i8'), ('matrix', '<f8', (4, 4))])
+
+# The header row DataFrame.to_csv() writes in front of the transformation CSVs
+CSV_HEADER = [str(column) for column in range(17)]
+
+DEFAULT_UNITS = {"timestamp": "ms since epoch", "translation": "mm"}
+
+# timestamps (N,) int64 in ascending order, matrices (N,4,4) float64, header dict
+Trajectory = namedtuple('Trajectory', ['timestamps', 'matrices', 'header'])
+
+class TrajectoryWriter:
+    # reference_T is the pose every matrix is relative to (the first robot pose); reference_pose its
+    # X, Y, Z, A, B, C values
+    def __init__(self, path, reference_T=None, reference_pose=None, units=None, source=None):
+        self.path = path
+        self.count = 0
+        self.last_timestamp = None
+        self.is_sorted = True
+
+        header = {"version": 1,
+                  "dtype": [list(field) for field in TRAJECTORY_DTYPE.descr],
+                  "units": units or DEFAULT_UNITS,
+                  "reference_T": None if reference_T is None else np.asarray(reference_T, dtype=float).tolist(),
+                  "reference_pose": None if reference_pose is None else [float(v) for v in reference_pose],
+                  "source": source}
+        header = json.dumps(header).encode()
+        if len(header) > HEADER_SIZE - 16:
+            raise ValueError("Trajectory header does not fit")
+        self.file = open(path, 'w+b')
+        self.file.write(MAGIC + struct.pack('<Q', 0) + header.ljust(HEADER_SIZE - 16, b'\0'))
+
+    # Appends a block of poses: timestamps (N,), matrices (N,4,4)
+    def append(self, timestamps, matrices):
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(timestamps) == 0:
+            return
+        records = np.empty(len(timestamps), dtype=TRAJECTORY_DTYPE)
+        records['timestamp'] = timestamps
+        records['matrix'] = matrices
+        self.file.write(records.tobytes())
+
+        if self.is_sorted and (np.any(np.diff(timestamps) < 0) or
+                               (self.last_timestamp is not None and timestamps[0] < self.last_timestamp)):
+            self.is_sorted = False
+        self.last_timestamp = timestamps[-1] if self.last_timestamp is None else max(self.last_timestamp, timestamps[-1])
+        self.count += len(timestamps)
+
+    def close(self):
+        if not self.is_sorted:
+            # Packets can arrive out of order; readers rely on ascending timestamps for lookups
+            self.file.flush()
+            records = np.memmap(self.file, dtype=TRAJECTORY_DTYPE, mode='r+', offset=HEADER_SIZE, shape=(self.count,))
+            records[:] = records[np.argsort(records['timestamp'], kind='stable')]
+            records.flush()
+            del records
+        self.file.seek(COUNT_OFFSET)
+        self.file.write(struct.pack('<Q', self.count))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Same append/close interface as TrajectoryWriter for the transformation CSV text format
+class TrajectoryCsvWriter:
+    def __init__(self, path, **header):
+        self.path = path
+        self.count = 0
+
+    def append(self, timestamps, matrices):
+        # Timestamp followed by the flattened transformation matrix, one row per pose
+        rows = pd.DataFrame(np.asarray(matrices).reshape(len(timestamps), 16), columns=range(1, 17))
+        rows.insert(0, 0, np.asarray(timestamps, dtype=np.int64))
+        rows.to_csv(self.path, index=False, mode='w' if self.count == 0 else 'a', header=self.count == 0)
+        self.count += len(timestamps)
+
+    def close(self):
+        if self.count == 0:
+            pd.DataFrame(columns=range(17)).to_csv(self.path, index=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# .traj paths get the binary store, anything else the transformation CSV
+def open_trajectory_writer(path, **header):
+    if path.lower().endswith(TRAJECTORY_EXTENSION):
+        return TrajectoryWriter(path, **header)
+    return TrajectoryCsvWriter(path, **header)
+
+def save_trajectory(path, timestamps, matrices, **header):
+    with TrajectoryWriter(path, **header) as writer:
+        writer.append(timestamps, matrices)
+
+def is_trajectory(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def _load_binary(path):
+    with open(path, 'rb') as f:
+        head = f.read(HEADER_SIZE)
+    count = struct.unpack('<Q', head[COUNT_OFFSET:COUNT_OFFSET + 8])[0]
+    header = json.loads(head[16:].rstrip(b'\0'))
+    if count == 0:
+        return Trajectory(np.zeros(0, dtype=np.int64), np.zeros((0, 4, 4)), header)
+    records = np.memmap(path, dtype=TRAJECTORY_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+    return Trajectory(records['timestamp'], records['matrix'], header)
+
+# Transformation CSV from older runs: timestamp + 16 matrix values per row, with or without the
+# "0,1,...,16" header row
+def _load_csv(path):
+    with open(path, 'r') as f:
+        first_line = f.readline().strip()
+    skip = 1 if first_line.split(',') == CSV_HEADER else 0
+    dtypes = {0: np.int64, **{column: np.float64 for column in range(1, 17)}}
+    data = pd.read_csv(path, header=None, skiprows=skip, dtype=dtypes, float_precision='round_trip')
+    timestamps = data[0].to_numpy()
+    matrices = data.iloc[:, 1:17].to_numpy().reshape(-1, 4, 4)
+    order = np.argsort(timestamps, kind='stable')
+    return Trajectory(timestamps[order], matrices[order], {"version": 1, "units": DEFAULT_UNITS, "source": path})
+
+# Binary trajectories are memory mapped, anything else is read as a transformation CSV
+def load_trajectory(path):
+    if is_trajectory(path):
+        return _load_binary(path)
+    return _load_csv(path)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python trajectory_store.py <transformations.csv> <output.traj>")
+        sys.exit(1)
+    trajectory = load_trajectory(sys.argv[1])
+    save_trajectory(sys.argv[2], trajectory.timestamps, trajectory.matrices, source=sys.argv[1])
+    print(f"Wrote {len(trajectory.timestamps)} poses to {sys.argv[2]}")
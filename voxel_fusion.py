@@ -0,0 +1,92 @@
+# Incremental point cloud fusion for the PLY builder.
+# Instead of keeping every point of every frame until the end, VoxelGrid hashes each point into a voxel
+# of voxel_size and only keeps per-voxel sums of position and color plus a point count. Every frame is
+# reduced to its occupied voxels as it arrives; reduced frames are merged into the grid in batches, so
+# memory grows with the size of the scanned scene (number of occupied voxels), not the number of frames.
+# The fused cloud has one point per voxel at the mean position and mean color of the points inside it.
+
+import numpy as np
+
+# Voxel coordinates are packed into one int64 key, 21 bits per axis
+_AXIS_BITS = 21
+_AXIS_OFFSET = 1 << (_AXIS_BITS - 1)
+_AXIS_MASK = (1 << _AXIS_BITS) - 1
+
+# keys (N,) may repeat; returns the unique keys with summed values (N,6) and counts
+def _reduce(keys, sums, counts):
+    unique, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    reduced = np.empty((len(unique), sums.shape[1]))
+    for column in range(sums.shape[1]):
+        reduced[:, column] = np.bincount(inverse, weights=sums[:, column], minlength=len(unique))
+    return unique, reduced, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+
+class VoxelGrid:
+    # merge_points: reduced voxels buffered before they are merged into the grid. The buffer may also
+    # grow to a quarter of the grid, so merging (which copies the whole grid) stays amortized on big scenes.
+    def __init__(self, voxel_size, merge_points=2000000):
+        if voxel_size <= 0:
+            raise ValueError("voxel_size must be positive")
+        self.voxel_size = float(voxel_size)
+        self.merge_points = merge_points
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, 6))
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.pending = []
+        self.pending_points = 0
+        self.points_integrated = 0
+
+    def _keys(self, points):
+        voxels = np.floor(points / self.voxel_size).astype(np.int64) + _AXIS_OFFSET
+        if voxels.size and (voxels.min() < 0 or voxels.max() > _AXIS_MASK):
+            raise ValueError(f"Points are too far from the origin for voxel size {self.voxel_size}")
+        return (voxels[:, 0] << (2 * _AXIS_BITS)) | (voxels[:, 1] << _AXIS_BITS) | voxels[:, 2]
+
+    # points (N,3), colors (N,3) in [0, 1]
+    def integrate(self, points, colors):
+        points = np.asarray(points, dtype=np.float64)
+        if len(points) == 0:
+            return
+        colors = np.asarray(colors, dtype=np.float64)
+        if len(colors) != len(points):
+            colors = np.zeros_like(points)
+        keys = self._keys(points)
+        reduced = _reduce(keys, np.hstack([points, colors]), np.ones(len(keys)))
+        self.pending.append(reduced)
+        self.pending_points += len(reduced[0])
+        self.points_integrated += len(points)
+        if self.pending_points >= max(self.merge_points, len(self.keys) // 4):
+            self._merge()
+
+    # The grid keys stay sorted: voxels already in the grid are added in place, new ones are inserted
+    def _merge(self):
+        if not self.pending:
+            return
+        keys, sums, counts = _reduce(np.concatenate([keys for keys, _, _ in self.pending]),
+                                     np.concatenate([sums for _, sums, _ in self.pending]),
+                                     np.concatenate([counts for _, _, counts in self.pending]))
+        self.pending = []
+        self.pending_points = 0
+
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        self.sums[positions[found]] += sums[found]
+        self.counts[positions[found]] += counts[found]
+
+        new = ~found
+        self.keys = np.insert(self.keys, positions[new], keys[new])
+        self.sums = np.insert(self.sums, positions[new], sums[new], axis=0)
+        self.counts = np.insert(self.counts, positions[new], counts[new])
+
+    def __len__(self):
+        self._merge()
+        return len(self.keys)
+
+    # (points (V,3), colors (V,3), counts (V,)) of the voxels holding at least min_count points
+    def to_arrays(self, min_count=1):
+        self._merge()
+        keep = self.counts >= min_count
+        counts = self.counts[keep]
+        means = self.sums[keep] / counts[:, None]
+        return means[:, :3], means[:, 3:], counts